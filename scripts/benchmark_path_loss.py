@@ -0,0 +1,255 @@
+"""
+Benchmark for the seismic path loss models.
+
+Written by Edward Oughton
+
+Runs offline on synthetic inputs. Every branch of ETSI TR 138.901 is
+timed through the scalar functions (calls per second) and the batch
+functions (calls and links per second), along with `uma_nlos_optional`
+and `generate_log_normal_dist_value`.
+
+"""
+import time
+
+import numpy as np
+
+from seismic.path_loss import (path_loss_calculator, etsi_tr_138_901,
+    uma_nlos_optional, generate_log_normal_dist_value,
+    path_loss_calculator_batch, etsi_tr_138_901_batch, uma_nlos_optional_batch,
+    PropagationModel, ETSI_TR_138_901_BRANCHES, _etsi_tr_138_901_jit)
+
+
+FREQUENCY = 0.8
+BUILDING_HEIGHT = 20
+STREET_WIDTH = 20
+UE_HEIGHT = 1.5
+ABOVE_ROOF = 0
+SEED_VALUE = 42
+ITERATIONS = 1
+
+# (branch, ant_type, environment, ant_height, type_of_sight, min and max
+# distance in meters). At 0.8 GHz the breakpoint distance is ~754 m for
+# RMa, and ~152 m and ~45 m for UMa and UMi.
+BRANCH_CASES = [
+    ('rma_los_1', 'macro', 'rural', 30, 'los', 20, 700),
+    ('rma_los_2', 'macro', 'rural', 30, 'los', 800, 9900),
+    ('rma_nlos', 'macro', 'suburban', 30, 'nlos', 20, 5000),
+    ('rma_los_beyond_10km', 'macro', 'rural', 30, 'los', 10001, 20000),
+    ('uma_los_1', 'macro', 'urban', 30, 'los', 20, 150),
+    ('uma_los_2', 'macro', 'urban', 30, 'los', 160, 4900),
+    ('uma_nlos', 'macro', 'urban', 30, 'nlos', 20, 4900),
+    ('uma_nlos_beyond_5km', 'macro', 'urban', 30, 'nlos', 5001, 10000),
+    ('umi_los_1', 'micro', 'urban', 10, 'los', 20, 44),
+    ('umi_los_2', 'micro', 'urban', 10, 'los', 50, 4900),
+    ('umi_nlos', 'micro', 'urban', 10, 'nlos', 20, 4900),
+]
+
+
+def synthetic_links(quantity, max_distance, los_breakpoint_m, seed=42):
+    """
+    Generate synthetic link distances and type of sight masks.
+
+    Parameters
+    ----------
+    quantity : int
+        Number of links.
+    max_distance : float
+        Largest distance in meters (m).
+    los_breakpoint_m : float
+        Links shorter than this are Line of Sight.
+
+    Returns
+    -------
+    distances : numpy.ndarray
+        Link distances in meters (m).
+    los : numpy.ndarray
+        Boolean Line of Sight mask.
+
+    """
+    rng = np.random.default_rng(seed)
+
+    distances = rng.uniform(20, max_distance, quantity)
+    los = distances < los_breakpoint_m
+
+    return distances, los
+
+
+def time_call(function, repeats=3):
+    """
+    Return the best wall time in seconds over a number of repeats.
+
+    """
+    best = np.inf
+
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def scalar_rate(function, argument_list, repeats=3):
+    """
+    Calls per second of a scalar function over a list of argument tuples.
+
+    """
+    def run():
+        for arguments in argument_list:
+            function(*arguments)
+
+    return len(argument_list) / time_call(run, repeats)
+
+
+def batch_rate(function, links, repeats=3):
+    """
+    Calls and links per second of a batch function evaluating `links`
+    elements per call.
+
+    """
+    elapsed = time_call(function, repeats)
+
+    return 1 / elapsed, links / elapsed
+
+
+def report(name, entry_point, calls_per_second, links_per_second=None):
+    """
+    Print one line of results.
+
+    """
+    line = '{:<22} {:<28} {:>12.0f} calls/s'.format(name, entry_point,
+        calls_per_second)
+    if links_per_second is not None:
+        line += ' {:>14.0f} links/s'.format(links_per_second)
+
+    print(line)
+
+
+def benchmark_branches(scalar_calls=1000, batch_links=10**5):
+    """
+    Time every branch of ETSI TR 138.901 through the scalar and batch
+    entry points.
+
+    """
+    for branch, ant_type, environment, ant_height, type_of_sight, \
+        min_distance, max_distance in BRANCH_CASES:
+
+        rng = np.random.default_rng(SEED_VALUE)
+        distances = rng.uniform(min_distance, max_distance, batch_links)
+        indoor = rng.random(batch_links) < 0.5
+
+        constants = (ant_height, ant_type, BUILDING_HEIGHT, STREET_WIDTH,
+            environment, type_of_sight, UE_HEIGHT, ABOVE_ROOF)
+
+        #check the case reaches the branch it is named after
+        _, codes = etsi_tr_138_901_batch(FREQUENCY, distances[:100],
+            *constants, False, SEED_VALUE, ITERATIONS)
+        branches = sorted(set(ETSI_TR_138_901_BRANCHES[c] for c in codes))
+
+        arguments = [
+            (FREQUENCY, distance) + constants +
+            (bool(is_indoor), SEED_VALUE, ITERATIONS)
+            for distance, is_indoor in zip(distances[:scalar_calls],
+                indoor[:scalar_calls])
+        ]
+
+        name = '{} ({})'.format(branch, ', '.join(branches))
+        print(name)
+
+        report('', 'path_loss_calculator',
+            scalar_rate(path_loss_calculator, arguments))
+        report('', 'etsi_tr_138_901', scalar_rate(etsi_tr_138_901, arguments))
+
+        report('', 'path_loss_calculator_batch', *batch_rate(
+            lambda: path_loss_calculator_batch(FREQUENCY, distances,
+                *constants, indoor, SEED_VALUE, ITERATIONS), batch_links))
+        report('', 'etsi_tr_138_901_batch', *batch_rate(
+            lambda: etsi_tr_138_901_batch(FREQUENCY, distances,
+                *constants, indoor, SEED_VALUE, ITERATIONS), batch_links))
+
+        propagation_model = PropagationModel(FREQUENCY, ant_type,
+            environment, BUILDING_HEIGHT, STREET_WIDTH, ant_height,
+            UE_HEIGHT, SEED_VALUE, ITERATIONS, None, ABOVE_ROOF)
+        report('', 'PropagationModel.evaluate', *batch_rate(
+            lambda: propagation_model.evaluate(distances, type_of_sight,
+                indoor), batch_links))
+
+
+def benchmark_uma_nlos_optional(scalar_calls=1000, batch_links=10**5):
+    """
+    Time `uma_nlos_optional` and its batch implementation.
+
+    """
+    distances = np.random.default_rng(SEED_VALUE).uniform(20, 20000,
+        batch_links)
+
+    arguments = [
+        (FREQUENCY, distance, 30, UE_HEIGHT, SEED_VALUE, ITERATIONS)
+        for distance in distances[:scalar_calls]
+    ]
+
+    print('uma_nlos_optional')
+    report('', 'uma_nlos_optional', scalar_rate(uma_nlos_optional, arguments))
+    report('', 'uma_nlos_optional_batch', *batch_rate(
+        lambda: uma_nlos_optional_batch(FREQUENCY, distances, 30, UE_HEIGHT,
+            SEED_VALUE, ITERATIONS), batch_links))
+
+
+def benchmark_log_normal(scalar_calls=1000, draws=(1, 50)):
+    """
+    Time `generate_log_normal_dist_value`, seeded and unseeded.
+
+    """
+    print('generate_log_normal_dist_value')
+
+    for iterations in draws:
+        for seed_value in (SEED_VALUE, None):
+            arguments = [(FREQUENCY, 1, 8, iterations, seed_value)] * scalar_calls
+            report('', 'draws={} seed={}'.format(iterations, seed_value),
+                scalar_rate(generate_log_normal_dist_value, arguments))
+
+
+def benchmark_jit_kernel(quantity=10**6):
+    """
+    Compare the compiled kernel against the NumPy implementation.
+
+    """
+    if _etsi_tr_138_901_jit is None:
+        print('numba is not installed: skipping the compiled kernel')
+        return
+
+    settings = [
+        ('macro', 'rural', 30, 20000),
+        ('macro', 'urban', 30, 5000),
+        ('micro', 'urban', 10, 5000),
+    ]
+
+    for ant_type, environment, ant_height, max_distance in settings:
+
+        distances, los = synthetic_links(quantity, max_distance, 500)
+
+        numpy_model = PropagationModel(0.8, ant_type, environment, 20, 20,
+            ant_height, 1.5, 42, 1, jit=False)
+        jit_model = PropagationModel(0.8, ant_type, environment, 20, 20,
+            ant_height, 1.5, 42, 1, jit=True)
+
+        #compile before timing
+        jit_model.etsi_tr_138_901(distances[:10], los[:10])
+
+        expected, _ = numpy_model.etsi_tr_138_901(distances, los)
+        result, _ = jit_model.etsi_tr_138_901(distances, los)
+
+        numpy_time = time_call(lambda: numpy_model.etsi_tr_138_901(distances, los))
+        jit_time = time_call(lambda: jit_model.etsi_tr_138_901(distances, los))
+
+        print('{} {}: numpy {:.3f}s, numba {:.3f}s, speedup {:.1f}x, mismatches {}'.format(
+            ant_type, environment, numpy_time, jit_time, numpy_time / jit_time,
+            int((expected != result).sum())))
+
+
+if __name__ == '__main__':
+
+    benchmark_branches()
+    benchmark_uma_nlos_optional()
+    benchmark_log_normal()
+    benchmark_jit_kernel()
@@ -6,6 +6,29 @@ Written by Ed Oughton.
 December 2020
 
 """
+from seismic.modulation_and_coding import ModulationAndCodingTable
+
+
+# Generation MIMO CQI Index	Modulation	Coding rate
+# Spectral efficiency (bps/Hz) SINR estimate (dB)
+MODULATION_AND_CODING = ModulationAndCodingTable([
+    ('4G', '1x1', 1, 'QPSK', 78, 0.1523, -6.7),
+    ('4G', '1x1', 2, 'QPSK', 120, 0.2344, -4.7),
+    ('4G', '1x1', 3, 'QPSK', 193, 0.377, -2.3),
+    ('4G', '1x1', 4, 'QPSK', 308, 0.6016, 0.2),
+    ('4G', '1x1', 5, 'QPSK', 449, 0.877, 2.4),
+    ('4G', '1x1', 6, 'QPSK', 602, 1.1758, 4.3),
+    ('4G', '1x1', 7, '16QAM', 378, 1.4766, 5.9),
+    ('4G', '1x1', 8, '16QAM', 490, 1.9141, 8.1),
+    ('4G', '1x1', 9, '16QAM', 616, 2.4063, 10.3),
+    ('4G', '1x1', 10, '64QAM', 466, 2.7305, 11.7),
+    ('4G', '1x1', 11, '64QAM', 567, 3.3223, 14.1),
+    ('4G', '1x1', 12, '64QAM', 666, 3.9023, 16.3),
+    ('4G', '1x1', 13, '64QAM', 772, 4.5234, 18.7),
+    ('4G', '1x1', 14, '64QAM', 873, 5.1152, 21),
+    ('4G', '1x1', 15, '64QAM', 948, 5.5547, 22.7),
+])
+
 
 def elec_consumption(data_consumption_GB, strategy):
     """
@@ -69,24 +92,6 @@ def estimate_link_budget(data_consumption_Mbps_km, settlement_size):
     power_w : int
         The quantity of electricity required.
 
-    lut = [
-        ['sinr': -6.7,'cqi': '1', 'QAM': 'QPSK', 'code_rate': 0.0762, 'spectral_efficiency':	0.1523],
-        ['sinr': -4.7,'cqi': '2', 'QAM': 'QPSK', 'code_rate': 0.1172, 'spectral_efficiency':	0.2344],
-        ['sinr': -2.3,'cqi': '3', 'QAM': 'QPSK', 'code_rate': 0.1885, 'spectral_efficiency':	0.377],
-        ['sinr': 0.2,'cqi': '4', 'QAM': 'QPSK', 'code_rate': 308, 'spectral_efficiency': 0.6016],
-        ['sinr': 2.4,'cqi': '5', 'QAM': 'QPSK', 'code_rate': 449, 'spectral_efficiency': 0.877],
-        ['sinr': 4.3,'cqi': '6', 'QAM': 'QPSK', 'code_rate': 602, 'spectral_efficiency': 1.1758],
-        ['sinr': 5.9,'cqi': '7', 'QAM': '16QAM', 'code_rate': 378, 'spectral_efficiency': 1.4766],
-        ['sinr': 8.1,'cqi': '8', 'QAM': '16QAM', 'code_rate': 490, 'spectral_efficiency': 1.9141],
-        ['sinr': 10.3,'cqi': '9', 'QAM': '16QAM', 'code_rate': 616, 'spectral_efficiency': 2.4063],
-        ['sinr': 11.7,'cqi': '10', 'QAM': '64QAM', 'code_rate': 466, 'spectral_efficiency': 2.7305],
-        ['sinr': 14.1,'cqi': '11', 'QAM': '64QAM', 'code_rate': 567, 'spectral_efficiency': 3.3223],
-        ['sinr': 16.3,'cqi': '12', 'QAM': '64QAM', 'code_rate': 666, 'spectral_efficiency': 3.9023],
-        ['sinr': 18.7,'cqi': '13', 'QAM': '64QAM', 'code_rate': 772, 'spectral_efficiency': 4.5234],
-        ['sinr': 21,'cqi': '14', 'QAM': '64QAM', 'code_rate': 873, 'spectral_efficiency': 5.1152],
-        ['sinr': 22.7,'cqi': '15', 'QAM': '64QAM', 'code_rate': 948, 'spectral_efficiency': 5.5547],
-    ]
-
     """
     bandwidth_MHz = 20
     bandwidth_Hz = bandwidth_MHz * 1e6
@@ -96,36 +101,7 @@ def estimate_link_budget(data_consumption_Mbps_km, settlement_size):
     #rearranged capacity = spectral_efficiency_bps * bandwidth_Hz / area_km2
     spectral_efficiency_bps = data_consumption_bps_km / bandwidth_Hz * settlement_size
 
-    if spectral_efficiency_bps < 0.1523:
-        sinr = -6.7
-    elif spectral_efficiency_bps < 0.2344:
-        sinr = -4.7
-    elif spectral_efficiency_bps < 0.377:
-        sinr = -2.3
-    elif spectral_efficiency_bps < 0.6016:
-        sinr = 0.2
-    elif spectral_efficiency_bps < 0.877:
-        sinr = 2.4
-    elif spectral_efficiency_bps < 1.1758:
-        sinr = 4.3
-    elif spectral_efficiency_bps < 1.4766:
-        sinr = 5.9
-    elif spectral_efficiency_bps < 1.9141:
-        sinr = 8.1
-    elif spectral_efficiency_bps < 2.4063:
-        sinr = 10.3
-    elif spectral_efficiency_bps < 2.7305:
-        sinr = 11.7
-    elif spectral_efficiency_bps < 3.3223:
-        sinr = 14.1
-    elif spectral_efficiency_bps < 3.9023:
-        sinr = 16.3
-    elif spectral_efficiency_bps < 4.5234:
-        sinr = 18.7
-    elif spectral_efficiency_bps <  5.1152:
-        sinr = 21
-    else:
-        sinr = 22.3
+    sinr = MODULATION_AND_CODING.required_sinr(spectral_efficiency_bps)
 
     #calculate received power
     interference = 5 #dB
@@ -20,11 +20,13 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 import random
-from itertools import tee
 
 from collections import OrderedDict
 
 from seismic.generate_hex import produce_sites_and_site_areas
+from seismic.path_loss import build_propagation_model
+from seismic.modulation_and_coding import get_modulation_and_coding_table
+from seismic.quantile_sketch import QuantileSketch
 # from seismic.system_simulator import SimulationManager
 from params import (PARAMETERS, SPECTRUM_PORTFOLIO, ANT_TYPES, MODULATION_AND_CODING_LUT,
     CONFIDENCE_INTERVALS, SITE_RADII, ENVIRONMENTS
@@ -199,89 +201,32 @@ def calculate_user_demand(params):
     return demand
 
 
-def free_space(frequency, distance, ant_height, ue_height,
-    seed_value, iterations):
-    """
-    Implements the Free Space path loss model.
-    Parameters
-    ----------
-    frequency : int
-        Carrier band (f) required in MHz.
-    distance : int
-        Distance (d) between transmitter and receiver (km).
-    ant_height : int
-        Transmitter antenna height (h1) (m, above ground).
-    ue_height : int
-        Receiver antenna height (h2) (m, above ground).
-    sigma : int
-        Variation in path loss (dB) which is 2.5dB for free space.
-    Returns
-    -------
-    path_loss : float
-        Path loss in decibels (dB)
-    """
-    #model requires frequency in MHz rather than GHz.
-    frequency = frequency*1000
-    #model requires distance in kilometers rather than meters.
-    distance = distance/1000
-
-    random_variation = generate_log_normal_dist_value(
-        frequency, 1, 2.5, iterations, None
-    )
-    # print(random_variation)
-    path_loss = (
-        32.4 + 10*np.log10((((ant_height - ue_height)/1000)**2 + \
-        distance**2)) + (20*np.log10(frequency) + random_variation)
-    )
-
-    return round(path_loss, 2)
-
-
-def generate_log_normal_dist_value(frequency, mu, sigma, draws, seed_value):
-    """
-    Generates random values using a lognormal distribution,
-    given a specific mean (mu) and standard deviation (sigma).
-    https://stackoverflow.com/questions/51609299/python-np-lognormal-gives-infinite-
-    results-for-big-average-and-st-dev
-    The parameters mu and sigma in np.random.lognormal are not the mean
-    and STD of the lognormal distribution. They are the mean and STD
-    of the underlying normal distribution.
-    Parameters
-    ----------
-    mu : int
-        Mean of the desired distribution.
-    sigma : int
-        Standard deviation of the desired distribution.
-    draws : int
-        Number of required values.
-    Returns
-    -------
-    random_variation : float
-        Mean of the random variation over the specified itations.
-    """
-    if seed_value == None:
-        pass
-    else:
-        frequency_seed_value = seed_value * frequency * 100
-
-        np.random.seed(int(str(frequency_seed_value)[:2]))
-
-    normal_std = np.sqrt(np.log10(1 + (sigma/mu)**2))
-    normal_mean = np.log10(mu) - normal_std**2 / 2
-
-    hs = np.random.lognormal(normal_mean, normal_std, draws)
-
-    return round(np.mean(hs),2)
-
-
 def calc_power(transmitter, receivers, interfering_tx, params,
     modulation_and_coding_lut):
     """
     Calculate the optimal (minimum) power level.
 
+    The path loss model is chosen with params['propagation_model'] and
+    defaults to free space. The 90th percentile capacity is estimated
+    with a `QuantileSketch`, so it is approximate (rank error under 1%),
+    and repeatable for a given params['sketch_seed'].
+
     """
     results = []
 
+    propagation_model = build_propagation_model(
+        params.get('propagation_model', 'free_space'),
+        params['frequency'],
+        params['ant_type'],
+        params['environment'],
+        params['building_height'],
+        params['street_width'],
+        30,
+        1.5,
+        None,
+        1,
+    )
+
     tx_coords = shape(transmitter['geometry'].to_crs('epsg:3857')[0])
     receivers['geometry'] = receivers['geometry'].to_crs('epsg:3857')
 
@@ -293,7 +238,8 @@ def calc_power(transmitter, receivers, interfering_tx, params,
 
         print('Working on power: {} watts'.format(tx_power))
 
-        interim = []
+        #seeded, so the approximate 90th percentile is repeatable
+        interim = QuantileSketch(seed=params.get('sketch_seed', 42))
 
         #calculate Equivalent Isotropically Radiated Power (EIRP)
         eirp = (
@@ -307,13 +253,11 @@ def calc_power(transmitter, receivers, interfering_tx, params,
             for i in range(0, 100):
 
                 capacity_mbps = link_capacity(receiver, tx_coords, eirp, params,
-                    modulation_and_coding_lut)
+                    modulation_and_coding_lut, propagation_model)
 
-                interim.append(capacity_mbps)
+                interim.update(capacity_mbps)
 
-        capacity = np.percentile(
-                interim, 90
-            )
+        capacity = interim.percentile(90)
 
         capacity_km2 = capacity / params['site_area_km2']
 
@@ -338,14 +282,15 @@ def calc_power(transmitter, receivers, interfering_tx, params,
     return min(results, key=lambda x:x['tx_power'])
 
 
-def link_capacity(receiver, tx_coords, eirp, params, modulation_and_coding_lut):
+def link_capacity(receiver, tx_coords, eirp, params, modulation_and_coding_lut,
+    propagation_model):
     """
     Estimate the radio link capacity.
 
     """
     distance = tx_coords.distance(shape(receiver['geometry']))
 
-    path_loss = free_space(0.8, distance, 30, 1.5, 1, 1)
+    path_loss = estimate_path_loss(propagation_model, distance, params)
 
     received_power = (eirp -
         path_loss -
@@ -354,7 +299,8 @@ def link_capacity(receiver, tx_coords, eirp, params, modulation_and_coding_lut):
         params['rx_losses']
     )
 
-    interference = estimate_interference(receiver, interfering_tx, eirp, params)
+    interference = estimate_interference(receiver, interfering_tx, eirp, params,
+        propagation_model)
 
     k = 1.38e-23
     t = 290
@@ -380,7 +326,23 @@ def link_capacity(receiver, tx_coords, eirp, params, modulation_and_coding_lut):
     return capacity_mbps
 
 
-def estimate_interference(receiver, interfering_tx, eirp, params):
+def estimate_path_loss(propagation_model, distance, params):
+    """
+    Path loss in decibels (dB) for a single link.
+
+    """
+    if distance < params['los_breakpoint_m']:
+        type_of_sight = 'los'
+    else:
+        type_of_sight = 'nlos'
+
+    path_loss, _ = propagation_model.evaluate(distance, type_of_sight)
+
+    return float(path_loss)
+
+
+def estimate_interference(receiver, interfering_tx, eirp, params,
+    propagation_model):
     """
     Calculate interference from other sites.
 
@@ -396,6 +358,8 @@ def estimate_interference(receiver, interfering_tx, eirp, params):
         Interfering transmitters.
     params : dict
         Simulation parameters.
+    propagation_model : BasePropagationModel
+        Path loss model, see `seismic.path_loss.PROPAGATION_MODELS`.
 
     Returns
     -------
@@ -417,7 +381,7 @@ def estimate_interference(receiver, interfering_tx, eirp, params):
 
         distance = tx_coords['geometry'].distance(shape(receiver['geometry']))
 
-        path_loss = free_space(params['frequency'], distance, 30, 1.5, 1, 1)
+        path_loss = estimate_path_loss(propagation_model, distance, params)
 
         received_interference = (eirp -
             path_loss -
@@ -461,43 +425,10 @@ def estimate_spectral_efficiency(sinr, generation,
         Efficiency of information transfer in Bps/Hz
 
     """
-    lookup = modulation_and_coding_lut[generation]
-
-    spectral_efficiency = 0.1
-    for lower, upper in pairwise(lookup):
-        if lower[0] and upper[0] == generation:
-
-            lower_sinr = lower[6]
-            upper_sinr = upper[6]
-
-            if sinr >= lower_sinr and sinr < upper_sinr:
-                spectral_efficiency = lower[5]
-                return spectral_efficiency
-
-            highest_value = lookup[-1]
-
-            if sinr >= highest_value[6]:
-                spectral_efficiency = highest_value[5]
-                return spectral_efficiency
-
-            lowest_value = lookup[0]
-
-            if sinr < lowest_value[5]:
-                spectral_efficiency = 0
-                return spectral_efficiency
-
-
-def pairwise(iterable):
-    """
-    Return iterable of 2-tuples in a sliding window.
-    >>> list(pairwise([1,2,3,4]))
-    [(1,2),(2,3),(3,4)]
-
-    """
-    a, b = tee(iterable)
-    next(b, None)
+    table = get_modulation_and_coding_table(
+        modulation_and_coding_lut[generation], legacy=True)
 
-    return zip(a, b)
+    return table.spectral_efficiency(sinr)
 
 
 if __name__ == '__main__':
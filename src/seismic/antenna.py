@@ -0,0 +1,185 @@
+"""
+Sectorised antenna patterns.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+Horizontal antenna pattern of a site split into equally spaced sectors,
+following 3GPP TR 38.901 (Table 7.3-1):
+
+    A(phi) = -min(12 * (phi / phi_3dB)**2, A_m)
+
+where phi is the angle between a link and the boresight of the sector
+facing it. The pattern is relative to boresight, so the transmitter gain
+remains the boresight gain and links off boresight lose up to A_m dB.
+Every value is computed as an array expression over link azimuths.
+
+"""
+import numpy as np
+
+
+class SectorAntennaPattern(object):
+    """
+
+    Horizontal pattern of a sectorised site.
+
+    Parameters
+    ----------
+    sectors : int
+        Number of sectors, with boresights spaced 360 / sectors degrees
+        apart.
+    beamwidth : float
+        Half power (3 dB) beamwidth of each sector in degrees.
+    front_to_back : float
+        Largest attenuation A_m in dB.
+    azimuth : float
+        Boresight of the first sector in degrees clockwise from north.
+
+    A single sector is treated as omnidirectional.
+
+    """
+    __slots__ = ('sectors', 'beamwidth', 'front_to_back', 'azimuth')
+
+    def __init__(self, sectors=3, beamwidth=65, front_to_back=30, azimuth=0):
+
+        if sectors < 1:
+            raise ValueError('Number of sectors must be at least 1')
+
+        self.sectors = int(sectors)
+        self.beamwidth = float(beamwidth)
+        self.front_to_back = float(front_to_back)
+        self.azimuth = float(azimuth)
+
+
+    def __repr__(self):
+        return ('SectorAntennaPattern(sectors={}, beamwidth={}, '
+            'front_to_back={}, azimuth={})'.format(self.sectors,
+            self.beamwidth, self.front_to_back, self.azimuth))
+
+
+    def __eq__(self, other):
+        return (isinstance(other, SectorAntennaPattern) and
+            self._key() == other._key())
+
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+    def _key(self):
+        return (self.sectors, self.beamwidth, self.front_to_back, self.azimuth)
+
+
+    @classmethod
+    def from_parameters(cls, simulation_parameters):
+        """
+        Pattern with simulation_parameters['sectorization'] sectors, and
+        the optional 'sector_beamwidth', 'sector_front_to_back' and
+        'sector_azimuth' values.
+
+        """
+        return cls(
+            simulation_parameters['sectorization'],
+            simulation_parameters.get('sector_beamwidth', 65),
+            simulation_parameters.get('sector_front_to_back', 30),
+            simulation_parameters.get('sector_azimuth', 0),
+        )
+
+
+    @property
+    def spacing(self):
+        """
+        Angle between neighbouring boresights in degrees.
+
+        """
+        return 360 / self.sectors
+
+
+    def offset(self, azimuth):
+        """
+        Angle in degrees between each azimuth and the nearest boresight,
+        from -spacing / 2 to spacing / 2.
+
+        """
+        half = self.spacing / 2
+
+        return np.mod(np.asarray(azimuth) - self.azimuth + half,
+            self.spacing) - half
+
+
+    def sector(self, azimuth):
+        """
+        Index of the sector facing each azimuth.
+
+        """
+        half = self.spacing / 2
+
+        sector = np.floor_divide(np.mod(np.asarray(azimuth) - self.azimuth +
+            half, 360), self.spacing).astype(np.int64)
+
+        return np.minimum(sector, self.sectors - 1)
+
+
+    def gain(self, azimuth):
+        """
+
+        Gain of the sector facing each azimuth, relative to boresight.
+
+        Parameters
+        ----------
+        azimuth : array_like
+            Direction from the site to each receiver in degrees clockwise
+            from north.
+
+        Returns
+        -------
+        gain : numpy.ndarray
+            Gain in dB, from -front_to_back to 0.
+
+        """
+        if self.sectors == 1:
+            return np.zeros(np.shape(azimuth))
+
+        offset = self.offset(azimuth)
+
+        return -np.minimum(12 * (offset / self.beamwidth)**2,
+            self.front_to_back)
+
+
+def get_antenna_pattern(simulation_parameters):
+    """
+
+    Antenna pattern selected by simulation_parameters['antenna_pattern'].
+
+    Parameters
+    ----------
+    simulation_parameters : dict
+        A dict containing all simulation parameters necessary.
+        'antenna_pattern' may be None (omnidirectional, the default), a
+        `SectorAntennaPattern`, or 'sectorised' for the pattern given by
+        `SectorAntennaPattern.from_parameters`.
+
+    Returns
+    -------
+    pattern : SectorAntennaPattern
+        The pattern, or None for omnidirectional sites.
+
+    """
+    pattern = simulation_parameters.get('antenna_pattern')
+
+    if pattern is None or isinstance(pattern, SectorAntennaPattern):
+        return pattern
+
+    if pattern == 'sectorised':
+        return SectorAntennaPattern.from_parameters(simulation_parameters)
+
+    raise ValueError('Did not recognise antenna_pattern: {}'.format(pattern))
+
+
+def link_azimuth(dx, dy):
+    """
+    Direction in degrees clockwise from north for coordinate offsets
+    from a site to its receivers.
+
+    """
+    return np.degrees(np.arctan2(dx, dy))
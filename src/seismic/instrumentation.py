@@ -0,0 +1,145 @@
+"""
+Stage timings and counters for the link budget.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+`StageTimings` collects the wall time and number of calls of each named
+stage, and any event counters (such as cache hits and misses). A
+`SimulationManager` only records into one while instrumentation is
+enabled. Otherwise every stage uses the shared `NULL_STAGE`, which does
+nothing.
+
+"""
+import json
+import time
+from collections import OrderedDict
+
+
+class StageTimings(object):
+    """
+
+    Wall time and call counts per stage, plus event counters.
+
+    """
+    def __init__(self):
+
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+
+
+    def stage(self, name):
+        """
+        Context manager adding the time spent within it to `name`.
+
+        """
+        return _Stage(self, name)
+
+
+    def add(self, name, elapsed, calls=1):
+        """
+        Add wall time in seconds and calls to a stage.
+
+        """
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'seconds': 0.0, 'calls': 0}
+
+        stage['seconds'] += elapsed
+        stage['calls'] += calls
+
+
+    def count(self, name, value=1):
+        """
+        Add to an event counter.
+
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def reset(self):
+        """
+        Discard everything recorded so far.
+
+        """
+        self.stages.clear()
+        self.counters.clear()
+
+
+    def as_dict(self):
+        """
+        Recorded stages and counters as plain dicts.
+
+        """
+        return OrderedDict([
+            ('stages', OrderedDict(
+                (name, dict(stage)) for name, stage in self.stages.items())),
+            ('counters', OrderedDict(self.counters)),
+        ])
+
+
+    def to_json(self, path=None, indent=1):
+        """
+
+        Serialise the recorded stages and counters as JSON.
+
+        Parameters
+        ----------
+        path : string
+            If given, the JSON is also written to this file.
+        indent : int
+            Indentation of the JSON.
+
+        Returns
+        -------
+        text : string
+            The JSON document.
+
+        """
+        text = json.dumps(self.as_dict(), indent=indent)
+
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+
+        return text
+
+
+class _Stage(object):
+    """
+    Times one stage of a `StageTimings`.
+
+    """
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage(object):
+    """
+    Stage used while instrumentation is disabled.
+
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = _NullStage()
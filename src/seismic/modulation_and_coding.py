@@ -0,0 +1,187 @@
+"""
+Modulation and coding scheme lookups.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+A modulation and coding lookup table is compiled once into sorted
+arrays. Spectral efficiency for a given SINR, and the SINR required for
+a given spectral efficiency, are then answered for whole arrays with
+`numpy.searchsorted`.
+
+The lookup of spectral efficiency originally compared SINR with the
+lowest spectral efficiency rather than the lowest SINR estimate, so
+SINR from the second scheme's estimate up to that efficiency gave 0.
+Tables reproduce this in legacy mode, which the link budget uses unless
+simulation_parameters['spectral_efficiency_lookup'] is 'corrected'.
+
+"""
+import numpy as np
+
+
+# Values of simulation_parameters['spectral_efficiency_lookup'].
+SPECTRAL_EFFICIENCY_LOOKUPS = ('legacy', 'corrected')
+
+
+class ModulationAndCodingTable(object):
+    """
+
+    Compiled modulation and coding scheme lookup table.
+
+    Parameters
+    ----------
+    lookup : list of tuples
+        Rows of (generation, mimo, cqi, modulation, coding rate,
+        spectral efficiency, sinr), as held for one generation in
+        `MODULATION_AND_CODING_LUT`. Spectral efficiency must increase
+        with SINR.
+    legacy : bool
+        If True, `spectral_efficiency` reproduces the original lookup,
+        which gives 0 for SINR from the second scheme's estimate up to
+        the lowest spectral efficiency.
+
+    """
+    def __init__(self, lookup, legacy=False):
+
+        rows = sorted(lookup, key=lambda row: row[6])
+
+        if not rows:
+            raise ValueError('Modulation and coding lookup table is empty')
+
+        self.generation = rows[0][0]
+        self.legacy = legacy
+        self.cqi = np.array([row[2] for row in rows])
+        self.spectral_efficiencies = np.array([row[5] for row in rows],
+            dtype=float)
+        self.sinr_values = np.array([row[6] for row in rows], dtype=float)
+
+        if (np.diff(self.spectral_efficiencies) < 0).any():
+            raise ValueError('Spectral efficiency must increase with SINR')
+
+
+    def __len__(self):
+        return len(self.sinr_values)
+
+
+    def spectral_efficiency(self, sinr):
+        """
+        Spectral efficiency of the highest scheme whose SINR estimate is
+        met. SINR below the first scheme gives 0, as does, in legacy
+        mode, SINR from the second scheme up to the lowest spectral
+        efficiency.
+
+        Parameters
+        ----------
+        sinr : float or array_like
+            Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
+
+        Returns
+        -------
+        spectral_efficiency : float or numpy.ndarray
+            Efficiency of information transfer in Bps/Hz.
+
+        """
+        sinr = np.asarray(sinr, dtype=float)
+
+        idx = np.searchsorted(self.sinr_values, sinr, side='right') - 1
+
+        spectral_efficiency = np.where(idx >= 0,
+            self.spectral_efficiencies[np.maximum(idx, 0)], 0.0)
+
+        if self.legacy:
+            gap = ((idx >= 1) & (idx < len(self) - 1) &
+                (sinr < self.spectral_efficiencies[0]))
+            spectral_efficiency = np.where(gap, 0.0, spectral_efficiency)
+        spectral_efficiency = np.where(np.isnan(sinr), np.nan,
+            spectral_efficiency)
+
+        return _as_output(spectral_efficiency)
+
+
+    def required_sinr(self, spectral_efficiency):
+        """
+        SINR estimate of the lowest scheme providing more than the given
+        spectral efficiency, as in the original power.py lookup, so demand
+        equal to a scheme's efficiency maps to the next scheme. Demand at
+        or above the highest scheme gives the highest SINR estimate in
+        the table.
+
+        Parameters
+        ----------
+        spectral_efficiency : float or array_like
+            Efficiency of information transfer in Bps/Hz.
+
+        Returns
+        -------
+        sinr : float or numpy.ndarray
+            Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
+
+        """
+        spectral_efficiency = np.asarray(spectral_efficiency, dtype=float)
+
+        idx = np.searchsorted(self.spectral_efficiencies, spectral_efficiency,
+            side='right')
+
+        sinr = self.sinr_values[np.minimum(idx, len(self) - 1)]
+        sinr = np.where(np.isnan(spectral_efficiency), np.nan, sinr)
+
+        return _as_output(sinr)
+
+
+def _as_output(values):
+    """
+    Return a float for scalar inputs and an array otherwise.
+
+    """
+    if values.ndim == 0:
+        return float(values)
+
+    return values
+
+
+_TABLES = {}
+
+
+def get_modulation_and_coding_table(lookup, legacy=False):
+    """
+    Compiled table for a list of lookup rows, built on first use and
+    shared by every later call with the same rows.
+
+    Parameters
+    ----------
+    lookup : list of tuples
+        Rows of (generation, mimo, cqi, modulation, coding rate,
+        spectral efficiency, sinr).
+    legacy : bool
+        If True, the table reproduces the original spectral efficiency
+        lookup (see `ModulationAndCodingTable`).
+
+    Returns
+    -------
+    table : ModulationAndCodingTable
+        The compiled lookup table.
+
+    """
+    key = (tuple(tuple(row) for row in lookup), legacy)
+
+    table = _TABLES.get(key)
+    if table is None:
+        table = ModulationAndCodingTable(lookup, legacy)
+        _TABLES[key] = table
+
+    return table
+
+
+def legacy_lookup(simulation_parameters):
+    """
+    True unless simulation_parameters['spectral_efficiency_lookup'] (one
+    of SPECTRAL_EFFICIENCY_LOOKUPS) selects the corrected lookup.
+
+    """
+    lookup = simulation_parameters.get('spectral_efficiency_lookup', 'legacy')
+
+    if lookup not in SPECTRAL_EFFICIENCY_LOOKUPS:
+        raise ValueError(
+            'Did not recognise spectral_efficiency_lookup: {}'.format(lookup))
+
+    return lookup == 'legacy'
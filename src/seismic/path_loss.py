@@ -16,8 +16,33 @@ studies between different radio services or systems.
 
 """
 import numpy as np
+from abc import ABC, abstractmethod
 from math import pi, sqrt
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# Codes returned by the batch functions to identify which branch of
+# ETSI TR 138.901 produced each path loss value. A code of -1 marks a
+# combination the model does not define.
+ETSI_TR_138_901_BRANCHES = (
+    'rma_los_1',
+    'rma_los_2',
+    'rma_nlos',
+    'uma_los_1',
+    'uma_los_2',
+    'uma_nlos',
+    'umi_los_1',
+    'umi_los_2',
+    'umi_nlos',
+    'uma_nlos_optional',
+)
+RMA_LOS_1, RMA_LOS_2, RMA_NLOS, UMA_LOS_1, UMA_LOS_2, UMA_NLOS, \
+    UMI_LOS_1, UMI_LOS_2, UMI_NLOS, UMA_NLOS_OPTIONAL = range(10)
+
 
 def path_loss_calculator(frequency, distance, ant_height, ant_type,
     building_height, street_width, settlement_type, type_of_sight,
@@ -295,31 +320,1242 @@ def uma_nlos_optional(frequency, distance, ant_height, ue_height,
     return round(path_loss + random_variation)
 
 
-def check_3gpp_applicability(building_height, street_width, ant_height, ue_height):
+def path_loss_calculator_batch(frequency, distance, ant_height, ant_type,
+    building_height, street_width, settlement_type, type_of_sight,
+    ue_height, above_roof, indoor, seed_value, iterations,
+    shadow_fading=None, link_ids=None):
+    """
+    Calculate path loss for an array of distances in a single call.
+
+    Array-in/array-out equivalent of `path_loss_calculator`. The result
+    for each element matches the scalar function called with that
+    element's distance, type of sight, UE height and indoor flag.
+
+    Parameters
+    ----------
+    frequency : float
+        Frequency band given in GHz.
+    distance : array_like
+        Distances between the transmitter and receivers in meters (m).
+    ant_height : float
+        Height of the antenna.
+    ant_type : string
+        Indicates the type of site antenna (hotspot, micro, macro).
+    building_height : int
+        Height of surrounding buildings in meters (m).
+    street_width : float
+        Width of street in meters (m).
+    settlement_type : string
+        Gives the type of settlement (urban, suburban or rural).
+    type_of_sight : string or array_like
+        Either 'los' or 'nlos' for all elements, or a per-element array
+        of these strings or of booleans (True for Line of Sight).
+    ue_height : float or array_like
+        Height of the User Equipment, scalar or per element.
+    above_roof : int
+        Indicates if the propagation line is above or below building roofs.
+        Above = 1, below = 0.
+    indoor : bool or array_like
+        Indicates if the user is indoor (True) or outdoor (False),
+        scalar or per element.
+    seed_value : int
+        Dictates repeatable random number generation.
+    iterations : int
+        Specifies how many iterations a specific calculation should be run for.
+    shadow_fading : ShadowFading
+        Optional `seismic.shadow_fading.ShadowFading` stream giving each
+        link its own shadow fading draws. By default every link shares the
+        values of `generate_log_normal_dist_value`.
+    link_ids : array_like
+        Integer link ids used to index `shadow_fading`, with the same
+        shape as `distance`. Defaults to the flattened element positions.
+
+    Returns
+    -------
+    path_loss : numpy.ndarray
+        Path loss in decibels (dB) with the same shape as `distance`.
+    model : numpy.ndarray
+        Integer codes indexing `ETSI_TR_138_901_BRANCHES`, giving the
+        model branch used for each element.
+
+    """
+    return _evaluate_by_ue_height(frequency, distance, ant_height, ant_type,
+        building_height, street_width, settlement_type, type_of_sight,
+        ue_height, above_roof, indoor, seed_value, iterations,
+        shadow_fading, link_ids, True)
+
+
+def etsi_tr_138_901_batch(frequency, distance, ant_height, ant_type,
+    building_height, street_width, settlement_type, type_of_sight,
+    ue_height, above_roof, indoor, seed_value, iterations,
+    shadow_fading=None, link_ids=None):
+    """
+
+    Array-in/array-out implementation of `etsi_tr_138_901`.
+
+    Takes the same parameters as `path_loss_calculator_batch`, and
+    evaluates a `PropagationModel` for each distinct UE height.
+
+    Returns
+    -------
+    path_loss : numpy.ndarray
+        Path loss in decibels (dB) with the same shape as `distance`.
+    model : numpy.ndarray
+        Integer codes indexing `ETSI_TR_138_901_BRANCHES`.
+
+    """
+    return _evaluate_by_ue_height(frequency, distance, ant_height, ant_type,
+        building_height, street_width, settlement_type, type_of_sight,
+        ue_height, above_roof, indoor, seed_value, iterations,
+        shadow_fading, link_ids, False)
+
+
+def _evaluate_by_ue_height(frequency, distance, ant_height, ant_type,
+    building_height, street_width, settlement_type, type_of_sight,
+    ue_height, above_roof, indoor, seed_value, iterations,
+    shadow_fading, link_ids, include_indoor):
+    """
+    Split a batch by UE height, which `PropagationModel` holds constant,
+    and evaluate one model per distinct height.
+
+    """
+    distance = np.asarray(distance, dtype=float)
+    shape = distance.shape
+
+    los = _type_of_sight_mask(type_of_sight, shape).ravel()
+    indoor = np.broadcast_to(np.asarray(indoor, dtype=bool), shape).ravel()
+    if link_ids is None:
+        link_ids = np.arange(distance.size)
+    else:
+        link_ids = np.broadcast_to(np.asarray(link_ids), shape).ravel()
+
+    ue_height = np.asarray(ue_height, dtype=float)
+    if ue_height.ndim == 0:
+        heights = [float(ue_height)]
+        groups = [slice(None)]
+    else:
+        ue_height = np.broadcast_to(ue_height, shape).ravel()
+        heights, inverse = np.unique(ue_height, return_inverse=True)
+        groups = [inverse == idx for idx in range(len(heights))]
+
+    path_loss = np.empty(distance.size)
+    model = np.empty(distance.size, dtype=np.int8)
+
+    for height, group in zip(heights, groups):
+
+        propagation_model = PropagationModel(frequency, ant_type,
+            settlement_type, building_height, street_width, ant_height,
+            height, seed_value, iterations, shadow_fading, above_roof)
+
+        if include_indoor:
+            path_loss[group], model[group] = propagation_model.evaluate(
+                distance.ravel()[group], los[group], indoor[group],
+                link_ids[group])
+        else:
+            path_loss[group], model[group] = propagation_model.etsi_tr_138_901(
+                distance.ravel()[group], los[group], link_ids[group])
+
+    return path_loss.reshape(shape), model.reshape(shape)
+
+
+class BasePropagationModel(ABC):
+    """
+
+    Interface shared by the models in `PROPAGATION_MODELS`.
+
+    Each model is built once for a set of distance-independent
+    parameters, and `evaluate` then returns the path loss for an array
+    of distances, along with integer codes indexing the model's
+    `branches`. Subclasses must implement `evaluate`, otherwise they
+    cannot be instantiated.
+
+    Parameters
+    ----------
+    frequency : float
+        Frequency band given in GHz.
+    ant_type : string
+        Indicates the type of site antenna (micro, macro).
+    environment : string
+        Gives the type of settlement (urban, suburban or rural).
+    building_height : int
+        Height of surrounding buildings in meters (m).
+    street_width : float
+        Width of street in meters (m).
+    ant_height : float
+        Height of the antenna.
+    ue_height : float
+        Height of the User Equipment.
+    seed_value : int
+        Dictates repeatable random number generation.
+    iterations : int
+        Specifies how many iterations a specific calculation should be run for.
+    shadow_fading : ShadowFading
+        Optional per-link shadow fading stream.
+    above_roof : int
+        Indicates if the propagation line is above or below building roofs.
+
+    """
+    branches = ()
+
+    def __init__(self, frequency, ant_type, environment, building_height,
+        street_width, ant_height, ue_height, seed_value=None, iterations=1,
+        shadow_fading=None, above_roof=0):
+
+        self.frequency = frequency
+        self.ant_type = ant_type
+        self.environment = environment
+        self.building_height = building_height
+        self.street_width = street_width
+        self.ant_height = ant_height
+        self.ue_height = ue_height
+        self.seed_value = seed_value
+        self.iterations = iterations
+        self.shadow_fading = shadow_fading
+        self.above_roof = above_roof
+
+        self._shadow_terms = {}
+
+
+    @abstractmethod
+    def evaluate(self, distances, type_of_sight, indoor=False, link_ids=None,
+        monte_carlo=False, indoor_loss=None):
+        """
+        Path loss including outdoor to indoor loss.
+
+        Parameters
+        ----------
+        distances : array_like
+            Distances between the transmitter and receivers in meters (m).
+        type_of_sight : string or array_like
+            Either 'los' or 'nlos', or a per-element array of these
+            strings or of booleans (True for Line of Sight).
+        indoor : bool or array_like
+            Indicates if each user is indoor (True) or outdoor (False).
+        link_ids : array_like
+            Integer link ids used to index the shadow fading stream.
+        monte_carlo : bool
+            If True, keep every shadow fading draw instead of their mean.
+            Requires a `shadow_fading` stream.
+        indoor_loss : array_like
+            Precomputed outdoor to indoor loss in decibels (dB) for each
+            element, e.g. from `outdoor_to_indoor_path_loss_batch`. When
+            given, it is used instead of drawing a loss for `indoor`.
+
+        Returns
+        -------
+        path_loss : numpy.ndarray
+            Path loss in decibels (dB) with the same shape as `distances`,
+            or of shape (iterations,) + distances.shape with `monte_carlo`.
+        model : numpy.ndarray
+            Integer codes indexing `branches`.
+
+        """
+
+
+    def _check_monte_carlo(self, monte_carlo):
+        if monte_carlo and self.shadow_fading is None:
+            raise ValueError('monte_carlo requires a shadow_fading stream')
+
+
+    def _add_indoor_loss(self, path_loss, indoor, link_ids, monte_carlo,
+        indoor_loss=None):
+        """
+        Add the outdoor to indoor loss of `outdoor_to_indoor_path_loss`
+        to the indoor links, or the precomputed `indoor_loss`.
+
+        """
+        if indoor_loss is not None:
+            return path_loss + indoor_loss
+
+        shape = path_loss.shape[1:] if monte_carlo else path_loss.shape
+
+        indoor = np.broadcast_to(np.asarray(indoor, dtype=bool), shape)
+        if not indoor.any():
+            return path_loss
+
+        if self.shadow_fading is None:
+            #cached legacy value
+            return np.where(indoor,
+                path_loss + self._shadow(12, 8, None, draws=1), path_loss)
+
+        if link_ids is None:
+            link_ids = np.arange(indoor.size).reshape(shape)
+
+        return path_loss + outdoor_to_indoor_path_loss_batch(self.frequency,
+            indoor, self.seed_value, self.shadow_fading, link_ids, monte_carlo,
+            self.iterations)
+
+
+    def _shadow(self, mu, sigma, link_ids, mask=None, draws=None,
+        monte_carlo=False):
+        """
+        Shadow fading term for the masked links. Without a stream this is
+        the legacy value shared by every link, which is cached when a
+        seed is given. With `monte_carlo` every draw is returned, one row
+        per iteration.
+
+        """
+        if draws is None:
+            draws = self.iterations
+
+        if self.shadow_fading is None:
+            if self.seed_value is None:
+                return generate_log_normal_dist_value(
+                    self.frequency, mu, sigma, draws, self.seed_value)
+            key = (mu, sigma, draws)
+            if key not in self._shadow_terms:
+                self._shadow_terms[key] = generate_log_normal_dist_value(
+                    self.frequency, mu, sigma, draws, self.seed_value)
+            return self._shadow_terms[key]
+
+        if mask is not None:
+            link_ids = link_ids[mask]
+
+        if monte_carlo:
+            return self.shadow_fading.sample_draws(mu, sigma, link_ids, draws)
+
+        return self.shadow_fading.sample(mu, sigma, link_ids, draws)
+
+
+class PropagationModel(BasePropagationModel):
+    """
+
+    ETSI TR 138.901 path loss model compiled for one scenario.
+
+    Everything that does not depend on distance (breakpoint distances,
+    building and antenna height terms, log frequency terms and the
+    legacy shadow fading values) is computed once on construction, and
+    the 3GPP applicability check is run once without printing.
+    `evaluate` then only does the distance-dependent arithmetic, and
+    matches `path_loss_calculator` element for element.
+
+    Parameters
+    ----------
+    frequency : float
+        Frequency band given in GHz.
+    ant_type : string
+        Indicates the type of site antenna (micro, macro).
+    environment : string
+        Gives the type of settlement (urban, suburban or rural).
+    building_height : int
+        Height of surrounding buildings in meters (m).
+    street_width : float
+        Width of street in meters (m).
+    ant_height : float
+        Height of the antenna.
+    ue_height : float
+        Height of the User Equipment.
+    seed_value : int
+        Dictates repeatable random number generation.
+    iterations : int
+        Specifies how many iterations a specific calculation should be run for.
+    shadow_fading : ShadowFading
+        Optional per-link shadow fading stream.
+    above_roof : int
+        Indicates if the propagation line is above or below building roofs.
+    jit : bool
+        Use the Numba-compiled kernel. Defaults to True when Numba is
+        installed, otherwise the NumPy implementation is used.
+
+    """
+    branches = ETSI_TR_138_901_BRANCHES
+
+    def __init__(self, frequency, ant_type, environment, building_height,
+        street_width, ant_height, ue_height, seed_value=None, iterations=1,
+        shadow_fading=None, above_roof=0, jit=None):
+
+        if not 0.05 < frequency <= 100:
+            raise ValueError (
+                "frequency of {} is NOT within correct range".format(frequency)
+            )
+
+        if ant_type == 'macro':
+            if environment == 'suburban' or environment == 'rural':
+                self.scenario = 'rma'
+            elif environment == 'urban':
+                self.scenario = 'uma'
+            else:
+                raise ValueError('Did not recognise settlement_type')
+        elif ant_type == 'micro':
+            self.scenario = 'umi'
+        else:
+            raise ValueError('Did not recognise ant_type')
+
+        BasePropagationModel.__init__(self, frequency, ant_type, environment,
+            building_height, street_width, ant_height, ue_height, seed_value,
+            iterations, shadow_fading, above_roof)
+
+        if jit is None:
+            jit = _etsi_tr_138_901_jit is not None
+        elif jit and _etsi_tr_138_901_jit is None:
+            raise ValueError('jit requires numba to be installed')
+        self.jit = jit
+
+        self.compliant = check_3gpp_applicability(building_height,
+            street_width, ant_height, ue_height, verbose=False)
+
+        fc = frequency
+        c = 3e8
+
+        he = 1 #enviroment_height
+        hbs = ant_height
+        hut = ue_height
+        h_apost_bs = ant_height - ue_height
+        h_apost_ut = ue_height - he
+        w = street_width
+        h = building_height
+
+        self.dbp = 2 * pi * hbs * hut * (fc * 1e9) / c
+        self.d_apost_bp = 4 * h_apost_bs * h_apost_ut * (fc*1e9) / c
+        self.height_difference_squared = (hbs - hut)**2
+        self.log_fc = 20*np.log10(fc)
+
+        if self.scenario == 'rma':
+            self.rma_a = min(0.03*h**1.72,10)
+            self.rma_b = min(0.044*h**1.72,14.77)
+            self.rma_c = 0.002*np.log10(h)
+            dbp = self.dbp
+            self.rma_pl2 = (
+                20*np.log10(40*pi*dbp*fc/3) + self.rma_a *
+                np.log10(dbp) - self.rma_b + self.rma_c*dbp
+            )
+            self.rma_nlos = (
+                161.04 - 7.1 * np.log10(w)+7.5*np.log10(h) -
+                (24.37 - 3.7 * (h/hbs)**2)*np.log10(hbs)
+            )
+            self.rma_nlos_slope = 43.42 - 3.1*np.log10(hbs)
+            self.rma_nlos_ue = 3.2 * (np.log10(11.75*hut))**2 - 4.97
+        elif self.scenario == 'uma':
+            self.los_2 = 9*np.log10(
+                (self.d_apost_bp)**2 + self.height_difference_squared)
+            self.nlos_ue = 0.6 * (hut - 1.5)
+        else:
+            self.los_2 = 9.5*np.log10(
+                (self.d_apost_bp)**2 + self.height_difference_squared)
+            self.nlos_ue = 0.3 * (hut - 1.5)
+            self.umi_log_fc = 21.3 * np.log10(fc)
+
+        self._kernel_constants = np.array([
+            KERNEL_SCENARIOS.index(self.scenario),
+            fc,
+            self.dbp,
+            self.d_apost_bp,
+            self.height_difference_squared,
+            self.log_fc,
+            getattr(self, 'rma_a', 0),
+            getattr(self, 'rma_b', 0),
+            getattr(self, 'rma_c', 0),
+            getattr(self, 'rma_pl2', 0),
+            getattr(self, 'rma_nlos', 0),
+            getattr(self, 'rma_nlos_slope', 0),
+            getattr(self, 'rma_nlos_ue', 0),
+            getattr(self, 'los_2', 0),
+            getattr(self, 'nlos_ue', 0),
+            getattr(self, 'umi_log_fc', 0),
+        ], dtype=np.float64)
+
+
+    def evaluate(self, distances, type_of_sight, indoor=False, link_ids=None,
+        monte_carlo=False, indoor_loss=None):
+        """
+        Path loss including outdoor to indoor loss, as returned by
+        `path_loss_calculator_batch`.
+
+        Parameters
+        ----------
+        distances : array_like
+            Distances between the transmitter and receivers in meters (m).
+        type_of_sight : string or array_like
+            Either 'los' or 'nlos', or a per-element array of these
+            strings or of booleans (True for Line of Sight).
+        indoor : bool or array_like
+            Indicates if each user is indoor (True) or outdoor (False).
+        link_ids : array_like
+            Integer link ids used to index the shadow fading stream.
+        monte_carlo : bool
+            If True, keep every shadow fading draw instead of their mean.
+            Requires a `shadow_fading` stream.
+        indoor_loss : array_like
+            Precomputed outdoor to indoor loss in decibels (dB) for each
+            element, e.g. from `outdoor_to_indoor_path_loss_batch`. When
+            given, it is used instead of drawing a loss for `indoor`.
+
+        Returns
+        -------
+        path_loss : numpy.ndarray
+            Path loss in decibels (dB) with the same shape as `distances`,
+            or of shape (iterations,) + distances.shape with `monte_carlo`.
+        model : numpy.ndarray
+            Integer codes indexing `ETSI_TR_138_901_BRANCHES`.
+
+        """
+        path_loss, model = self.etsi_tr_138_901(distances, type_of_sight,
+            link_ids, monte_carlo)
+
+        path_loss = self._add_indoor_loss(path_loss, indoor, link_ids,
+            monte_carlo, indoor_loss)
+
+        return np.round(path_loss), model
+
+
+    def etsi_tr_138_901(self, distances, type_of_sight, link_ids=None,
+        monte_carlo=False):
+        """
+        Path loss from the ETSI TR 138.901 branches only.
+
+        Each branch is selected with a boolean mask, and its formula is
+        only evaluated for the elements it applies to. With `jit` the
+        branches are instead evaluated in one pass by a compiled kernel.
+        Links the model does not define raise a ValueError.
+
+        Returns
+        -------
+        path_loss : numpy.ndarray
+            Path loss in decibels (dB) with the same shape as `distances`,
+            or of shape (iterations,) + distances.shape with `monte_carlo`.
+        model : numpy.ndarray
+            Integer codes indexing `ETSI_TR_138_901_BRANCHES`.
+
+        """
+        self._check_monte_carlo(monte_carlo)
+
+        distance = np.asarray(distances, dtype=float)
+        shape = distance.shape
+        distance = distance.ravel()
+
+        los = _type_of_sight_mask(type_of_sight, shape).ravel()
+        if link_ids is None:
+            link_ids = np.arange(distance.size)
+        else:
+            link_ids = np.broadcast_to(np.asarray(link_ids), shape).ravel()
+
+        if self.jit and not monte_carlo:
+            path_loss = np.empty(distance.shape)
+            model = np.empty(distance.shape, dtype=np.int8)
+            _etsi_tr_138_901_jit(distance, los, self._kernel_constants,
+                self._kernel_shadow(link_ids), path_loss, model)
+        else:
+            d2d_in = 10 #mean d2d_in value
+            d2d_out = distance - d2d_in
+            d2d = d2d_out + d2d_in
+            d3d = np.sqrt((d2d_out + d2d_in)**2 + self.height_difference_squared)
+
+            draws = (self.iterations,) if monte_carlo else ()
+            path_loss = np.full(draws + distance.shape, np.nan)
+            model = np.full(distance.shape, -1, dtype=np.int8)
+
+            if self.scenario == 'rma':
+                self._rma(path_loss, model, distance, d2d, d3d, los, link_ids,
+                    monte_carlo)
+            else:
+                self._uma_umi(path_loss, model, distance, d2d, d3d, los,
+                    link_ids, monte_carlo)
+
+        if (model == -1).any():
+            raise ValueError(
+                'etsi_tr_138_901 is not defined for {} of the links'.format(
+                int((model == -1).sum()))
+            )
+
+        return path_loss.reshape(path_loss.shape[:-1] + shape), model.reshape(shape)
+
+
+    def _rma(self, path_loss, model, distance, d2d, d3d, los, link_ids,
+        monte_carlo=False):
+        """
+        Fill in the RMa (macro rural and suburban) branches.
+
+        """
+        fc = self.frequency
+        dbp = self.dbp
+
+        los_1 = los & (10 <= d2d) & (d2d <= dbp)
+        los_2 = los & ~los_1 & (dbp <= d2d) & (d2d <= 10000)
+        nlos = ~los
+        optional = los & ~los_1 & ~los_2 & (d2d > 10000)
+
+        if los_1.any():
+            d = d3d[los_1]
+            path_loss[..., los_1] = np.round(
+                20*np.log10(40*pi*d*fc/3) + self.rma_a *
+                np.log10(d) - self.rma_b +
+                self.rma_c*d +
+                self._shadow(1, 4, link_ids, los_1, monte_carlo=monte_carlo)
+            )
+            model[los_1] = RMA_LOS_1
+
+        pl2_mask = los_2 | nlos
+        if pl2_mask.any():
+            d = d3d[pl2_mask]
+            pl2 = np.round(
+                self.rma_pl2 +
+                self._shadow(1, 4, link_ids, pl2_mask, monte_carlo=monte_carlo) +
+                40*np.log10(d / dbp) +
+                self._shadow(1, 6, link_ids, pl2_mask, monte_carlo=monte_carlo)
+            )
+            path_loss[..., pl2_mask] = pl2
+            model[pl2_mask] = RMA_LOS_2
+
+            if nlos.any():
+                d = d3d[nlos]
+                pl_apostrophe_rma_nlos = np.round(
+                    self.rma_nlos + self.rma_nlos_slope*(np.log10(d)-3) +
+                    self.log_fc - self.rma_nlos_ue +
+                    self._shadow(1, 8, link_ids, nlos, monte_carlo=monte_carlo)
+                )
+                path_loss[..., nlos] = np.maximum(pl_apostrophe_rma_nlos,
+                    pl2[..., nlos[pl2_mask]])
+                model[nlos] = RMA_NLOS
+
+        if optional.any():
+            path_loss[..., optional] = self._uma_nlos_optional(distance,
+                link_ids, optional, monte_carlo)
+            model[optional] = UMA_NLOS_OPTIONAL
+
+
+    def _uma_umi(self, path_loss, model, distance, d2d, d3d, los, link_ids,
+        monte_carlo=False):
+        """
+        Fill in the UMa (macro urban) or UMi (micro) branches, which
+        share the same structure.
+
+        """
+        if self.scenario == 'uma':
+            codes = (UMA_LOS_1, UMA_LOS_2, UMA_NLOS)
+        else:
+            codes = (UMI_LOS_1, UMI_LOS_2, UMI_NLOS)
+
+        d_apost_bp = self.d_apost_bp
+
+        los_1 = los & (10 <= d2d) & (d2d <= d_apost_bp)
+        los_2 = los & ~los_1 & (d_apost_bp <= d2d) & (d2d <= 5000)
+        near = ~los & (d2d <= 5000)
+        #umi nlos is not defined beyond 5km
+        if self.scenario == 'uma':
+            far = ~los & (d2d > 5000)
+        else:
+            far = np.zeros_like(los)
+        nlos = near | far
+
+        if los_1.any():
+            d = d3d[los_1]
+            if self.scenario == 'uma':
+                pl1 = np.round(
+                    28 + 22 * np.log10(d) + self.log_fc +
+                    self._shadow(1, 4, link_ids, los_1, monte_carlo=monte_carlo)
+                )
+            else:
+                pl1 = np.round(
+                    32.4 + 21 * np.log10(d) + self.log_fc +
+                    self._shadow(1, 4, link_ids, los_1, monte_carlo=monte_carlo)
+                )
+            path_loss[..., los_1] = pl1
+            model[los_1] = codes[0]
+
+        pl2_mask = los_2 | nlos
+        if pl2_mask.any():
+            d = d3d[pl2_mask]
+            if self.scenario == 'uma':
+                pl2 = np.round(
+                    28 + 40*np.log10(d) + self.log_fc - self.los_2 +
+                    self._shadow(1, 4, link_ids, pl2_mask, monte_carlo=monte_carlo)
+                )
+            else:
+                pl2 = np.round(
+                    32.4 + 40*np.log10(d) + self.log_fc - self.los_2 +
+                    self._shadow(1, 4, link_ids, pl2_mask, monte_carlo=monte_carlo)
+                )
+            path_loss[..., pl2_mask] = pl2
+            model[pl2_mask] = codes[1]
+
+            if nlos.any():
+                pl_apostrophe_nlos = np.empty(
+                    path_loss.shape[:-1] + (int(nlos.sum()),))
+                sub_near = near[nlos]
+                if sub_near.any():
+                    d = d3d[near]
+                    if self.scenario == 'uma':
+                        pl_apostrophe_nlos[..., sub_near] = np.round(
+                            13.54 + 39.08 * np.log10(d) + self.log_fc -
+                            self.nlos_ue + self._shadow(1, 6, link_ids, near,
+                            monte_carlo=monte_carlo)
+                        )
+                    else:
+                        pl_apostrophe_nlos[..., sub_near] = np.round(
+                            35.3 * np.log10(d) + 22.4 + self.umi_log_fc -
+                            self.nlos_ue + self._shadow(1, 7.82, link_ids, near,
+                            monte_carlo=monte_carlo)
+                        )
+                if far.any():
+                    pl_apostrophe_nlos[..., ~sub_near] = self._uma_nlos_optional(
+                        distance, link_ids, far, monte_carlo)
+
+                path_loss[..., nlos] = np.maximum(pl_apostrophe_nlos,
+                    pl2[..., nlos[pl2_mask]])
+                model[near] = codes[2]
+                model[far] = UMA_NLOS_OPTIONAL
+
+
+    def _uma_nlos_optional(self, distance, link_ids, mask, monte_carlo=False):
+        """
+        UMa NLOS / Optional path loss for the masked links, as given by
+        `uma_nlos_optional`.
+
+        """
+        d3d = np.sqrt((distance[mask])**2 + self.height_difference_squared)
+
+        path_loss = 32.4 + self.log_fc + 30*np.log10(d3d)
+
+        return np.round(path_loss +
+            self._shadow(1, 7.8, link_ids, mask, monte_carlo=monte_carlo))
+
+
+    def _kernel_shadow(self, link_ids):
+        """
+        Shadow fading terms for the compiled kernel, as rows of a
+        (len(KERNEL_SHADOW_SIGMAS), links) array, or a single column
+        shared by every link when no stream is used.
+
+        """
+        if self.shadow_fading is None:
+            return np.array([[self._shadow(1, sigma, link_ids)]
+                for sigma in KERNEL_SHADOW_SIGMAS])
+
+        shadow = np.zeros((len(KERNEL_SHADOW_SIGMAS), len(link_ids)))
+        for idx, sigma in enumerate(KERNEL_SHADOW_SIGMAS):
+            if sigma in KERNEL_SCENARIO_SIGMAS[self.scenario]:
+                shadow[idx] = self._shadow(1, sigma, link_ids)
+
+        return shadow
+
+
+KERNEL_SCENARIOS = ('rma', 'uma', 'umi')
+
+# Standard deviations of the shadow fading terms passed to the kernel,
+# and the terms each scenario uses.
+KERNEL_SHADOW_SIGMAS = (4, 6, 8, 7.82, 7.8)
+KERNEL_SCENARIO_SIGMAS = {
+    'rma': (4, 6, 8, 7.8),
+    'uma': (4, 6, 7.8),
+    'umi': (4, 7.82),
+}
+
+
+def _etsi_tr_138_901_kernel(distance, los, constants, shadow, path_loss, model):
+    """
+    Fused ETSI TR 138.901 and UMa NLOS / Optional kernel.
+
+    Evaluates every link in a single pass without temporary arrays,
+    writing into `path_loss` and `model`. Mirrors the arithmetic of
+    `PropagationModel` term for term so both give identical results.
+    Undefined links are given NaN and a model code of -1.
+
+    """
+    scenario = int(constants[0])
+    fc = constants[1]
+    dbp = constants[2]
+    d_apost_bp = constants[3]
+    height_difference_squared = constants[4]
+    log_fc = constants[5]
+    rma_a = constants[6]
+    rma_b = constants[7]
+    rma_c = constants[8]
+    rma_pl2 = constants[9]
+    rma_nlos = constants[10]
+    rma_nlos_slope = constants[11]
+    rma_nlos_ue = constants[12]
+    los_2 = constants[13]
+    nlos_ue = constants[14]
+    umi_log_fc = constants[15]
+
+    shared = shadow.shape[1] == 1
+
+    for i in range(distance.shape[0]):
+
+        j = 0 if shared else i
+        s4 = shadow[0, j]
+        s6 = shadow[1, j]
+        s8 = shadow[2, j]
+        s782 = shadow[3, j]
+        s78 = shadow[4, j]
+
+        d2d = (distance[i] - 10) + 10
+        d3d = np.sqrt(d2d * d2d + height_difference_squared)
+
+        pl = np.nan
+        code = -1
+
+        if scenario == 0:
+            if los[i] and 10 <= d2d and d2d <= dbp:
+                pl = np.rint(
+                    20*np.log10(40*pi*d3d*fc/3) + rma_a *
+                    np.log10(d3d) - rma_b + rma_c*d3d + s4
+                )
+                code = 0
+            else:
+                pl2 = np.rint(
+                    rma_pl2 + s4 + 40*np.log10(d3d / dbp) + s6
+                )
+                if los[i] and dbp <= d2d and d2d <= 10000:
+                    pl = pl2
+                    code = 1
+                elif not los[i]:
+                    pl = max(np.rint(
+                        rma_nlos + rma_nlos_slope*(np.log10(d3d)-3) +
+                        log_fc - rma_nlos_ue + s8
+                    ), pl2)
+                    code = 2
+                elif d2d > 10000:
+                    d3d_optional = np.sqrt(
+                        distance[i] * distance[i] + height_difference_squared)
+                    pl = np.rint(32.4 + log_fc + 30*np.log10(d3d_optional) + s78)
+                    code = 9
+
+        else:
+            if los[i] and 10 <= d2d and d2d <= d_apost_bp:
+                if scenario == 1:
+                    pl = np.rint(28 + 22 * np.log10(d3d) + log_fc + s4)
+                    code = 3
+                else:
+                    pl = np.rint(32.4 + 21 * np.log10(d3d) + log_fc + s4)
+                    code = 6
+            else:
+                if scenario == 1:
+                    pl2 = np.rint(28 + 40*np.log10(d3d) + log_fc - los_2 + s4)
+                else:
+                    pl2 = np.rint(32.4 + 40*np.log10(d3d) + log_fc - los_2 + s4)
+
+                if los[i]:
+                    if d_apost_bp <= d2d and d2d <= 5000:
+                        pl = pl2
+                        code = 4 if scenario == 1 else 7
+                elif d2d <= 5000:
+                    if scenario == 1:
+                        pl = max(np.rint(
+                            13.54 + 39.08 * np.log10(d3d) + log_fc -
+                            nlos_ue + s6
+                        ), pl2)
+                        code = 5
+                    else:
+                        pl = max(np.rint(
+                            35.3 * np.log10(d3d) + 22.4 + umi_log_fc -
+                            nlos_ue + s782
+                        ), pl2)
+                        code = 8
+                elif scenario == 1:
+                    d3d_optional = np.sqrt(
+                        distance[i] * distance[i] + height_difference_squared)
+                    pl = max(np.rint(
+                        32.4 + log_fc + 30*np.log10(d3d_optional) + s78
+                    ), pl2)
+                    code = 9
+
+        path_loss[i] = pl
+        model[i] = code
+
+
+if njit is not None:
+    _etsi_tr_138_901_jit = njit(cache=True, nogil=True)(_etsi_tr_138_901_kernel)
+else:
+    _etsi_tr_138_901_jit = None
+
+
+def uma_nlos_optional_batch(frequency, distance, ant_height, ue_height,
+    seed_value, iterations, shadow_fading=None, link_ids=None):
+    """
+
+    Array-in/array-out implementation of `uma_nlos_optional`, with the
+    optional per-link `shadow_fading` stream of `etsi_tr_138_901_batch`.
+
+    Returns
+    -------
+    path_loss : numpy.ndarray
+        Path loss in decibels (dB)
+
+    """
+    fc = frequency
+    d3d = np.sqrt((distance)**2 + (ant_height - ue_height)**2)
+
+    path_loss = 32.4 + 20*np.log10(fc) + 30*np.log10(d3d)
+
+    if shadow_fading is None:
+        random_variation = generate_log_normal_dist_value(
+            frequency, 1, 7.8, iterations, seed_value
+        )
+    else:
+        if link_ids is None:
+            link_ids = np.arange(np.size(path_loss)).reshape(np.shape(path_loss))
+        random_variation = shadow_fading.sample(1, 7.8, link_ids)
+
+    return np.round(path_loss + random_variation)
+
+
+class UmaNlosOptionalModel(BasePropagationModel):
+    """
+
+    UMa NLOS / Optional from ETSI TR 138.901 applied to every link,
+    whatever the type of sight. Matches `uma_nlos_optional_batch`.
+
+    Takes the parameters of `BasePropagationModel`.
+
+    """
+    branches = ETSI_TR_138_901_BRANCHES
+
+    def __init__(self, frequency, ant_type, environment, building_height,
+        street_width, ant_height, ue_height, seed_value=None, iterations=1,
+        shadow_fading=None, above_roof=0):
+
+        BasePropagationModel.__init__(self, frequency, ant_type, environment,
+            building_height, street_width, ant_height, ue_height, seed_value,
+            iterations, shadow_fading, above_roof)
+
+        self.height_difference_squared = (ant_height - ue_height)**2
+        self.log_fc = 20*np.log10(frequency)
+
+
+    def evaluate(self, distances, type_of_sight=None, indoor=False,
+        link_ids=None, monte_carlo=False, indoor_loss=None):
+
+        self._check_monte_carlo(monte_carlo)
+
+        distance = np.asarray(distances, dtype=float)
+        if link_ids is None:
+            link_ids = np.arange(distance.size).reshape(distance.shape)
+
+        d3d = np.sqrt(distance**2 + self.height_difference_squared)
+
+        path_loss = np.round(32.4 + self.log_fc + 30*np.log10(d3d) +
+            self._shadow(1, 7.8, link_ids, monte_carlo=monte_carlo))
+
+        path_loss = self._add_indoor_loss(path_loss, indoor, link_ids,
+            monte_carlo, indoor_loss)
+
+        model = np.full(distance.shape, UMA_NLOS_OPTIONAL, dtype=np.int8)
+
+        return np.round(path_loss), model
+
+
+class FreeSpaceModel(BasePropagationModel):
+    """
+
+    Free Space path loss model, with a log-normal variation of 2.5 dB.
+
+    Cheap enough for screening runs. Type of sight, environment and
+    building geometry are accepted for a common interface but do not
+    affect the result.
+
+    Takes the parameters of `BasePropagationModel`.
+
+    """
+    branches = ('free_space',)
+
+    def __init__(self, frequency, ant_type, environment, building_height,
+        street_width, ant_height, ue_height, seed_value=None, iterations=1,
+        shadow_fading=None, above_roof=0):
+
+        BasePropagationModel.__init__(self, frequency, ant_type, environment,
+            building_height, street_width, ant_height, ue_height, seed_value,
+            iterations, shadow_fading, above_roof)
+
+        #model requires frequency in MHz and heights in km
+        self.log_fc = 20*np.log10(frequency*1000)
+        self.height_difference_squared = ((ant_height - ue_height)/1000)**2
+
+
+    def evaluate(self, distances, type_of_sight=None, indoor=False,
+        link_ids=None, monte_carlo=False, indoor_loss=None):
+
+        self._check_monte_carlo(monte_carlo)
+
+        distance = np.asarray(distances, dtype=float)
+        if link_ids is None:
+            link_ids = np.arange(distance.size).reshape(distance.shape)
+
+        #model requires distance in kilometers rather than meters
+        distance = distance / 1000
+
+        path_loss = (
+            32.4 + 10*np.log10(self.height_difference_squared + distance**2) +
+            self.log_fc + self._shadow(1, 2.5, link_ids, monte_carlo=monte_carlo)
+        )
+
+        path_loss = self._add_indoor_loss(path_loss, indoor, link_ids,
+            monte_carlo, indoor_loss)
+
+        model = np.zeros(distance.shape, dtype=np.int8)
+
+        return np.round(path_loss, 2), model
+
+
+# Propagation models selectable by name, e.g. through
+# simulation_parameters['propagation_model'].
+PROPAGATION_MODELS = {
+    'etsi_tr_138_901': PropagationModel,
+    'uma_nlos_optional': UmaNlosOptionalModel,
+    'free_space': FreeSpaceModel,
+}
+
+
+def register_propagation_model(name, model_class):
+    """
+    Make a `BasePropagationModel` subclass selectable by name.
+
+    """
+    PROPAGATION_MODELS[name] = model_class
+
+
+def build_propagation_model(name, *args, **kwargs):
+    """
+
+    Build the named propagation model.
+
+    Parameters
+    ----------
+    name : string
+        A key of `PROPAGATION_MODELS`.
+    *args, **kwargs
+        Passed to the model, see `BasePropagationModel`.
+
+    Returns
+    -------
+    propagation_model : BasePropagationModel
+        Model exposing the batched `evaluate` interface.
+
+    """
+    if name not in PROPAGATION_MODELS:
+        raise ValueError('Did not recognise propagation model: {}'.format(name))
+
+    return PROPAGATION_MODELS[name](*args, **kwargs)
+
+
+def maximum_allowable_path_loss(target_sinr, power, gain, losses, rx_gain,
+    rx_losses, rx_misc_losses, noise, interference=0):
+    """
+
+    Largest path loss at which a link still reaches a target SINR.
+
+    Inverts the link budget of `SimulationManager.estimate_received_power`
+    and `SimulationManager.estimate_sinr`, using the same conventions.
+    All parameters broadcast against each other.
+
+    Parameters
+    ----------
+    target_sinr : array_like
+        Required Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
+    power : array_like
+        Transmitter power.
+    gain : array_like
+        Transmitter antenna gain.
+    losses : array_like
+        Transmitter losses.
+    rx_gain : array_like
+        Receiver gain.
+    rx_losses : array_like
+        Receiver losses.
+    rx_misc_losses : array_like
+        Receiver miscellaneous losses.
+    noise : array_like
+        Received noise at the UE receiver in decibels.
+    interference : array_like
+        Linear sum of interference at the receiver, as the
+        raw_sum_of_interference of `estimate_sinr`.
+
+    Returns
+    -------
+    max_path_loss : numpy.ndarray
+        Maximum allowable path loss in decibels (dB).
+
+    """
+    i_plus_n = np.asarray(interference, dtype=float) + 10**np.asarray(noise,
+        dtype=float)
+
+    received_power = np.asarray(target_sinr, dtype=float) + np.log10(i_plus_n)
+
+    eirp = np.asarray(power, dtype=float) + gain - losses
+
+    return eirp - received_power - rx_misc_losses + rx_gain - rx_losses
+
+
+def maximum_distance(max_path_loss, frequency, ant_type, environment,
+    building_height, street_width, ant_height, ue_height, type_of_sight,
+    above_roof=0, indoor=False, seed_value=None, iterations=1,
+    model='etsi_tr_138_901', min_distance=20, max_distance=None,
+    tolerance=1):
+    """
+
+    Distance at which a propagation model reaches a maximum allowable
+    path loss, for many parameter sets at once.
+
+    Each set is bracketed between `min_distance` and `max_distance` and
+    then bisected on the batched `evaluate` of the model, one model per
+    distinct (frequency, ant_height, ue_height). On the monotone branches
+    of ETSI TR 138.901 the bisection finds the single crossing.
+
+    Parameters
+    ----------
+    max_path_loss : array_like
+        Maximum allowable path loss in decibels (dB), e.g. from
+        `maximum_allowable_path_loss`.
+    frequency : array_like
+        Frequency band given in GHz.
+    ant_type : string
+        Indicates the type of site antenna (micro, macro).
+    environment : string
+        Gives the type of settlement (urban, suburban or rural).
+    building_height : int
+        Height of surrounding buildings in meters (m).
+    street_width : float
+        Width of street in meters (m).
+    ant_height : array_like
+        Height of the antenna.
+    ue_height : array_like
+        Height of the User Equipment.
+    type_of_sight : string or array_like
+        Either 'los' or 'nlos', or a per-element array of these
+        strings or of booleans (True for Line of Sight).
+    above_roof : int
+        Indicates if the propagation line is above or below building roofs.
+    indoor : bool or array_like
+        Indicates if each user is indoor (True) or outdoor (False).
+    seed_value : int
+        Dictates repeatable random number generation.
+    iterations : int
+        Specifies how many iterations a specific calculation should be run for.
+    model : string
+        Name of the model in `PROPAGATION_MODELS`.
+    min_distance : float
+        Shortest distance searched in meters (m).
+    max_distance : float
+        Longest distance searched in meters (m). Defaults to 10 km for
+        macro rural and suburban sites and 5 km otherwise, the range
+        over which ETSI TR 138.901 is defined for both types of sight.
+    tolerance : float
+        Width of the final bracket in meters (m).
+
+    Returns
+    -------
+    distance : numpy.ndarray
+        Largest distance found with a path loss within the limit, NaN
+        where even `min_distance` exceeds it, and `max_distance` where
+        the limit is not reached.
+
+    """
+    if max_distance is None:
+        if ant_type == 'macro' and environment in ('rural', 'suburban'):
+            max_distance = 10000
+        else:
+            max_distance = 5000
+
+    max_path_loss, frequency, ant_height, ue_height = np.broadcast_arrays(
+        np.asarray(max_path_loss, dtype=float),
+        np.asarray(frequency, dtype=float),
+        np.asarray(ant_height, dtype=float),
+        np.asarray(ue_height, dtype=float),
+    )
+    shape = max_path_loss.shape
+
+    los = _type_of_sight_mask(type_of_sight, shape).ravel()
+    indoor = np.broadcast_to(np.asarray(indoor, dtype=bool), shape).ravel()
+    limit = max_path_loss.ravel()
+
+    parameters = np.stack([frequency.ravel(), ant_height.ravel(),
+        ue_height.ravel()], axis=1)
+    unique, inverse = np.unique(parameters, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    propagation_models = [
+        build_propagation_model(model, row[0], ant_type, environment,
+            building_height, street_width, row[1], row[2], seed_value,
+            iterations, None, above_roof)
+        for row in unique
+    ]
+
+    def path_loss(distance, selected):
+        result = np.empty(int(selected.sum()))
+        groups = inverse[selected]
+        for idx in np.unique(groups):
+            group = groups == idx
+            result[group], _ = propagation_models[idx].evaluate(
+                distance[selected][group], los[selected][group],
+                indoor[selected][group])
+        return result
+
+    everything = np.ones(limit.size, dtype=bool)
+
+    lower = np.full(limit.size, float(min_distance))
+    upper = np.full(limit.size, float(max_distance))
+
+    within_lower = path_loss(lower, everything) <= limit
+    within_upper = path_loss(upper, everything) <= limit
+
+    distance = np.where(within_upper, upper, np.nan)
+    active = within_lower & ~within_upper
+
+    while active.any() and (upper[active] - lower[active] > tolerance).any():
+
+        middle = (lower + upper) / 2
+        within = path_loss(middle, active) <= limit[active]
+
+        idx = np.flatnonzero(active)
+        lower[idx[within]] = middle[idx[within]]
+        upper[idx[~within]] = middle[idx[~within]]
+
+    distance[active] = lower[active]
+
+    return distance.reshape(shape)
+
+
+def _type_of_sight_mask(type_of_sight, shape):
+    """
+    Convert a type of sight ('los'/'nlos' string, array of strings or
+    boolean array) into a boolean Line of Sight mask of the given shape.
+
+    """
+    if isinstance(type_of_sight, str):
+        type_of_sight = np.array(type_of_sight)
+    else:
+        type_of_sight = np.asarray(type_of_sight)
+
+    if type_of_sight.dtype == bool:
+        los = type_of_sight
+    else:
+        los = type_of_sight == 'los'
+        if not (los | (type_of_sight == 'nlos')).all():
+            raise ValueError('Did not recognise type_of_sight')
+
+    return np.broadcast_to(los, shape)
+
+
+def check_3gpp_applicability(building_height, street_width, ant_height, ue_height,
+    verbose=True):
 
     if 5 <= building_height < 50 :
         building_height_compliant = True
     else:
         building_height_compliant = False
-        print('building_height not compliant')
+        if verbose:
+            print('building_height not compliant')
 
     if 5 <= street_width < 50:
         street_width_compliant = True
     else:
         street_width_compliant = False
-        print('Street_width not compliant')
+        if verbose:
+            print('Street_width not compliant')
 
     if 10 <= ant_height < 150:
         ant_height_compliant = True
     else:
         ant_height_compliant = False
-        print('ant_height not compliant')
+        if verbose:
+            print('ant_height not compliant')
 
     if 1 <= ue_height < 10:
         ue_height_compliant = True
     else:
         ue_height_compliant = False
-        print('ue_height not compliant')
+        if verbose:
+            print('ue_height not compliant')
 
     if (building_height_compliant + street_width_compliant +
         ant_height_compliant + ue_height_compliant) == 4:
@@ -358,20 +1594,87 @@ def generate_log_normal_dist_value(frequency, mu, sigma, draws, seed_value):
 
     """
     if seed_value == None:
-        pass
+        random_state = np.random
     else:
         frequency_seed_value = seed_value * frequency * 100
 
-        np.random.seed(int(str(frequency_seed_value)[:2]))
+        random_state = np.random.RandomState(int(str(frequency_seed_value)[:2]))
 
     normal_std = np.sqrt(np.log10(1 + (sigma/mu)**2))
     normal_mean = np.log10(mu) - normal_std**2 / 2
 
-    hs = np.random.lognormal(normal_mean, normal_std, draws)
+    hs = random_state.lognormal(normal_mean, normal_std, draws)
 
     return round(np.mean(hs),2)
 
 
+def outdoor_to_indoor_path_loss_batch(frequency, indoor, seed_value,
+    shadow_fading=None, receiver_ids=None, monte_carlo=False, draws=None):
+    """
+
+    Array-in/array-out implementation of `outdoor_to_indoor_path_loss`.
+
+    The log-normal draws for every indoor receiver are made in one call.
+    Without a stream all indoor receivers share the legacy value of
+    `outdoor_to_indoor_path_loss`.
+
+    Parameters
+    ----------
+    frequency : float
+        Carrier band (f) required in GHz.
+    indoor : array_like
+        Boolean mask, True for indoor receivers.
+    seed_value : int
+        Dictates repeatable random number generation.
+    shadow_fading : ShadowFading
+        Optional `seismic.shadow_fading.ShadowFading` stream giving each
+        receiver its own draw.
+    receiver_ids : array_like
+        Integer ids used to index `shadow_fading`, with the same shape
+        as `indoor`. Defaults to the flattened element positions.
+    monte_carlo : bool
+        If True, return every draw of the stream, with shape
+        (draws,) + indoor.shape.
+    draws : int
+        Number of draws with `monte_carlo`. Defaults to the iterations
+        of `shadow_fading`.
+
+    Returns
+    -------
+    path_loss : numpy.ndarray
+        Outdoor to indoor path loss in decibels (dB), zero for outdoor
+        receivers.
+
+    """
+    indoor = np.asarray(indoor, dtype=bool)
+
+    if shadow_fading is None:
+        if monte_carlo:
+            raise ValueError('monte_carlo requires a shadow_fading stream')
+        if not indoor.any():
+            return np.zeros(indoor.shape)
+        return np.where(indoor,
+            generate_log_normal_dist_value(frequency, 12, 8, 1, seed_value), 0)
+
+    if receiver_ids is None:
+        receiver_ids = np.arange(indoor.size).reshape(indoor.shape)
+    else:
+        receiver_ids = np.broadcast_to(np.asarray(receiver_ids), indoor.shape)
+
+    if monte_carlo:
+        if draws is None:
+            draws = shadow_fading.iterations
+        path_loss = np.zeros((draws,) + indoor.shape)
+        path_loss[:, indoor] = shadow_fading.sample_draws(12, 8,
+            receiver_ids[indoor], draws)
+    else:
+        path_loss = np.zeros(indoor.shape)
+        path_loss[indoor] = shadow_fading.sample(12, 8, receiver_ids[indoor],
+            draws=1)
+
+    return path_loss
+
+
 def outdoor_to_indoor_path_loss(frequency, indoor, seed_value):
     """
 
@@ -0,0 +1,395 @@
+"""
+Precomputed path loss lookup tables.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+Tabulates `path_loss_calculator` over a dense grid of frequency,
+antenna height, environment, type of sight and distance. The grid is
+written to disk as uncompressed .npy files, which are memory-mapped
+read-only on load. Worker processes that open the same table therefore
+share one copy in the page cache. Queries interpolate linearly along
+distance, and fall back to the analytic model whenever a query is off
+the grid or exceeds the requested error bound.
+
+"""
+import os
+import json
+import numpy as np
+
+from seismic.path_loss import (PropagationModel, generate_log_normal_dist_value,
+    _type_of_sight_mask)
+
+
+TYPES_OF_SIGHT = ('los', 'nlos')
+
+# Distances checked within each grid interval whose end nodes come from
+# different branches of the model.
+BRANCH_CHECKS = 32
+
+
+def build_path_loss_lut(path, frequencies, distances, ant_heights,
+    environments, ant_type, building_height, street_width, ue_height,
+    above_roof, seed_value, iterations, checks_per_interval=8):
+    """
+
+    Precompute path loss over a grid and write it to disk.
+
+    Parameters
+    ----------
+    path : string
+        Directory the table is written to.
+    frequencies : list of floats
+        Frequency bands in GHz.
+    distances : array_like
+        Increasing distances in meters (m).
+    ant_heights : list of floats
+        Heights of the antenna.
+    environments : list of strings
+        Settlement types (urban, suburban or rural).
+    ant_type : string
+        Indicates the type of site antenna (micro, macro).
+    building_height : int
+        Height of surrounding buildings in meters (m).
+    street_width : float
+        Width of street in meters (m).
+    ue_height : float
+        Height of the User Equipment.
+    above_roof : int
+        Indicates if the propagation line is above or below building roofs.
+    seed_value : int
+        Dictates repeatable random number generation.
+    iterations : int
+        Specifies how many iterations a specific calculation should be run for.
+    checks_per_interval : int
+        Number of evenly spaced distances within each grid interval at
+        which the interpolation error is measured.
+
+    Returns
+    -------
+    metadata : dict
+        Table axes, fixed parameters and the measured interpolation
+        error for each (frequency, ant_height, environment,
+        type_of_sight) row.
+
+    Notes
+    -----
+    The error of a row is the largest difference between interpolated
+    and analytic path loss at the distances given by `_check_distances`:
+    the midpoint and `checks_per_interval` other distances within every
+    interval, the model
+    breakpoint, and a denser sample of each interval where the model
+    changes branch.
+
+    """
+    distances = np.asarray(distances, dtype=float)
+    if distances.ndim != 1 or (np.diff(distances) <= 0).any():
+        raise ValueError('distances must be a strictly increasing 1D array')
+
+    if checks_per_interval < 1:
+        raise ValueError('checks_per_interval must be at least 1')
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    shape = (len(frequencies), len(ant_heights), len(environments),
+        len(TYPES_OF_SIGHT), len(distances))
+
+    path_loss = np.lib.format.open_memmap(os.path.join(path, 'path_loss.npy'),
+        mode='w+', dtype=np.float32, shape=shape)
+    model = np.lib.format.open_memmap(os.path.join(path, 'model.npy'),
+        mode='w+', dtype=np.int8, shape=shape)
+    max_error = np.zeros(shape[:-1])
+
+    for f_idx, frequency in enumerate(frequencies):
+        for h_idx, ant_height in enumerate(ant_heights):
+            for e_idx, environment in enumerate(environments):
+
+                propagation_model = PropagationModel(frequency, ant_type,
+                    environment, building_height, street_width, ant_height,
+                    ue_height, seed_value, iterations, None, above_roof)
+
+                for s_idx, type_of_sight in enumerate(TYPES_OF_SIGHT):
+
+                    row, codes = _evaluate_row(propagation_model, distances,
+                        type_of_sight)
+                    path_loss[f_idx, h_idx, e_idx, s_idx] = row
+                    model[f_idx, h_idx, e_idx, s_idx] = codes
+
+                    checks = _check_distances(propagation_model, distances,
+                        codes, checks_per_interval)
+                    exact, _ = _evaluate_row(propagation_model, checks,
+                        type_of_sight)
+                    interpolated = np.interp(checks, distances, row)
+                    error = np.abs(interpolated - exact)
+                    max_error[f_idx, h_idx, e_idx, s_idx] = (
+                        np.nanmax(error) if np.isfinite(error).any() else np.inf
+                    )
+
+    path_loss.flush()
+    model.flush()
+
+    metadata = {
+        'frequencies': [float(f) for f in frequencies],
+        'ant_heights': [float(h) for h in ant_heights],
+        'environments': list(environments),
+        'types_of_sight': list(TYPES_OF_SIGHT),
+        'distance_min': float(distances[0]),
+        'distance_max': float(distances[-1]),
+        'ant_type': ant_type,
+        'building_height': building_height,
+        'street_width': street_width,
+        'ue_height': ue_height,
+        'above_roof': above_roof,
+        'seed_value': seed_value,
+        'iterations': iterations,
+        'max_error_db': max_error.tolist(),
+    }
+
+    np.save(os.path.join(path, 'distances.npy'), distances)
+
+    with open(os.path.join(path, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=1)
+
+    return metadata
+
+
+def _check_distances(propagation_model, distances, codes,
+    checks_per_interval):
+    """
+    Distances at which the interpolation error of a row is measured.
+
+    Linear interpolation is worst where the path loss has a kink, which
+    falls between grid nodes: at the breakpoint d_bp (RMa) or d'_bp (UMa
+    and UMi), and wherever the branch changes from one node to the next.
+
+    """
+    def within(intervals, count):
+        fractions = np.linspace(0, 1, count + 2)[1:-1]
+        return (distances[intervals, None] + fractions *
+            (distances[intervals + 1] - distances[intervals])[:, None]).ravel()
+
+    intervals = np.arange(len(distances) - 1)
+    checks = [within(intervals, 1), within(intervals, checks_per_interval)]
+
+    if propagation_model.scenario == 'rma':
+        checks.append([propagation_model.dbp])
+    else:
+        checks.append([propagation_model.d_apost_bp])
+
+    changes = np.flatnonzero(codes[:-1] != codes[1:])
+    checks.append(within(changes, BRANCH_CHECKS))
+
+    checks = np.unique(np.concatenate(checks))
+
+    return checks[(checks > distances[0]) & (checks < distances[-1])]
+
+
+def _evaluate_row(propagation_model, distances, type_of_sight):
+    """
+    Outdoor path loss along one row of the table. Distances the model
+    does not define are stored as NaN with a model code of -1.
+
+    """
+    try:
+        return propagation_model.etsi_tr_138_901(distances, type_of_sight)
+    except ValueError:
+        pass
+
+    row = np.full(distances.shape, np.nan)
+    codes = np.full(distances.shape, -1, dtype=np.int8)
+
+    for idx, distance in enumerate(distances):
+        try:
+            row[idx], codes[idx] = propagation_model.etsi_tr_138_901(
+                distance, type_of_sight)
+        except ValueError:
+            continue
+
+    return row, codes
+
+
+class PathLossLUT(object):
+    """
+
+    Read-only, memory-mapped path loss lookup table.
+
+    Parameters
+    ----------
+    path : string
+        Directory written by `build_path_loss_lut`.
+    max_error_db : float
+        Largest acceptable interpolation error in decibels. Rows of the
+        table whose measured error is larger are answered by the
+        analytic model instead. None accepts every row.
+
+    """
+    def __init__(self, path, max_error_db=None):
+
+        self.path = path
+        self.max_error_db = max_error_db
+
+        with open(os.path.join(path, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+
+        self._open()
+
+
+    def _open(self):
+        self.distances = np.load(os.path.join(self.path, 'distances.npy'))
+        self.path_loss = np.load(os.path.join(self.path, 'path_loss.npy'),
+            mmap_mode='r')
+        self.model = np.load(os.path.join(self.path, 'model.npy'),
+            mmap_mode='r')
+        self.max_error = np.asarray(self.metadata['max_error_db'])
+
+
+    def __getstate__(self):
+        # Workers reopen the mapping rather than receiving a pickled copy.
+        return {
+            'path': self.path,
+            'max_error_db': self.max_error_db,
+            'metadata': self.metadata,
+        }
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+
+    def propagation_model(self, frequency, ant_type, environment,
+        building_height, street_width, ant_height, ue_height, seed_value=None,
+        iterations=1, shadow_fading=None, above_roof=0, exact=False):
+        """
+        Return a model with the `PropagationModel.evaluate` interface
+        backed by this table, or the analytic `PropagationModel` when
+        the table does not cover these parameters or `exact` is True.
+
+        """
+        analytic = PropagationModel(frequency, ant_type, environment,
+            building_height, street_width, ant_height, ue_height, seed_value,
+            iterations, shadow_fading, above_roof)
+
+        if exact or shadow_fading is not None:
+            return analytic
+
+        metadata = self.metadata
+        fixed = (
+            (ant_type, metadata['ant_type']),
+            (building_height, metadata['building_height']),
+            (street_width, metadata['street_width']),
+            (ue_height, metadata['ue_height']),
+            (above_roof, metadata['above_roof']),
+            (seed_value, metadata['seed_value']),
+            (iterations, metadata['iterations']),
+        )
+        if any(value != expected for value, expected in fixed):
+            return analytic
+
+        f_idx = _node_index(metadata['frequencies'], frequency)
+        h_idx = _node_index(metadata['ant_heights'], ant_height)
+        if f_idx is None or h_idx is None or \
+            environment not in metadata['environments']:
+            return analytic
+        e_idx = metadata['environments'].index(environment)
+
+        errors = self.max_error[f_idx, h_idx, e_idx]
+        if self.max_error_db is not None and (errors > self.max_error_db).all():
+            return analytic
+
+        return TabulatedPropagationModel(self, (f_idx, h_idx, e_idx), analytic,
+            self.max_error_db)
+
+
+def _node_index(nodes, value):
+    """
+    Index of the grid node equal to value, or None.
+
+    """
+    matches = np.flatnonzero(np.isclose(nodes, value, rtol=0, atol=1e-9))
+
+    return int(matches[0]) if len(matches) else None
+
+
+class TabulatedPropagationModel(object):
+    """
+
+    One (frequency, ant_height, environment) slice of a `PathLossLUT`,
+    answering `evaluate` by linear interpolation along distance.
+
+    Distances outside the table, undefined entries and any type of sight
+    whose row exceeds `max_error_db` are passed to the analytic model.
+
+    """
+    def __init__(self, lut, index, analytic, max_error_db=None):
+
+        self.lut = lut
+        self.index = index
+        self.analytic = analytic
+        self.max_error_db = max_error_db
+
+        self.indoor_loss = generate_log_normal_dist_value(
+            analytic.frequency, 12, 8, 1, analytic.seed_value)
+
+
+    def evaluate(self, distances, type_of_sight, indoor=False, link_ids=None,
+        indoor_loss=None):
+        """
+        Path loss including outdoor to indoor loss, matching
+        `PropagationModel.evaluate` within the table's error bound.
+
+        """
+        path_loss, model = self.etsi_tr_138_901(distances, type_of_sight,
+            link_ids)
+
+        indoor = np.broadcast_to(np.asarray(indoor, dtype=bool), path_loss.shape)
+        if indoor_loss is not None:
+            path_loss = path_loss + indoor_loss
+        elif indoor.any():
+            path_loss = np.where(indoor, path_loss + self.indoor_loss, path_loss)
+
+        return np.round(path_loss), model
+
+
+    def etsi_tr_138_901(self, distances, type_of_sight, link_ids=None):
+        """
+        Interpolated outdoor path loss and model codes.
+
+        """
+        distance = np.asarray(distances, dtype=float)
+        shape = distance.shape
+        distance = distance.ravel()
+
+        los = _type_of_sight_mask(type_of_sight, shape).ravel()
+
+        lut = self.lut
+        grid = lut.distances
+
+        path_loss = np.empty(distance.size)
+        model = np.empty(distance.size, dtype=np.int8)
+        fallback = (distance < grid[0]) | (distance > grid[-1])
+
+        for s_idx, mask in enumerate((los, ~los)):
+            if not mask.any():
+                continue
+            row_index = self.index + (s_idx,)
+            if self.max_error_db is not None and \
+                lut.max_error[row_index] > self.max_error_db:
+                fallback |= mask
+                continue
+            row = lut.path_loss[row_index]
+            d = distance[mask]
+            path_loss[mask] = np.interp(d, grid, row)
+            lower = np.clip(np.searchsorted(grid, d, side='right') - 1,
+                0, len(grid) - 1)
+            model[mask] = lut.model[row_index][lower]
+
+        fallback |= ~np.isfinite(path_loss)
+
+        if fallback.any():
+            path_loss[fallback], model[fallback] = self.analytic.etsi_tr_138_901(
+                distance[fallback], los[fallback])
+
+        return path_loss.reshape(shape), model.reshape(shape)
+
@@ -0,0 +1,352 @@
+"""
+Streaming quantile sketches.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+A `QuantileSketch` estimates percentiles of a stream of values without
+keeping them. It is a KLL sketch: values are held in a stack of
+compactors, where an item at level h stands for 2**h values. Whenever a
+level fills, it is sorted and every other item, starting from a random
+offset, is promoted to the level above. Level capacities shrink
+geometrically towards the bottom, so the number of items retained stays
+below about 3k, however many values are added. The normalised rank error
+of any percentile is then proportional to 1/k, around 1% for the
+default k=200.
+
+Sketches built from different link budget chunks, Monte Carlo draws or
+worker processes can be merged, and give the same error bounds as one
+sketch fed every value. `LinkBudgetSketches` keeps one sketch per link
+budget metric, for example:
+
+    sketches = LinkBudgetSketches()
+    for chunk in manager.iter_link_budget(...):
+        sketches.update(chunk)
+    sketches.percentiles(CONFIDENCE_INTERVALS)
+
+"""
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Metrics sketched by default by `LinkBudgetSketches`.
+SKETCH_METRICS = ('sinr', 'spectral_efficiency', 'capacity_mbps',
+    'capacity_mbps_km2')
+
+
+class QuantileSketch(object):
+    """
+
+    Mergeable streaming quantile sketch (KLL).
+
+    Parameters
+    ----------
+    k : int
+        Capacity of the top compactor. Memory grows and error shrinks
+        linearly with k.
+    seed : int or numpy.random.SeedSequence
+        Seed of the random compaction offsets. None gives a
+        non-repeatable sketch.
+
+    """
+    def __init__(self, k=200, seed=None):
+
+        if k < 8:
+            raise ValueError('Sketch size k must be at least 8')
+
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+        self.levels = [np.empty(0)]
+        self._size = 0
+        self._random = np.random.default_rng(seed)
+
+
+    def __len__(self):
+        return self.count
+
+
+    @property
+    def size(self):
+        """
+        Number of items retained.
+
+        """
+        return self._size
+
+
+    def capacity(self, level):
+        """
+        Number of items a level can hold before it is compacted.
+
+        """
+        depth = len(self.levels) - 1 - level
+
+        return max(2, int(np.ceil(self.k * (2 / 3)**depth)))
+
+
+    def update(self, values):
+        """
+        Add a value or an array of values. NaN values are ignored.
+
+        Returns
+        -------
+        sketch : QuantileSketch
+            This sketch, so that calls can be chained.
+
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+
+        if not len(values):
+            return self
+
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._size += len(values)
+
+        self._compress()
+
+        return self
+
+
+    def merge(self, other):
+        """
+        Add every value summarised by another sketch of the same k.
+
+        Returns
+        -------
+        sketch : QuantileSketch
+            This sketch, so that calls can be chained.
+
+        """
+        if other.k != self.k:
+            raise ValueError('Cannot merge sketches of k {} and {}'.format(
+                self.k, other.k))
+
+        if not other.count:
+            return self
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], items))
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._size += other._size
+
+        self._compress()
+
+        return self
+
+
+    def quantile(self, q):
+        """
+
+        Estimate quantiles of the values added so far.
+
+        Parameters
+        ----------
+        q : float or array_like
+            Quantiles between 0 and 1.
+
+        Returns
+        -------
+        values : float or numpy.ndarray
+            The retained item at each quantile, NaN while the sketch is
+            empty. 0 and 1 give the exact minimum and maximum.
+
+        """
+        q = np.asarray(q, dtype=float)
+
+        if ((q < 0) | (q > 1)).any():
+            raise ValueError('Quantiles must be between 0 and 1')
+
+        if not self.count:
+            return _as_output(np.full(q.shape, np.nan))
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2**h, dtype=np.int64)
+            for h, level in enumerate(self.levels)])
+
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+
+        idx = np.searchsorted(cumulative, q * self.count, side='left')
+        values = items[np.minimum(idx, len(items) - 1)]
+
+        values = np.where(q == 0, self.min, values)
+        values = np.where(q == 1, self.max, values)
+
+        return _as_output(values)
+
+
+    def percentile(self, percentiles):
+        """
+        Estimate percentiles (0 to 100) of the values added so far.
+
+        """
+        return self.quantile(np.asarray(percentiles, dtype=float) / 100)
+
+
+    def _compress(self):
+        """
+        Compact the lowest full level until the items fit.
+
+        """
+        while self._size > sum(self.capacity(level)
+            for level in range(len(self.levels))):
+
+            for level, items in enumerate(self.levels):
+                if len(items) >= self.capacity(level):
+                    self._compact(level)
+                    break
+
+
+    def _compact(self, level):
+        """
+        Promote every other item of a sorted level to the one above. One
+        item stays behind when the level holds an odd number.
+
+        """
+        items = np.sort(self.levels[level])
+        paired = len(items) - len(items) % 2
+
+        offset = self._random.integers(2)
+        promoted = items[offset:paired:2]
+
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+
+        self.levels[level] = items[paired:]
+        self.levels[level + 1] = np.concatenate((self.levels[level + 1],
+            promoted))
+
+        self._size -= paired // 2
+
+
+class LinkBudgetSketches(OrderedDict):
+    """
+
+    One `QuantileSketch` per link budget metric.
+
+    Parameters
+    ----------
+    metrics : list of strings
+        Link budget columns to sketch.
+    k : int
+        Sketch size, as taken by `QuantileSketch`.
+    seed : int or list of ints
+        Seed of the compaction offsets, from which each metric is given
+        its own stream. None gives non-repeatable sketches.
+
+    """
+    def __init__(self, metrics=SKETCH_METRICS, k=200, seed=None):
+
+        super().__init__()
+
+        seeds = np.random.SeedSequence(seed).spawn(len(metrics))
+
+        for metric, metric_seed in zip(metrics, seeds):
+            self[metric] = QuantileSketch(k, metric_seed)
+
+
+    def update(self, results):
+        """
+
+        Add a block of link budget results.
+
+        Parameters
+        ----------
+        results : LinkBudgetColumns, DataFrame, Table or list of dicts
+            Any output of `SimulationManager.estimate_link_budget` or
+            `iter_link_budget`.
+
+        Returns
+        -------
+        sketches : LinkBudgetSketches
+            These sketches, so that calls can be chained.
+
+        """
+        for metric, sketch in self.items():
+            if isinstance(results, list):
+                values = [result[metric] for result in results]
+            else:
+                values = results[metric]
+            sketch.update(np.asarray(values, dtype=float))
+
+        return self
+
+
+    def merge(self, other):
+        """
+        Merge the sketches of another instance, metric by metric.
+
+        """
+        for metric, sketch in self.items():
+            sketch.merge(other[metric])
+
+        return self
+
+
+    def percentiles(self, percentiles):
+        """
+
+        Estimate percentiles of every metric.
+
+        Parameters
+        ----------
+        percentiles : list of ints
+            Percentiles to estimate, such as CONFIDENCE_INTERVALS.
+
+        Returns
+        -------
+        values : OrderedDict
+            Estimates keyed as '<metric>_p<percentile>'.
+
+        """
+        values = OrderedDict()
+
+        for metric, sketch in self.items():
+            estimates = np.atleast_1d(sketch.percentile(percentiles))
+            for percentile, value in zip(percentiles, estimates):
+                values['{}_p{}'.format(metric, percentile)] = float(value)
+
+        return values
+
+
+def sketch_link_budget(task, result, seed=0):
+    """
+    Sketch of one link budget result. It can be passed as `summarise` to
+    `seismic.sweep.run_sweep`, so that workers return small sketches,
+    which are then merged with `LinkBudgetSketches.merge`.
+
+    The sketches are seeded from `seed` and the task, so a sweep gives
+    the same sketches whichever process runs each task.
+
+    """
+    task_seed = zlib.crc32(repr(tuple(task)).encode('utf-8'))
+
+    return LinkBudgetSketches(seed=[seed, task_seed]).update(result)
+
+
+def _as_output(values):
+    """
+    Return a float for scalar inputs and an array otherwise.
+
+    """
+    if values.ndim == 0:
+        return float(values)
+
+    return values
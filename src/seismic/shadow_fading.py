@@ -0,0 +1,246 @@
+"""
+Shadow fading random number streams.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+The log-normal shadow fading terms used by the path loss models are
+drawn from counter-based Philox streams. Each stream is keyed by the
+simulation seed, scenario, generation, environment and frequency, and
+every link owns a fixed block of counters within it. The draws for a
+link therefore depend only on its key and link id. Any subset of links
+can be sampled in bulk, in any order and in any process, and gives the
+same values.
+
+"""
+import zlib
+import numpy as np
+
+from seismic.path_loss import generate_log_normal_dist_value
+
+
+# Largest gap between link ids drawn in a single generator call.
+MAX_GAP = 64
+
+
+class ShadowFading(object):
+    """
+
+    Shadow fading stream for a single simulation configuration.
+
+    Parameters
+    ----------
+    seed_value : int
+        Dictates repeatable random number generation. None gives a
+        non-repeatable stream.
+    frequency : float
+        The carrier frequency for the chosen spectrum band (GHz).
+    scenario : string
+        Scenario name (e.g. baseline).
+    generation : string
+        The technology generation type.
+    environment : string
+        Either urban, suburban or rural.
+    iterations : int
+        Number of draws averaged for each link.
+    legacy : bool
+        If True, reproduce `generate_log_normal_dist_value`, which gives
+        the same value to every link.
+
+    """
+    def __init__(self, seed_value, frequency, scenario=None, generation=None,
+        environment=None, iterations=1, legacy=False):
+
+        self.seed_value = seed_value
+        self.frequency = frequency
+        self.scenario = scenario
+        self.generation = generation
+        self.environment = environment
+        self.iterations = iterations
+        self.legacy = legacy
+
+        if seed_value is None:
+            self._entropy = np.random.SeedSequence().entropy
+        else:
+            self._entropy = int(seed_value)
+
+
+    def __eq__(self, other):
+        # Streams with the same settings give the same draws, so they
+        # can share cached models.
+        return (isinstance(other, ShadowFading) and
+            self._settings() == other._settings())
+
+
+    def __hash__(self):
+        return hash(self._settings())
+
+
+    def _settings(self):
+        return (self._entropy, self.frequency, self.scenario, self.generation,
+            self.environment, self.iterations, self.legacy)
+
+
+    def sample(self, mu, sigma, link_ids, draws=None):
+        """
+        Mean shadow fading value for each link, as returned by
+        `generate_log_normal_dist_value`.
+
+        Parameters
+        ----------
+        mu : float
+            Mean of the desired distribution.
+        sigma : float
+            Standard deviation of the desired distribution.
+        link_ids : array_like
+            Non-negative integer link ids.
+        draws : int
+            Number of values averaged per link. Defaults to `iterations`.
+
+        Returns
+        -------
+        random_variation : numpy.ndarray
+            Mean of the random variation for each link.
+
+        """
+        if draws is None:
+            draws = self.iterations
+
+        link_ids = np.asarray(link_ids)
+
+        if self.legacy:
+            return np.full(link_ids.shape, generate_log_normal_dist_value(
+                self.frequency, mu, sigma, draws, self.seed_value))
+
+        return np.round(self.sample_draws(mu, sigma, link_ids, draws).mean(axis=0), 2)
+
+
+    def sample_draws(self, mu, sigma, link_ids, draws=None):
+        """
+        Individual shadow fading draws for each link.
+
+        Parameters
+        ----------
+        mu : float
+            Mean of the desired distribution.
+        sigma : float
+            Standard deviation of the desired distribution.
+        link_ids : array_like
+            Non-negative integer link ids.
+        draws : int
+            Number of values per link. Defaults to `iterations`.
+
+        Returns
+        -------
+        hs : numpy.ndarray
+            Array of shape (draws,) + link_ids.shape.
+
+        """
+        if draws is None:
+            draws = self.iterations
+
+        link_ids = np.asarray(link_ids, dtype=np.int64)
+
+        normal_std = np.sqrt(np.log10(1 + (sigma/mu)**2))
+        normal_mean = np.log10(mu) - normal_std**2 / 2
+
+        if self.legacy:
+            if self.seed_value == None:
+                hs = np.random.lognormal(normal_mean, normal_std, draws)
+            else:
+                hs = _legacy_random_state(self.frequency, self.seed_value).lognormal(
+                    normal_mean, normal_std, draws)
+            return np.broadcast_to(
+                hs.reshape((draws,) + (1,) * link_ids.ndim),
+                (draws,) + link_ids.shape
+            ).copy()
+
+        z = self._standard_normal(mu, sigma, link_ids.ravel(), draws)
+
+        hs = np.exp(normal_mean + normal_std * z)
+
+        return hs.T.reshape((draws,) + link_ids.shape)
+
+
+    def _standard_normal(self, mu, sigma, link_ids, draws):
+        """
+        Standard normal draws of shape (links, draws) using the
+        Box-Muller transform, so each draw consumes exactly two
+        uniforms and each link maps to a fixed counter block.
+
+        """
+        if (link_ids < 0).any():
+            raise ValueError('link_ids must be non-negative')
+
+        words = 2 * draws
+        blocks = -(-words // 4)
+
+        unique, inverse = np.unique(link_ids, return_inverse=True)
+        uniforms = np.empty((len(unique), blocks * 4))
+
+        key = self._key(mu, sigma)
+
+        #ids closer than MAX_GAP share one generator call, and the
+        #counters of the ids in between are drawn and discarded
+        breaks = np.flatnonzero(np.diff(unique) > MAX_GAP) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(unique)]))
+
+        for start, end in zip(starts, ends):
+            first = int(unique[start])
+            span = int(unique[end - 1]) - first + 1
+            counter = first * blocks
+            bit_generator = np.random.Philox(
+                key=key,
+                counter=[counter & 0xFFFFFFFFFFFFFFFF, counter >> 64, 0, 0]
+            )
+            values = np.random.Generator(bit_generator).random(
+                span * blocks * 4).reshape(span, blocks * 4)
+            uniforms[start:end] = values[unique[start:end] - first]
+
+        u1 = uniforms[:, 0:words:2]
+        u2 = uniforms[:, 1:words:2]
+
+        z = np.sqrt(-2 * np.log1p(-u1)) * np.cos(2 * np.pi * u2)
+
+        return z[inverse.ravel()]
+
+
+    def _key(self, mu, sigma):
+        """
+        Philox key for one shadow fading term of this stream.
+
+        """
+        spawn_key = (
+            _hash_label(self.scenario),
+            _hash_label(self.generation),
+            _hash_label(self.environment),
+            int(round(self.frequency * 1e6)),
+            int(round(mu * 1e3)),
+            int(round(sigma * 1e3)),
+        )
+
+        seed_sequence = np.random.SeedSequence(self._entropy, spawn_key=spawn_key)
+
+        return seed_sequence.generate_state(2, np.uint64)
+
+
+def _hash_label(label):
+    """
+    Stable non-negative integer for a string label.
+
+    """
+    if label is None:
+        return 0
+
+    return zlib.crc32(str(label).encode('utf-8'))
+
+
+def _legacy_random_state(frequency, seed_value):
+    """
+    RandomState seeded the same way as `generate_log_normal_dist_value`.
+
+    """
+    frequency_seed_value = seed_value * frequency * 100
+
+    return np.random.RandomState(int(str(frequency_seed_value)[:2]))
@@ -0,0 +1,303 @@
+"""
+Parallel parameter sweeps.
+
+Author: Edward Oughton
+Date: Adapted June 2021
+
+Expands the scenario, antenna type, environment, site radius and
+spectrum settings in `params.py` into a list of tasks, and runs the link
+budget for each on a process pool.
+
+The receiver columns of every site geometry are written once to shared
+memory. Workers map them rather than receiving a pickled copy with each
+task, and build one `SimulationManager` per geometry, scenario and
+antenna type, which later tasks reuse. Results are returned in task
+order, whatever the number of processes.
+
+Shared memory needs Python 3.8 or later. On earlier versions each worker
+receives one pickled copy of the geometries when it starts.
+
+"""
+import multiprocessing
+from collections import namedtuple, OrderedDict
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+import numpy as np
+
+from seismic.system_simulator import SimulationManager, ReceiverArrays
+
+
+SweepTask = namedtuple('SweepTask', [
+    'scenario',
+    'ant_type',
+    'environment',
+    'site_radius',
+    'frequency',
+    'bandwidth',
+    'generation',
+    'transmission_type',
+])
+
+# Order of the receiver columns within each shared memory block.
+RECEIVER_COLUMNS = ('x', 'y', 'ue_height', 'gain', 'losses', 'misc_losses',
+    'indoor')
+
+
+def expand_sweep(parameters, spectrum_portfolio, ant_types, environments,
+    site_radii):
+    """
+
+    Expand the sweep settings into a list of tasks.
+
+    Parameters
+    ----------
+    parameters : dict
+        Simulation parameters keyed by scenario (PARAMETERS).
+    spectrum_portfolio : list of tuples
+        (frequency, bandwidth, generation, transmission_type) for each
+        band (SPECTRUM_PORTFOLIO).
+    ant_types : list of strings
+        Antenna types (ANT_TYPES).
+    environments : list of strings
+        Settlement types (ENVIRONMENTS).
+    site_radii : dict
+        Site radii in meters (m), keyed by antenna type and then
+        environment (SITE_RADII). Generators are read once.
+
+    Returns
+    -------
+    tasks : list of SweepTask
+        One task per combination, ordered by scenario, antenna type,
+        environment, site radius and band.
+
+    """
+    if isinstance(ant_types, str):
+        ant_types = [ant_types]
+
+    radii = {}
+    for ant_type in ant_types:
+        for environment in environments:
+            radii[ant_type, environment] = list(
+                site_radii.get(ant_type, {}).get(environment, []))
+
+    tasks = []
+
+    for scenario in parameters:
+        for ant_type in ant_types:
+            for environment in environments:
+                for site_radius in radii[ant_type, environment]:
+                    for frequency, bandwidth, generation, transmission_type \
+                        in spectrum_portfolio:
+                        tasks.append(SweepTask(scenario, ant_type, environment,
+                            site_radius, frequency, bandwidth, generation,
+                            transmission_type))
+
+    return tasks
+
+
+def run_sweep(tasks, geometries, parameters, modulation_and_coding_lut,
+    processes=None, output='arrays', summarise=None):
+    """
+
+    Run the link budget for every task.
+
+    Parameters
+    ----------
+    tasks : list of SweepTask
+        Tasks, as given by `expand_sweep`.
+    geometries : dict
+        (transmitter, interfering_transmitters, site_area, receivers)
+        keyed by site radius, as taken by `SimulationManager`.
+        receivers may be a list of dicts or a `ReceiverArrays`.
+    parameters : dict
+        Simulation parameters keyed by scenario (PARAMETERS).
+    modulation_and_coding_lut : dict
+        A lookup table containing modulation and coding rates,
+        spectral efficiencies and SINR estimates.
+    processes : int
+        Number of worker processes. Defaults to the number of cores.
+        With 1 the tasks run in this process.
+    output : string
+        Result format, as taken by `SimulationManager.estimate_link_budget`.
+    summarise : function
+        Optional function applied to each result within the worker, as
+        summarise(task, result), so that only its return value is sent
+        back. It must be importable by the workers.
+
+    Returns
+    -------
+    results : list of tuples
+        (task, result) for every task, in task order.
+
+    """
+    tasks = list(tasks)
+
+    missing = set(task.site_radius for task in tasks) - set(geometries)
+    if missing:
+        raise ValueError('No geometry for site radius: {}'.format(
+            sorted(missing)))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(tasks)))
+
+    if processes == 1:
+        _initialise_worker(geometries, parameters, modulation_and_coding_lut,
+            output, summarise, shared=False)
+        try:
+            return [(task, _run_task(task)) for task in tasks]
+        finally:
+            _WORKER.clear()
+
+    if shared_memory is None:
+        with multiprocessing.Pool(processes, _initialise_worker,
+            (geometries, parameters, modulation_and_coding_lut, output,
+            summarise, False)) as pool:
+            results = pool.map(_run_task, tasks, chunksize=1)
+
+        return list(zip(tasks, results))
+
+    blocks = []
+    try:
+        shared = OrderedDict()
+        for key, geometry in geometries.items():
+            block, spec = _share_geometry(geometry)
+            blocks.append(block)
+            shared[key] = spec
+
+        with multiprocessing.Pool(processes, _initialise_worker,
+            (shared, parameters, modulation_and_coding_lut, output,
+            summarise, True)) as pool:
+            results = pool.map(_run_task, tasks, chunksize=1)
+
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return list(zip(tasks, results))
+
+
+def _receiver_arrays(receivers):
+    """
+    Receiver columns for a list of receiver dicts or a `ReceiverArrays`.
+
+    """
+    if isinstance(receivers, ReceiverArrays):
+        return receivers
+
+    return ReceiverArrays.from_features(receivers)
+
+
+def _share_geometry(geometry):
+    """
+    Copy the receiver columns of a geometry into a new shared memory
+    block.
+
+    Returns the block, and the specification a worker needs to map it:
+    the sites and site area, the receiver ids, the block name and the
+    number of receivers.
+
+    """
+    transmitter, interfering_transmitters, site_area, receivers = geometry
+
+    receivers = _receiver_arrays(receivers)
+    quantity = len(receivers)
+
+    block = shared_memory.SharedMemory(create=True,
+        size=max(1, len(RECEIVER_COLUMNS) * quantity * 8))
+
+    columns = np.ndarray((len(RECEIVER_COLUMNS), quantity), dtype=float,
+        buffer=block.buf)
+    columns[0] = receivers.x
+    columns[1] = receivers.y
+    columns[2] = receivers.ue_height
+    columns[3] = receivers.gain
+    columns[4] = receivers.losses
+    columns[5] = receivers.misc_losses
+    columns[6] = receivers.indoor
+
+    spec = (transmitter, interfering_transmitters, site_area, receivers.ids,
+        block.name, quantity)
+
+    return block, spec
+
+
+def _map_geometry(spec):
+    """
+    Map a shared geometry within a worker.
+
+    """
+    transmitter, interfering_transmitters, site_area, ids, name, quantity = spec
+
+    block = shared_memory.SharedMemory(name=name)
+
+    columns = np.ndarray((len(RECEIVER_COLUMNS), quantity), dtype=float,
+        buffer=block.buf)
+
+    receivers = ReceiverArrays(ids, columns[0:2].T, columns[2], columns[3],
+        columns[4], columns[5], columns[6])
+
+    return transmitter, interfering_transmitters, site_area, receivers, block
+
+
+# State of the current worker process, set by `_initialise_worker`.
+_WORKER = {}
+
+
+def _initialise_worker(geometries, parameters, modulation_and_coding_lut,
+    output, summarise, shared):
+    """
+    Store the sweep settings in a worker. Shared geometries are mapped,
+    and the others are used as given.
+
+    """
+    _WORKER.clear()
+
+    if shared:
+        _WORKER['geometries'] = OrderedDict(
+            (key, _map_geometry(spec)) for key, spec in geometries.items())
+    else:
+        _WORKER['geometries'] = OrderedDict(
+            (key, (transmitter, interfering_transmitters, site_area,
+                _receiver_arrays(receivers), None))
+            for key, (transmitter, interfering_transmitters, site_area,
+                receivers) in geometries.items()
+        )
+    _WORKER['parameters'] = parameters
+    _WORKER['modulation_and_coding_lut'] = modulation_and_coding_lut
+    _WORKER['output'] = output
+    _WORKER['summarise'] = summarise
+    _WORKER['managers'] = {}
+
+
+def _run_task(task):
+    """
+    Link budget for one task within a worker.
+
+    """
+    simulation_parameters = _WORKER['parameters'][task.scenario]
+
+    key = (task.site_radius, task.scenario, task.ant_type)
+    manager = _WORKER['managers'].get(key)
+
+    if manager is None:
+        transmitter, interfering_transmitters, site_area, receivers, _ = \
+            _WORKER['geometries'][task.site_radius]
+        manager = SimulationManager(transmitter, interfering_transmitters,
+            task.ant_type, receivers, site_area, simulation_parameters)
+        _WORKER['managers'][key] = manager
+
+    result = manager.estimate_link_budget(task.frequency, task.bandwidth,
+        task.generation, task.ant_type, task.transmission_type,
+        task.environment, _WORKER['modulation_and_coding_lut'],
+        simulation_parameters, vectorised=True, output=_WORKER['output'])
+
+    if _WORKER['summarise'] is not None:
+        return _WORKER['summarise'](task, result)
+
+    return result
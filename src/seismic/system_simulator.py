@@ -7,14 +7,61 @@ Author: Edward Oughton
 Date: Adapted June 2021
 
 """
-from shapely.geometry import shape, Point, LineString
+import shapely
+from shapely.geometry import shape, mapping, Point
+from shapely.strtree import STRtree
 import numpy as np
 from itertools import tee
 from collections import OrderedDict
+import json
 
-from seismic.path_loss import path_loss_calculator
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from seismic.path_loss import (build_propagation_model,
+    outdoor_to_indoor_path_loss_batch)
+from seismic.shadow_fading import ShadowFading
+from seismic.modulation_and_coding import (get_modulation_and_coding_table,
+    legacy_lookup)
+from seismic.instrumentation import StageTimings, NULL_STAGE
+from seismic.antenna import get_antenna_pattern, link_azimuth
+
+
+# Shortest link distance in meters (m). Closer receivers are clamped.
+MIN_DISTANCE = 20
+
+# Number of strongest interferers summed in the SINR, unless set by
+# simulation_parameters['strongest_interferers'].
+STRONGEST_INTERFERERS = 3
+
+# Radius in meters (m) around each receiver within which sites are
+# candidate servers and interferers in `NetworkSimulationManager`, unless
+# set by simulation_parameters['interference_radius_m'].
+INTERFERENCE_RADIUS = 10000
+
+# Link budget values shared by every receiver in a call. Columnar output
+# holds these once as metadata rather than repeating them per receiver.
+LINK_BUDGET_METADATA = ('r_model', 'i_model', 'network_load', 'noise',
+    'tranmission_type')
+
+# Formats accepted by the `output` argument of `estimate_link_budget`.
+LINK_BUDGET_OUTPUTS = ('records', 'arrays', 'dataframe', 'arrow')
+
+# Floating point types accepted by simulation_parameters['precision'] for
+# the link budget arrays.
+PRECISIONS = ('float64', 'float32')
+
+# Receivers x draws held at once by the default chunks of
+# `SimulationManager.estimate_link_budget_monte_carlo`.
+MONTE_CARLO_CHUNK_DRAWS = 10**6
 
-np.random.seed(42)
 
 class SimulationManager(object):
     """
@@ -27,7 +74,7 @@ class SimulationManager(object):
         Contains a geojson dict for the transmitter site.
     interfering_transmitters : list of dicts
         Contains dicts for each interfering transmitter site.
-    receivers : list of dicts
+    receivers : list of dicts or ReceiverArrays
         Contains a dict for each User Equipment (UE) receiver.
     site_area : list of dicts
         Contains geojson dict for the site area polygon.
@@ -38,28 +85,184 @@ class SimulationManager(object):
     def __init__(self, transmitter, interfering_transmitters, ant_type,
         receivers, site_area, simulation_parameters):
 
-        self.transmitter = Transmitter(transmitter[0], ant_type,
-            simulation_parameters)
-        self.interfering_transmitters = {}
-        self.receivers = {}
-        self.site_area = SiteArea(site_area[0])
+        transmitters = [Transmitter(transmitter[0], ant_type,
+            simulation_parameters)]
 
         for interfering_transmitter in interfering_transmitters:
-            site_id = interfering_transmitter['properties']["site_id"]
-            site_object = InterferingTransmitter(
+            transmitters.append(InterferingTransmitter(
                 interfering_transmitter, ant_type, simulation_parameters
-                )
-            self.interfering_transmitters[site_id] = site_object
+                ))
+
+        self._initialise(transmitters, receivers, SiteArea(site_area[0]),
+            simulation_parameters)
+
 
+    def _initialise(self, transmitters, receivers, site_area,
+        simulation_parameters):
+        """
+        Set up the manager from transmitter objects, with the serving
+        transmitter first, and receivers as dicts or `ReceiverArrays`.
+
+        """
+        self.transmitter = transmitters[0]
+        self.interfering_transmitters = {}
+        self.site_area = site_area
+        self.propagation_models = {}
+        self.stage_cache = {}
+        self.timings = None
+
+        for site_object in transmitters[1:]:
+            self.interfering_transmitters[site_object.id] = site_object
+
+        self._set_receivers(receivers, simulation_parameters)
+
+        #serving transmitter first, then the interfering transmitters
+        self.transmitter_coordinates = np.array(
+            [self.transmitter.coordinates[:2]] +
+            [site.coordinates[:2] for site in
+                self.interfering_transmitters.values()],
+            dtype=float
+        )
+
+
+    def _set_receivers(self, receivers, simulation_parameters):
+        """
+        Hold receivers given as a `ReceiverArrays` as they are, and
+        build `Receiver` objects and their columns from a list of dicts.
+
+        """
+        if isinstance(receivers, ReceiverArrays):
+            self.receiver_arrays = receivers
+            self._receivers = None
+            return
+
+        self._receivers = {}
         for receiver in receivers:
             receiver_id = receiver['properties']["ue_id"]
             receiver = Receiver(receiver, simulation_parameters)
-            self.receivers[receiver_id] = receiver
+            self._receivers[receiver_id] = receiver
+
+        self.receiver_arrays = ReceiverArrays.from_receivers(
+            list(self._receivers.values()))
+
+
+    @property
+    def receivers(self):
+        """
+        `Receiver` objects keyed by id. Managers given a `ReceiverArrays`
+        build them on first use.
+
+        """
+        if self._receivers is None:
+            self._receivers = OrderedDict(
+                (receiver.id, receiver)
+                for receiver in self.receiver_arrays.to_receivers()
+            )
+
+        return self._receivers
+
+
+    @classmethod
+    def from_arrays(cls, transmitter_coordinates, ant_type, receivers,
+        site_area, simulation_parameters, site_ids=None):
+        """
+
+        Build a manager from arrays, without per-feature dicts.
+
+        Parameters
+        ----------
+        transmitter_coordinates : array_like
+            Site coordinates of shape (sites, 2), with the serving
+            transmitter first.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        receivers : ReceiverArrays
+            The User Equipment (UE) receivers.
+        site_area : SiteArea or list of dicts
+            The serving site area.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        site_ids : list
+            Site ids in the order of `transmitter_coordinates`. Defaults
+            to the row positions.
+
+        Returns
+        -------
+        manager : SimulationManager
+            Manager for these sites and receivers.
+
+        """
+        transmitter_coordinates = np.asarray(transmitter_coordinates,
+            dtype=float).reshape(-1, 2)
+
+        if site_ids is None:
+            site_ids = list(range(len(transmitter_coordinates)))
+
+        transmitters = (
+            Transmitter.from_arrays(site_ids[:1], transmitter_coordinates[:1],
+                ant_type, simulation_parameters) +
+            InterferingTransmitter.from_arrays(site_ids[1:],
+                transmitter_coordinates[1:], ant_type, simulation_parameters)
+        )
+
+        if not isinstance(site_area, SiteArea):
+            site_area = SiteArea(site_area[0])
+
+        manager = cls.__new__(cls)
+        manager._initialise(transmitters, receivers, site_area,
+            simulation_parameters)
+
+        return manager
+
+
+    @classmethod
+    def from_geodataframe(cls, transmitter, interfering_transmitters, ant_type,
+        receivers, site_area, simulation_parameters):
+        """
+
+        Build a manager from GeoDataFrames of points and polygons.
+
+        Parameters
+        ----------
+        transmitter : geopandas.GeoDataFrame
+            The serving transmitter site, with a site_id column.
+        interfering_transmitters : geopandas.GeoDataFrame
+            The interfering transmitter sites, with a site_id column.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        receivers : geopandas.GeoDataFrame
+            The User Equipment (UE) receivers, with the columns read by
+            `ReceiverArrays.from_geodataframe`.
+        site_area : geopandas.GeoDataFrame
+            The serving site area polygon, with a site_id column.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+
+        Returns
+        -------
+        manager : SimulationManager
+            Manager for these sites and receivers.
+
+        """
+        transmitter_coordinates = np.concatenate((
+            _point_coordinates(transmitter),
+            _point_coordinates(interfering_transmitters),
+        ))
+        site_ids = (list(transmitter['site_id']) +
+            list(interfering_transmitters['site_id']))
+
+        site_area = SiteArea.from_geometry(site_area['site_id'].iloc[0],
+            site_area.geometry.iloc[0])
+
+        return cls.from_arrays(transmitter_coordinates, ant_type,
+            ReceiverArrays.from_geodataframe(receivers), site_area,
+            simulation_parameters, site_ids)
 
 
     def estimate_link_budget(self, frequency, bandwidth,
         generation, ant_type, tranmission_type, environment,
-        modulation_and_coding_lut, simulation_parameters):
+        modulation_and_coding_lut, simulation_parameters, vectorised=False,
+        output='records'):
         """
 
         Takes propagation parameters and calculates link budget capacity.
@@ -83,45 +286,114 @@ class SimulationManager(object):
             spectral efficiencies and SINR estimates.
         simulation_parameters : dict
             A dict containing all simulation parameters necessary.
+        vectorised : bool
+            If True, compute all receivers at once with
+            `estimate_link_budget_arrays`, which gives the same results.
+        output : string
+            Result format. 'records' gives a list of dicts. 'arrays'
+            gives `LinkBudgetColumns`, 'dataframe' a pandas DataFrame and
+            'arrow' a pyarrow Table. The columnar formats are always
+            computed by `estimate_link_budget_arrays`.
 
         Returns
         -------
-        results : List of dicts
-            Each dict is an individual simulation result.
+        results : List of dicts, LinkBudgetColumns, DataFrame or Table
+            Each dict is an individual simulation result. The columnar
+            formats hold one column per result key, except the keys in
+            LINK_BUDGET_METADATA, which are attached once as metadata.
+
+        Notes
+        -----
+        Setting simulation_parameters['shadow_fading'] to 'stream' draws
+        independent shadow fading for every link from a
+        `seismic.shadow_fading.ShadowFading` stream, keyed by
+        simulation_parameters['scenario'] if given. Otherwise the legacy
+        values shared by all links are used.
+
+        Spectral efficiency follows the original lookup, which gives 0
+        for SINR from the second scheme's estimate up to the lowest
+        spectral efficiency, unless
+        simulation_parameters['spectral_efficiency_lookup'] is
+        'corrected' (see `seismic.modulation_and_coding`).
+
+        The outdoor to indoor loss of every indoor receiver is drawn up
+        front in one call, and applies to its serving and interfering
+        links alike.
+
+        Sectorised sites (simulation_parameters['antenna_pattern']) and
+        per-cell loads (simulation_parameters['cell_load']) are only
+        supported by `estimate_link_budget_arrays`, which is then used
+        whatever `vectorised` says.
 
         """
+        if output not in LINK_BUDGET_OUTPUTS:
+            raise ValueError('Did not recognise output: {}'.format(output))
+
+        if (vectorised or output != 'records' or
+            get_antenna_pattern(simulation_parameters) is not None or
+            simulation_parameters.get('cell_load') is not None):
+            columns = self.estimate_link_budget_arrays(frequency, bandwidth,
+                generation, ant_type, tranmission_type, environment,
+                modulation_and_coding_lut, simulation_parameters)
+            if output == 'records':
+                return _columns_to_records(columns)
+            return LinkBudgetColumns.from_columns(columns).convert(output)
+
         results = []
 
-        for receiver in self.receivers.values():
+        shadow_fading = self.shadow_fading_stream(frequency, generation,
+            environment, simulation_parameters)
 
-            path_loss, r_model, r_distance, type_of_sight = self.estimate_path_loss(
-                receiver, frequency, environment, simulation_parameters, generation
-            )
+        links_per_receiver = len(self.interfering_transmitters) + 1
+
+        with self.stage('indoor_loss'):
+            indoor_loss = self.estimate_indoor_loss(self.receiver_arrays.indoor,
+                frequency, generation, environment, simulation_parameters,
+                shadow_fading)
+
+        with self.stage('distance'):
+            distances, _ = self.estimate_distances(simulation_parameters)
+
+        for idx, receiver in enumerate(self.receivers.values()):
+
+            link_id = idx * links_per_receiver
+
+            with self.stage('serving_path_loss'):
+                path_loss, r_model, r_distance, type_of_sight = self.estimate_path_loss(
+                    receiver, frequency, environment, simulation_parameters, generation,
+                    shadow_fading, link_id, indoor_loss[idx], distances[idx, 0]
+                )
 
             received_power = self.estimate_received_power(self.transmitter,
                 receiver, path_loss
             )
 
-            interference, i_model, ave_distance, ave_inf_pl = self.estimate_interference(
-                receiver, frequency, environment, simulation_parameters, generation)
+            with self.stage('interference_path_loss'):
+                interference, i_model, ave_distance, ave_inf_pl = self.estimate_interference(
+                    receiver, frequency, environment, simulation_parameters, generation,
+                    shadow_fading, link_id + 1, indoor_loss[idx], distances[idx, 1:])
 
             noise = self.estimate_noise(
                 bandwidth
             )
 
-            f_received_power, f_interference, f_noise, i_plus_n, sinr = \
-                self.estimate_sinr(received_power, interference, noise,
-                simulation_parameters
-                )
+            with self.stage('sinr'):
+                f_received_power, f_interference, f_noise, i_plus_n, sinr = \
+                    self.estimate_sinr(received_power, interference, noise,
+                    simulation_parameters
+                    )
 
-            spectral_efficiency = self.estimate_spectral_efficiency(
-                sinr, generation, modulation_and_coding_lut
-            )
+            with self.stage('spectral_efficiency'):
+                spectral_efficiency = self.estimate_spectral_efficiency(
+                    sinr, generation, modulation_and_coding_lut,
+                    simulation_parameters
+                )
 
-            capacity_mbps, capacity_mbps_km2 = (
-                self.estimate_average_capacity(
-                bandwidth, spectral_efficiency)
-            )
+            with self.stage('capacity'):
+                capacity_mbps, capacity_mbps_km2 = (
+                    self.estimate_average_capacity(
+                    bandwidth, spectral_efficiency)
+                )
 
             results.append({
                 # 'type': 'Feature',
@@ -156,512 +428,2960 @@ class SimulationManager(object):
         return results
 
 
-    def estimate_path_loss(self, receiver, frequency,environment,
-        simulation_parameters, generation):
+    def estimate_link_budget_arrays(self, frequency, bandwidth,
+        generation, ant_type, tranmission_type, environment,
+        modulation_and_coding_lut, simulation_parameters, receivers=None,
+        start=0):
         """
 
-        Function to calculate the path loss between a transmitter
-        and receiver.
+        Array version of `estimate_link_budget`.
+
+        Every step of the link budget (path loss, received power,
+        interference, SINR, spectral efficiency and capacity) is an array
+        expression over all receivers, using the columns of
+        `receiver_arrays`. The values match the per-receiver loop.
+
+        The distances, indoor loss, path loss, received power and summed
+        interference are held in `stage_cache`, keyed by the parameters
+        each depends on. A later call recomputes only the stages whose
+        parameters changed, so varying network_load, bandwidth or the
+        modulation and coding table only repeats the SINR and capacity
+        steps.
+
+        With simulation_parameters['precision'] set to 'float32', the
+        (receivers, transmitters) distance, path loss and received power
+        arrays are held in single precision, halving their footprint.
+        Path loss is still evaluated from double precision distances, so
+        it matches the default. Interference, noise and SINR are then
+        combined in the log domain (`top_k_log_interference`), because
+        linear powers such as 10**received_power underflow single
+        precision. Distances agree with the default to a relative 1e-7,
+        received power, interference and i_plus_n to within 1e-4, and
+        SINR, rounded to 0.01 in double precision, is equal apart from
+        values within 1e-4 of a rounding boundary, which may move by
+        0.01. Spectral efficiency and capacity follow from the rounded
+        SINR.
+
+        With simulation_parameters['antenna_pattern'] set (see
+        `seismic.antenna.get_antenna_pattern`), every site is sectorised.
+        Each link gains the pattern of the sector facing the receiver,
+        computed with the distances from the same coordinate offsets, so
+        serving and interfering sites are both directional. The columns
+        then also hold `sector`, the serving sector of each receiver, and
+        `antenna_gain`, its gain relative to boresight. As each sector
+        serves its share of the site area with the full bandwidth,
+        capacity_mbps_km2 is the sector capacity over that share.
+        `sector_capacity` summarises capacity per sector.
+
+        simulation_parameters['cell_load'] gives each cell its own load
+        (%), in place of the single network_load: either one value per
+        cell in `cell_ids` order, or a dict keyed by cell id, where
+        missing cells take network_load. Each interferer is then scaled
+        by the load of its cell before the strongest are summed, and the
+        columns hold `cell_load`, the load of the serving cell, in place
+        of network_load.
 
         Parameters
         ----------
-        receiver : object
-            Receiving User Equipment (UE) item.
         frequency : float
             The carrier frequency for the chosen spectrum band (GHz).
-        environment : string
-            Either urban, suburban or rural.
+        bandwidth : int
+            The bandwidth of the carrier frequency (MHz).
         generation : string
             The technology generation type.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        tranmission_type : string
+            Transmission type (SISO, MIMO etc.).
+        environment : string
+            Either urban, suburban or rural.
+        modulation_and_coding_lut : list of tuples
+            A lookup table containing modulation and coding rates,
+            spectral efficiencies and SINR estimates.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        receivers : ReceiverArrays
+            Receivers to include. Defaults to all of them.
+        start : int
+            Position of the first of `receivers` within
+            `receiver_arrays`, which fixes their link ids.
 
         Returns
         -------
-        path_loss : float
-            Estimated path loss in decibels between the transmitter
-            and receiver.
-        model : string
-            Specifies which propagation model was used.
-        strt_distance : int
-            States the straight line distance in meters between the
-            transmitter and receiver.
-        type_of_sight : string
-            Either Line of Sight or None Line of Sight.
+        columns : OrderedDict
+            The keys of an `estimate_link_budget` result, each holding
+            one array (or list) element per receiver.
 
         """
-        temp_line = LineString(
-            [
-                (receiver.coordinates[0],
-                receiver.coordinates[1]),
-                (self.transmitter.coordinates[0],
-                self.transmitter.coordinates[1])
-            ]
-        )
-
-        strt_distance = temp_line.length
-
-        if strt_distance < 20:
-            strt_distance = 20
-
-        ant_height = self.transmitter.ant_height
-        ant_type =  self.transmitter.ant_type
-
-        if strt_distance < simulation_parameters['los_breakpoint_m'] :
-            type_of_sight = 'los'
-        else:
-            type_of_sight = 'nlos'
+        if receivers is None:
+            receivers = self.receiver_arrays
+        quantity = len(receivers)
+        receiver_ids = start + np.arange(quantity)
 
         seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
                     simulation_parameters['seed_value2_{}'.format(environment)]
         )
 
-        path_loss, model = path_loss_calculator(
-            frequency,
-            strt_distance,
-            ant_height,
-            ant_type,
+        model = simulation_parameters.get('propagation_model', 'etsi_tr_138_901')
+
+        dtype = link_budget_dtype(simulation_parameters)
+        antenna_pattern = get_antenna_pattern(simulation_parameters)
+
+        transmitters = ([self.transmitter] +
+            list(self.interfering_transmitters.values()))
+        links_per_receiver = len(transmitters)
+
+        #each stage depends only on the parameters in its key
+        receiver_key = self.receiver_key(receivers, start)
+        distance_key = receiver_key + (
+            simulation_parameters['los_breakpoint_m'], dtype)
+        indoor_key = receiver_key + (frequency, generation, environment,
+            seed_value, simulation_parameters['iterations'],
+            simulation_parameters.get('shadow_fading'),
+            simulation_parameters.get('scenario'))
+        path_loss_key = distance_key + indoor_key + (model,
             simulation_parameters['building_height'],
             simulation_parameters['street_width'],
-            environment,
-            type_of_sight,
-            receiver.ue_height,
             simulation_parameters['above_roof'],
-            receiver.indoor,
-            seed_value,
-            simulation_parameters['iterations']
-        )
+            simulation_parameters.get('path_loss_lut'))
+        received_power_key = path_loss_key + (antenna_pattern,)
+        interference_key = received_power_key + (
+            simulation_parameters.get('strongest_interferers',
+                STRONGEST_INTERFERERS),)
+
+        shadow_fading = self.shadow_fading_stream(frequency, generation,
+            environment, simulation_parameters)
+
+        def estimate_link_geometry():
+            distances, los, sector, antenna_gain = self.estimate_link_geometry(
+                simulation_parameters, receivers, antenna_pattern)
+            if antenna_gain is not None:
+                antenna_gain = antenna_gain.astype(dtype, copy=False)
+            return distances.astype(dtype, copy=False), los, sector, antenna_gain
+
+        distances, los, sector, antenna_gain = self.cached_stage('distance',
+            distance_key + (antenna_pattern,), estimate_link_geometry)
+
+        indoor_loss = self.cached_stage('indoor_loss', indoor_key,
+            lambda: self.estimate_indoor_loss(receivers.indoor, frequency,
+                generation, environment, simulation_parameters, shadow_fading,
+                receiver_ids))
+
+        def estimate_path_losses():
+            path_losses = np.empty((quantity, links_per_receiver), dtype=dtype)
+            ue_heights = np.unique(receivers.ue_height)
+
+            for t_idx, transmitter in enumerate(transmitters):
+
+                if dtype == np.float64:
+                    distance = distances[:, t_idx]
+                else:
+                    #path loss is evaluated from double precision distances
+                    dx = receivers.x - self.transmitter_coordinates[t_idx, 0]
+                    dy = receivers.y - self.transmitter_coordinates[t_idx, 1]
+                    distance = np.maximum(np.sqrt(dx * dx + dy * dy),
+                        MIN_DISTANCE)
+                type_of_sight = los[:, t_idx]
+
+                link_ids = receiver_ids * links_per_receiver + t_idx
+
+                with self.stage('serving_path_loss' if t_idx == 0 else
+                    'interference_path_loss'):
+
+                    for ue_height in ue_heights:
+
+                        selected = receivers.ue_height == ue_height
+
+                        propagation_model = self.get_propagation_model(
+                            frequency, transmitter.ant_type, environment,
+                            transmitter.ant_height, ue_height, seed_value,
+                            simulation_parameters, shadow_fading)
+
+                        path_losses[selected, t_idx], _ = propagation_model.evaluate(
+                            distance[selected], type_of_sight[selected],
+                            receivers.indoor[selected], link_ids[selected],
+                            indoor_loss=indoor_loss[selected])
+
+            return path_losses
+
+        path_losses = self.cached_stage('path_loss', path_loss_key,
+            estimate_path_losses)
+
+        def estimate_received_powers():
+            #the serving transmitter's eirp is used for every link, as in
+            #estimate_received_power
+            eirp = (
+                float(self.transmitter.power) +
+                float(self.transmitter.gain) -
+                float(self.transmitter.losses)
+            )
 
-        return path_loss, model, strt_distance, type_of_sight
+            misc_losses, gain, losses = (
+                np.asarray(column, dtype=dtype)[:, None] for column in
+                (receivers.misc_losses, receivers.gain, receivers.losses))
 
+            received_power = (dtype.type(eirp) -
+                path_losses -
+                misc_losses +
+                gain -
+                losses
+            )
 
-    def estimate_received_power(self, transmitter, receiver, path_loss):
+            if antenna_gain is not None:
+                received_power += antenna_gain
+
+            interferers = links_per_receiver - 1
+            ave_distance = np.zeros(quantity)
+            ave_inf_pl = np.zeros(quantity)
+            for t_idx in range(1, links_per_receiver):
+                ave_distance += distances[:, t_idx]
+                ave_inf_pl += path_losses[:, t_idx]
+            ave_distance = ave_distance / interferers
+            ave_inf_pl = ave_inf_pl / interferers
+
+            return received_power, ave_distance, ave_inf_pl
+
+        received_power, ave_distance, ave_inf_pl = self.cached_stage(
+            'received_power', received_power_key, estimate_received_powers)
+
+        noise = self.estimate_noise(bandwidth)
+        network_load = simulation_parameters['network_load']
+        strongest_interferers = simulation_parameters.get(
+            'strongest_interferers', STRONGEST_INTERFERERS)
+        cell_load = self.get_cell_loads(simulation_parameters)
+
+        if cell_load is not None:
+
+            with self.stage('sinr'):
+                if dtype == np.float64:
+                    raw_interference = 10**received_power[:, 1:]
+                else:
+                    raw_interference = received_power[:, 1:]
+
+                interference, i_plus_n, sinr = loaded_sinr(
+                    received_power[:, 0], raw_interference,
+                    np.arange(1, links_per_receiver), cell_load, noise,
+                    strongest_interferers)
+
+        elif dtype == np.float64:
+
+            raw_received_power = 10**received_power[:, 0]
+
+            i_summed = self.cached_stage('interference', interference_key,
+                lambda: top_k_interference(10**received_power[:, 1:],
+                    strongest_interferers))
+
+            with self.stage('sinr'):
+                raw_sum_of_interference = i_summed * (network_load/100)
+
+                i_plus_n = raw_sum_of_interference + 10**noise
+
+                sinr = np.round(np.log10(raw_received_power / i_plus_n), 2)
+
+            interference = np.log10(raw_sum_of_interference)
+            i_plus_n = np.log10(i_plus_n)
+
+        else:
+
+            i_summed = self.cached_stage('interference', interference_key,
+                lambda: top_k_log_interference(received_power[:, 1:],
+                    strongest_interferers))
+
+            with self.stage('sinr'):
+                interference, i_plus_n, sinr = log_domain_sinr(
+                    received_power[:, 0], i_summed, network_load, noise)
+
+        with self.stage('spectral_efficiency'):
+            spectral_efficiency = get_modulation_and_coding_table(
+                modulation_and_coding_lut[generation],
+                legacy_lookup(simulation_parameters)).spectral_efficiency(sinr)
+
+        with self.stage('capacity'):
+            capacity_mbps, capacity_mbps_km2 = self.estimate_average_capacity(
+                bandwidth, spectral_efficiency)
+
+            #each sector serves its share of the site area
+            if antenna_pattern is not None:
+                capacity_mbps_km2 = capacity_mbps_km2 * antenna_pattern.sectors
+
+        #output columns are copies, so that changing them leaves the
+        #cached stages intact
+        r_distance = distances[:, 0].copy()
+
+        columns = OrderedDict([
+            ('id', receivers.ids),
+            ('path_loss', path_losses[:, 0].copy()),
+            ('r_model', np.full(quantity, model, dtype=object)),
+            ('type_of_sight', np.where(los[:, 0], 'los', 'nlos').astype(object)),
+            ('ave_inf_pl', ave_inf_pl.copy()),
+            ('received_power', received_power[:, 0].copy()),
+            ('distance', r_distance),
+            ('interference', interference),
+            ('i_model', np.full(quantity, model, dtype=object)),
+            ('network_load', np.full(quantity, network_load)),
+            ('ave_distance', ave_distance.copy()),
+            ('noise', np.full(quantity, noise)),
+            ('i_plus_n', i_plus_n),
+            ('tranmission_type', np.full(quantity, tranmission_type,
+                dtype=object)),
+            ('sinr', sinr),
+            ('spectral_efficiency', spectral_efficiency),
+            ('capacity_mbps', capacity_mbps),
+            ('capacity_mbps_km2', capacity_mbps_km2),
+            ('receiver_x', receivers.x),
+            ('receiver_y', receivers.y),
+        ])
+
+        if antenna_pattern is not None:
+            columns['sector'] = sector.copy()
+            columns['antenna_gain'] = antenna_gain[:, 0].copy()
+
+        #the serving cell's load replaces the single network_load
+        if cell_load is not None:
+            del columns['network_load']
+            columns['cell_load'] = np.full(quantity, cell_load[0])
+
+        return columns
+
+
+    def cell_ids(self):
         """
+        Ids of the cells, serving transmitter first and then the
+        interfering transmitters.
 
-        Calculate received power based on transmitter and receiver
-        characteristcs, and path loss.
+        """
+        return [self.transmitter.id] + [transmitter.id for transmitter in
+            self.interfering_transmitters.values()]
 
-        Equivalent Isotropically Radiated Power (EIRP) = (
-            Power + Gain - Losses
-        )
+
+    def get_cell_loads(self, simulation_parameters):
+        """
+
+        Load of each cell, as set by simulation_parameters['cell_load'].
 
         Parameters
         ----------
-        transmitter : object
-            Radio transmitter.
-        receiver : object
-            Receiving User Equipment (UE) item.
-        path_loss : float
-            Estimated path loss in decibels between the transmitter
-            and receiver.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
 
         Returns
         -------
-        received_power : float
-            UE received power.
+        cell_load : numpy.ndarray
+            Load (%) of each cell in `cell_ids` order, or None when the
+            single network_load applies.
 
         """
-        #calculate Equivalent Isotropically Radiated Power (EIRP)
-        eirp = (
-            float(self.transmitter.power) +
-            float(self.transmitter.gain) -
-            float(self.transmitter.losses)
-        )
+        cell_load = simulation_parameters.get('cell_load')
 
-        received_power = (eirp -
-            path_loss -
-            receiver.misc_losses +
-            receiver.gain -
-            receiver.losses
-        )
+        if cell_load is None:
+            return None
 
-        return received_power
+        cell_ids = self.cell_ids()
 
+        if isinstance(cell_load, dict):
+            network_load = simulation_parameters['network_load']
+            cell_load = [cell_load.get(cell_id, network_load)
+                for cell_id in cell_ids]
 
-    def estimate_interference(self, receiver, frequency, environment,
-        simulation_parameters, generation):
+        cell_load = np.asarray(cell_load, dtype=float)
+
+        if cell_load.shape != (len(cell_ids),):
+            raise ValueError('cell_load must hold one value for each of '
+                'the {} cells'.format(len(cell_ids)))
+
+        return cell_load
+
+
+    def receiver_key(self, receivers, start=0):
         """
-        Calculate interference from other sites.
 
-        closest_sites contains all sites, ranked based
-        on distance, meaning we need to select sites 1-3 (as site 0
-        is the actual site in use)
+        Key identifying a block of receivers in the stage cache.
 
         Parameters
         ----------
-        receiver : object
-            Receiving User Equipment (UE) item.
-        frequency : float
-            The carrier frequency for the chosen spectrum band (GHz).
-        environment : string
-            Either urban, suburban or rural.
-        seed_value : int
-            Set seed value for quasi-random number generator.
-        iterations : int
-            The number of stochastic iterations for the specific point.
+        receivers : ReceiverArrays
+            Receivers passed to `estimate_link_budget_arrays`.
+        start : int
+            Position of the first of `receivers` within
+            `receiver_arrays`.
 
         Returns
         -------
-        interference : List
-            Received interference power in decibels at the receiver.
-        model : string
-            Specifies which propagation model was used.
-        ave_distance : float
-            The average straight line distance in meters between the
-            interfering transmitters and receiver.
-        ave_pl : string
-            The average path loss in decibels between the interfering
-            transmitters and receiver.
+        key : tuple
+            (start, quantity) when `receivers` hold the same values as
+            that slice of `receiver_arrays`, as the chunks of
+            `iter_link_budget` do. Any other selection gets a key that
+            matches no cached stage, so its stages are always estimated.
 
         """
-        interference = []
+        own = self.receiver_arrays
+        stop = start + len(receivers)
 
-        ave_distance = 0
-        ave_pl = 0
+        if receivers is own and start == 0:
+            return (start, stop)
 
-        for interfering_transmitter in self.interfering_transmitters.values():
+        if stop <= len(own) and receivers.ids == own.ids[start:stop] and all(
+            np.array_equal(column, own_column[start:stop])
+            for column, own_column in (
+                (receivers.coordinates, own.coordinates),
+                (receivers.ue_height, own.ue_height),
+                (receivers.gain, own.gain),
+                (receivers.losses, own.losses),
+                (receivers.misc_losses, own.misc_losses),
+                (receivers.indoor, own.indoor),
+            )):
+            return (start, stop)
 
-            temp_line = LineString(
-                [
-                    (receiver.coordinates[0],
-                    receiver.coordinates[1]),
-                    (interfering_transmitter.coordinates[0],
-                    interfering_transmitter.coordinates[1])
-                ]
-            )
+        return (object(),)
 
-            interference_strt_distance = temp_line.length
-            if interference_strt_distance < 20:
-                interference_strt_distance == 20
 
-            ant_height = interfering_transmitter.ant_height
-            ant_type =  interfering_transmitter.ant_type
+    def cached_stage(self, stage, key, estimate):
+        """
 
-            if interference_strt_distance < simulation_parameters['los_breakpoint_m']:
-                type_of_sight = 'los'
-            else:
-                type_of_sight = 'nlos'
+        Value of a link budget stage, estimated only when its key differs
+        from the cached one.
 
-            seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
-                        simulation_parameters['seed_value2_{}'.format(environment)]
-            )
+        Parameters
+        ----------
+        stage : string
+            Name of the stage.
+        key : tuple
+            The parameters the stage depends on.
+        estimate : function
+            Called without arguments to estimate the stage.
 
-            path_loss, model = path_loss_calculator(
-                frequency,
-                interference_strt_distance,
-                ant_height,
-                ant_type,
-                simulation_parameters['building_height'],
-                simulation_parameters['street_width'],
+        Returns
+        -------
+        value : object
+            The cached or newly estimated value. One value is held per
+            stage, so memory does not grow with the number of calls.
+
+        """
+        cached = self.stage_cache.get(stage)
+        if cached is not None and cached[0] == key:
+            self.count('cache_hit.{}'.format(stage))
+            return cached[1]
+
+        self.count('cache_miss.{}'.format(stage))
+
+        with self.stage(stage):
+            value = estimate()
+        self.stage_cache[stage] = (key, value)
+
+        return value
+
+
+    def enable_instrumentation(self, timings=None):
+        """
+
+        Record the wall time and calls of each link budget stage, and
+        the cache hits and misses, until `disable_instrumentation`.
+
+        Parameters
+        ----------
+        timings : StageTimings
+            Collector to add to, so that several managers can share
+            one. Defaults to a new collector.
+
+        Returns
+        -------
+        timings : StageTimings
+            The collector in use. Its `as_dict` and `to_json` give the
+            recorded values.
+
+        """
+        if timings is None:
+            timings = StageTimings()
+
+        self.timings = timings
+
+        return timings
+
+
+    def disable_instrumentation(self):
+        """
+        Stop recording, returning the collector used until now.
+
+        """
+        timings, self.timings = self.timings, None
+
+        return timings
+
+
+    def stage(self, name):
+        """
+        Context manager timing a link budget stage. While
+        instrumentation is disabled it is a shared no-op.
+
+        """
+        if self.timings is None:
+            return NULL_STAGE
+
+        return self.timings.stage(name)
+
+
+    def count(self, name, value=1):
+        """
+        Add to an event counter while instrumentation is enabled.
+
+        """
+        if self.timings is not None:
+            self.timings.count(name, value)
+
+
+    def clear_cache(self):
+        """
+        Discard every cached link budget stage.
+
+        """
+        self.stage_cache.clear()
+
+
+    def iter_link_budget(self, frequency, bandwidth,
+        generation, ant_type, tranmission_type, environment,
+        modulation_and_coding_lut, simulation_parameters, chunk_size=10000,
+        output='arrays'):
+        """
+
+        Generate the link budget in fixed-size blocks of receivers.
+
+        Each block is computed by `estimate_link_budget_arrays`, so peak
+        memory depends on `chunk_size` rather than on the number of
+        receivers. Concatenating the blocks gives the same values as
+        `estimate_link_budget`.
+
+        Parameters
+        ----------
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        bandwidth : int
+            The bandwidth of the carrier frequency (MHz).
+        generation : string
+            The technology generation type.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        tranmission_type : string
+            Transmission type (SISO, MIMO etc.).
+        environment : string
+            Either urban, suburban or rural.
+        modulation_and_coding_lut : list of tuples
+            A lookup table containing modulation and coding rates,
+            spectral efficiencies and SINR estimates.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        chunk_size : int
+            Number of receivers in each block.
+        output : string
+            Format of each block, one of LINK_BUDGET_OUTPUTS.
+
+        Yields
+        ------
+        results : LinkBudgetColumns, DataFrame, Table or list of dicts
+            Results for the next `chunk_size` receivers, in receiver
+            order.
+
+        """
+        if output not in LINK_BUDGET_OUTPUTS:
+            raise ValueError('Did not recognise output: {}'.format(output))
+
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer')
+
+        for start in range(0, len(self.receiver_arrays), chunk_size):
+
+            columns = self.estimate_link_budget_arrays(frequency, bandwidth,
+                generation, ant_type, tranmission_type, environment,
+                modulation_and_coding_lut, simulation_parameters,
+                self.receiver_arrays[start:start + chunk_size], start)
+
+            yield LinkBudgetColumns.from_columns(columns).convert(output)
+
+
+    def estimate_link_budget_monte_carlo(self, frequency, bandwidth,
+        generation, ant_type, tranmission_type, environment,
+        modulation_and_coding_lut, simulation_parameters,
+        percentiles=(5, 50, 95), chunk_size=None):
+        """
+
+        Monte Carlo link budget, keeping every shadow fading draw
+        rather than their mean.
+
+        Each of the simulation_parameters['iterations'] draws is carried
+        through received power, interference, SINR, spectral efficiency
+        and capacity, and each receiver is then summarised by the mean,
+        variance and exact percentiles of these metrics over the draws.
+        Percentiles need every draw of a receiver, so the draws are not
+        streamed. Instead receivers are processed in chunks, and only one
+        chunk's draws are held at once: chunk_size x iterations values
+        for each transmitter and each metric. The default chunk holds
+        MONTE_CARLO_CHUNK_DRAWS receivers x draws, so memory stays the
+        same however many iterations are run.
+
+        Parameters
+        ----------
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        bandwidth : int
+            The bandwidth of the carrier frequency (MHz).
+        generation : string
+            The technology generation type.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        tranmission_type : string
+            Transmission type (SISO, MIMO etc.).
+        environment : string
+            Either urban, suburban or rural.
+        modulation_and_coding_lut : list of tuples
+            A lookup table containing modulation and coding rates,
+            spectral efficiencies and SINR estimates.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        percentiles : list of floats
+            Percentiles reported for each metric (e.g. CONFIDENCE_INTERVALS).
+        chunk_size : int
+            Number of receivers evaluated together. Defaults to
+            MONTE_CARLO_CHUNK_DRAWS // iterations. Results do not depend
+            on it.
+
+        Returns
+        -------
+        results : List of dicts
+            One dict per receiver. Each metric (path_loss, received_power,
+            interference, sinr, spectral_efficiency, capacity_mbps and
+            capacity_mbps_km2) is reported as <metric>_mean, <metric>_var
+            and <metric>_p<percentile>.
+
+        Notes
+        -----
+        With simulation_parameters['shadow_fading'] set to 'stream' every
+        link has independent draws. Otherwise the legacy draws, which are
+        shared by all links, are used. A sectorised antenna pattern and
+        per-cell loads (simulation_parameters['cell_load']) apply as in
+        `estimate_link_budget_arrays`.
+
+        """
+        results = []
+
+        antenna_pattern = get_antenna_pattern(simulation_parameters)
+
+        shadow_fading = self.shadow_fading_stream(frequency, generation,
+            environment, simulation_parameters, legacy=True)
+
+        transmitters = ([self.transmitter] +
+            list(self.interfering_transmitters.values()))
+
+        noise = self.estimate_noise(bandwidth)
+        network_load = simulation_parameters['network_load']
+        strongest_interferers = simulation_parameters.get(
+            'strongest_interferers', STRONGEST_INTERFERERS)
+        cell_load = self.get_cell_loads(simulation_parameters)
+
+        if chunk_size is None:
+            chunk_size = max(1, MONTE_CARLO_CHUNK_DRAWS //
+                simulation_parameters['iterations'])
+
+        for start in range(0, len(self.receiver_arrays), chunk_size):
+
+            chunk = self.receiver_arrays[start:start + chunk_size]
+
+            distances, los, sector, antenna_gain = self.estimate_link_geometry(
+                simulation_parameters, chunk, antenna_pattern)
+            ue_heights = chunk.ue_height
+            indoor_loss = self.estimate_indoor_loss(chunk.indoor, frequency,
+                generation, environment, simulation_parameters, shadow_fading,
+                start + np.arange(len(chunk)), monte_carlo=True)
+            receiver_terms = chunk.receiver_terms()
+
+            received_power = np.empty((simulation_parameters['iterations'],
+                len(chunk), len(transmitters)))
+            serving_path_loss = np.empty(received_power.shape[:-1])
+
+            for t_idx, transmitter in enumerate(transmitters):
+
+                distance = distances[:, t_idx]
+                type_of_sight = los[:, t_idx]
+
+                #same link ids as estimate_link_budget
+                link_ids = ((start + np.arange(len(chunk))) * len(transmitters) +
+                    t_idx)
+
+                eirp = (
+                    float(transmitter.power) +
+                    float(transmitter.gain) -
+                    float(transmitter.losses)
+                )
+
+                for ue_height in np.unique(ue_heights):
+
+                    selected = ue_heights == ue_height
+
+                    propagation_model = self.get_propagation_model(frequency,
+                        transmitter.ant_type, environment,
+                        transmitter.ant_height, ue_height,
+                        shadow_fading.seed_value,
+                        simulation_parameters, shadow_fading)
+
+                    path_loss, _ = propagation_model.evaluate(
+                        distance[selected], type_of_sight[selected],
+                        link_ids=link_ids[selected], monte_carlo=True,
+                        indoor_loss=indoor_loss[:, selected])
+
+                    received_power[:, selected, t_idx] = (eirp - path_loss +
+                        receiver_terms[selected])
+                    if antenna_gain is not None:
+                        received_power[:, selected, t_idx] += (
+                            antenna_gain[selected, t_idx])
+                    if t_idx == 0:
+                        serving_path_loss[:, selected] = path_loss
+
+            if cell_load is not None:
+
+                interference, _, sinr = loaded_sinr(received_power[..., 0],
+                    10**received_power[..., 1:],
+                    np.arange(1, len(transmitters)), cell_load, noise,
+                    strongest_interferers)
+
+            else:
+
+                raw_received_power = 10**received_power[..., 0]
+
+                raw_sum_of_interference = top_k_interference(
+                    10**received_power[..., 1:],
+                    strongest_interferers) * (network_load/100)
+
+                i_plus_n = raw_sum_of_interference + 10**noise
+
+                sinr = np.round(np.log10(raw_received_power / i_plus_n), 2)
+
+                interference = np.log10(raw_sum_of_interference)
+
+            spectral_efficiency = get_modulation_and_coding_table(
+                modulation_and_coding_lut[generation],
+                legacy_lookup(simulation_parameters)).spectral_efficiency(sinr)
+
+            capacity_mbps, capacity_mbps_km2 = self.estimate_average_capacity(
+                bandwidth, spectral_efficiency)
+
+            if antenna_pattern is not None:
+                capacity_mbps_km2 = capacity_mbps_km2 * antenna_pattern.sectors
+
+            metrics = OrderedDict([
+                ('path_loss', serving_path_loss),
+                ('received_power', received_power[..., 0]),
+                ('interference', interference),
+                ('sinr', sinr),
+                ('spectral_efficiency', spectral_efficiency),
+                ('capacity_mbps', capacity_mbps),
+                ('capacity_mbps_km2', capacity_mbps_km2),
+            ])
+
+            summary = OrderedDict()
+            for metric, draws in metrics.items():
+                summary.update(_summarise_draws(metric, draws, percentiles))
+
+            for idx in range(len(chunk)):
+                result = {
+                    'id': chunk.ids[idx],
+                    'distance': float(distances[idx, 0]),
+                    'type_of_sight': 'los' if los[idx, 0] else 'nlos',
+                    'network_load': network_load,
+                    'tranmission_type': tranmission_type,
+                    'iterations': simulation_parameters['iterations'],
+                    'receiver_x': chunk.x[idx],
+                    'receiver_y': chunk.y[idx],
+                }
+                if sector is not None:
+                    result['sector'] = int(sector[idx])
+                if cell_load is not None:
+                    del result['network_load']
+                    result['cell_load'] = float(cell_load[0])
+                for key, values in summary.items():
+                    result[key] = float(values[idx])
+                results.append(result)
+
+        return results
+
+
+    def estimate_distances(self, simulation_parameters, receivers=None):
+        """
+
+        Straight line distance between every receiver and transmitter.
+
+        Parameters
+        ----------
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        receivers : ReceiverArrays
+            Receivers to include. Defaults to all of them.
+
+        Returns
+        -------
+        distances : numpy.ndarray
+            Distances in meters (m) of shape (receivers, transmitters),
+            with the serving transmitter first. Distances below
+            MIN_DISTANCE are clamped to it.
+        los : numpy.ndarray
+            Boolean mask of the same shape, True for Line of Sight links
+            (shorter than simulation_parameters['los_breakpoint_m']).
+
+        """
+        distances, los, _, _ = self.estimate_link_geometry(
+            simulation_parameters, receivers)
+
+        return distances, los
+
+
+    def estimate_link_geometry(self, simulation_parameters, receivers=None,
+        antenna_pattern=None):
+        """
+
+        Distances and antenna gains of every receiver and transmitter
+        link, from one set of coordinate offsets.
+
+        Parameters
+        ----------
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        receivers : ReceiverArrays
+            Receivers to include. Defaults to all of them.
+        antenna_pattern : SectorAntennaPattern
+            Pattern of every site. None for omnidirectional sites.
+
+        Returns
+        -------
+        distances : numpy.ndarray
+            Distances in meters (m) of shape (receivers, transmitters),
+            as given by `estimate_distances`.
+        los : numpy.ndarray
+            Boolean Line of Sight mask of the same shape.
+        sector : numpy.ndarray
+            Index of the serving transmitter's sector facing each
+            receiver, or None without a pattern.
+        antenna_gain : numpy.ndarray
+            Gain in dB of the sector of each transmitter facing each
+            receiver, relative to boresight, of the same shape as
+            distances. None without a pattern.
+
+        """
+        if receivers is None:
+            receivers = self.receiver_arrays
+
+        dx = receivers.x[:, None] - self.transmitter_coordinates[None, :, 0]
+        dy = receivers.y[:, None] - self.transmitter_coordinates[None, :, 1]
+
+        distances = np.maximum(np.sqrt(dx * dx + dy * dy), MIN_DISTANCE)
+
+        los = distances < simulation_parameters['los_breakpoint_m']
+
+        if antenna_pattern is None:
+            return distances, los, None, None
+
+        azimuth = link_azimuth(dx, dy)
+
+        return (distances, los, antenna_pattern.sector(azimuth[:, 0]),
+            antenna_pattern.gain(azimuth))
+
+
+    def estimate_indoor_loss(self, indoor, frequency, generation,
+        environment, simulation_parameters, shadow_fading=None,
+        receiver_ids=None, monte_carlo=False):
+        """
+
+        Outdoor to indoor (building entry) loss for a set of receivers,
+        drawn in bulk from their indoor mask.
+
+        Parameters
+        ----------
+        indoor : array_like
+            Boolean mask, True for indoor receivers.
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        generation : string
+            The technology generation type.
+        environment : string
+            Either urban, suburban or rural.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        shadow_fading : ShadowFading
+            Optional stream giving each receiver its own draw.
+        receiver_ids : array_like
+            Ids of the receivers within `shadow_fading`. Defaults to
+            their positions in `indoor`.
+        monte_carlo : bool
+            If True, return every draw, one row per iteration.
+
+        Returns
+        -------
+        indoor_loss : numpy.ndarray
+            Outdoor to indoor path loss in decibels (dB) per receiver,
+            zero for outdoor receivers.
+
+        """
+        seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
+                    simulation_parameters['seed_value2_{}'.format(environment)]
+        )
+
+        return outdoor_to_indoor_path_loss_batch(frequency, indoor, seed_value,
+            shadow_fading, receiver_ids, monte_carlo,
+            simulation_parameters['iterations'])
+
+
+    def shadow_fading_stream(self, frequency, generation, environment,
+        simulation_parameters, legacy=False):
+        """
+
+        Build the per-link shadow fading stream, if one is requested.
+
+        Parameters
+        ----------
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        generation : string
+            The technology generation type.
+        environment : string
+            Either urban, suburban or rural.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        legacy : bool
+            If True, return a legacy stream rather than None when no
+            per-link stream is requested, for callers that need draws
+            from the legacy values.
+
+        Returns
+        -------
+        shadow_fading : ShadowFading
+            The stream, or None to use the legacy shadow fading values.
+
+        """
+        per_link = simulation_parameters.get('shadow_fading', 'legacy') == 'stream'
+
+        if not (per_link or legacy):
+            return None
+
+        seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
+                    simulation_parameters['seed_value2_{}'.format(environment)]
+        )
+
+        return ShadowFading(
+            seed_value,
+            frequency,
+            simulation_parameters.get('scenario'),
+            generation,
+            environment,
+            simulation_parameters['iterations'],
+            legacy=not per_link,
+        )
+
+
+    def estimate_path_loss(self, receiver, frequency,environment,
+        simulation_parameters, generation, shadow_fading=None, link_id=None,
+        indoor_loss=None, distance=None):
+        """
+
+        Function to calculate the path loss between a transmitter
+        and receiver.
+
+        Parameters
+        ----------
+        receiver : object
+            Receiving User Equipment (UE) item.
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        environment : string
+            Either urban, suburban or rural.
+        generation : string
+            The technology generation type.
+        shadow_fading : ShadowFading
+            Optional per-link shadow fading stream.
+        link_id : int
+            Id of this link within `shadow_fading`.
+        indoor_loss : float
+            Precomputed outdoor to indoor loss of the receiver (dB). By
+            default it is drawn from `receiver.indoor`.
+        distance : float
+            Precomputed distance from `estimate_distances`.
+
+        Returns
+        -------
+        path_loss : float
+            Estimated path loss in decibels between the transmitter
+            and receiver.
+        model : string
+            Specifies which propagation model was used.
+        strt_distance : int
+            States the straight line distance in meters between the
+            transmitter and receiver.
+        type_of_sight : string
+            Either Line of Sight or None Line of Sight.
+
+        """
+        if distance is None:
+            distances, _ = self.estimate_distances(simulation_parameters,
+                ReceiverArrays.from_receivers([receiver]))
+            distance = distances[0, 0]
+
+        strt_distance = float(distance)
+
+        ant_height = self.transmitter.ant_height
+        ant_type =  self.transmitter.ant_type
+
+        if strt_distance < simulation_parameters['los_breakpoint_m'] :
+            type_of_sight = 'los'
+        else:
+            type_of_sight = 'nlos'
+
+        seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
+                    simulation_parameters['seed_value2_{}'.format(environment)]
+        )
+
+        propagation_model = self.get_propagation_model(frequency, ant_type,
+            environment, ant_height, receiver.ue_height, seed_value,
+            simulation_parameters, shadow_fading)
+
+        path_loss, _ = propagation_model.evaluate(
+            strt_distance, type_of_sight, receiver.indoor, link_id,
+            indoor_loss=indoor_loss)
+
+        path_loss = float(path_loss)
+        model = simulation_parameters.get('propagation_model', 'etsi_tr_138_901')
+
+        return path_loss, model, strt_distance, type_of_sight
+
+
+    def get_propagation_model(self, frequency, ant_type, environment,
+        ant_height, ue_height, seed_value, simulation_parameters,
+        shadow_fading=None):
+        """
+
+        Return the propagation model for these parameters, building and
+        caching it on first use.
+
+        Parameters
+        ----------
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        environment : string
+            Either urban, suburban or rural.
+        ant_height : float
+            Transmitter antenna height (m).
+        ue_height : float
+            Receiver antenna height (m).
+        seed_value : int
+            Dictates repeatable random number generation.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        shadow_fading : ShadowFading
+            Optional per-link shadow fading stream.
+
+        Returns
+        -------
+        propagation_model : BasePropagationModel
+            Model holding all distance-independent terms.
+
+        Notes
+        -----
+        simulation_parameters['propagation_model'] selects a model of
+        `seismic.path_loss.PROPAGATION_MODELS` by name, and defaults to
+        'etsi_tr_138_901'. For that model, if
+        simulation_parameters['path_loss_lut'] holds a
+        `seismic.path_loss_lut.PathLossLUT`, the model is answered from
+        that table wherever it covers these parameters.
+
+        """
+        name = simulation_parameters.get('propagation_model', 'etsi_tr_138_901')
+
+        lut = None
+        if name == 'etsi_tr_138_901':
+            lut = simulation_parameters.get('path_loss_lut')
+
+        #tables are keyed by value, as each call may pass its own instance
+        lut_key = None if lut is None else (lut.path, lut.max_error_db)
+
+        key = (
+            name, frequency, ant_type, environment,
+            simulation_parameters['building_height'],
+            simulation_parameters['street_width'],
+            ant_height, ue_height, seed_value,
+            simulation_parameters['iterations'],
+            simulation_parameters['above_roof'],
+            shadow_fading,
+            lut_key,
+        )
+
+        if key in self.propagation_models:
+            self.count('cache_hit.propagation_model')
+            return self.propagation_models[key]
+
+        self.count('cache_miss.propagation_model')
+
+        if lut is not None:
+            self.propagation_models[key] = lut.propagation_model(
+                frequency,
+                ant_type,
                 environment,
-                type_of_sight,
-                receiver.ue_height,
+                simulation_parameters['building_height'],
+                simulation_parameters['street_width'],
+                ant_height,
+                ue_height,
+                seed_value,
+                simulation_parameters['iterations'],
+                shadow_fading,
                 simulation_parameters['above_roof'],
-                receiver.indoor,
+            )
+        else:
+            self.propagation_models[key] = build_propagation_model(
+                name,
+                frequency,
+                ant_type,
+                environment,
+                simulation_parameters['building_height'],
+                simulation_parameters['street_width'],
+                ant_height,
+                ue_height,
                 seed_value,
                 simulation_parameters['iterations'],
+                shadow_fading,
+                simulation_parameters['above_roof'],
+            )
+
+        return self.propagation_models[key]
+
+
+    def estimate_received_power(self, transmitter, receiver, path_loss):
+        """
+
+        Calculate received power based on transmitter and receiver
+        characteristcs, and path loss.
+
+        Equivalent Isotropically Radiated Power (EIRP) = (
+            Power + Gain - Losses
+        )
+
+        Parameters
+        ----------
+        transmitter : object
+            Radio transmitter.
+        receiver : object
+            Receiving User Equipment (UE) item.
+        path_loss : float
+            Estimated path loss in decibels between the transmitter
+            and receiver.
+
+        Returns
+        -------
+        received_power : float
+            UE received power.
+
+        """
+        #calculate Equivalent Isotropically Radiated Power (EIRP)
+        eirp = (
+            float(self.transmitter.power) +
+            float(self.transmitter.gain) -
+            float(self.transmitter.losses)
+        )
+
+        received_power = (eirp -
+            path_loss -
+            receiver.misc_losses +
+            receiver.gain -
+            receiver.losses
+        )
+
+        return received_power
+
+
+    def estimate_interference(self, receiver, frequency, environment,
+        simulation_parameters, generation, shadow_fading=None, link_id=None,
+        indoor_loss=None, distances=None):
+        """
+        Calculate interference from other sites.
+
+        closest_sites contains all sites, ranked based
+        on distance, meaning we need to select sites 1-3 (as site 0
+        is the actual site in use)
+
+        Parameters
+        ----------
+        receiver : object
+            Receiving User Equipment (UE) item.
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        environment : string
+            Either urban, suburban or rural.
+        seed_value : int
+            Set seed value for quasi-random number generator.
+        iterations : int
+            The number of stochastic iterations for the specific point.
+        shadow_fading : ShadowFading
+            Optional per-link shadow fading stream.
+        link_id : int
+            Id of the link to the first interfering transmitter within
+            `shadow_fading`. Later transmitters take consecutive ids.
+        indoor_loss : float
+            Precomputed outdoor to indoor loss of the receiver (dB). By
+            default it is drawn from `receiver.indoor`.
+        distances : array_like
+            Precomputed distances to each interfering transmitter, from
+            `estimate_distances`.
+
+        Returns
+        -------
+        interference : List
+            Received interference power in decibels at the receiver.
+        model : string
+            Specifies which propagation model was used.
+        ave_distance : float
+            The average straight line distance in meters between the
+            interfering transmitters and receiver.
+        ave_pl : string
+            The average path loss in decibels between the interfering
+            transmitters and receiver.
+
+        """
+        interference = []
+
+        ave_distance = 0
+        ave_pl = 0
+
+        if distances is None:
+            distances, _ = self.estimate_distances(simulation_parameters,
+                ReceiverArrays.from_receivers([receiver]))
+            distances = distances[0, 1:]
+
+        for idx, interfering_transmitter in enumerate(
+            self.interfering_transmitters.values()):
+
+            interference_strt_distance = float(distances[idx])
+
+            ant_height = interfering_transmitter.ant_height
+            ant_type =  interfering_transmitter.ant_type
+
+            if interference_strt_distance < simulation_parameters['los_breakpoint_m']:
+                type_of_sight = 'los'
+            else:
+                type_of_sight = 'nlos'
+
+            seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
+                        simulation_parameters['seed_value2_{}'.format(environment)]
+            )
+
+            propagation_model = self.get_propagation_model(frequency,
+                ant_type, environment, ant_height, receiver.ue_height,
+                seed_value, simulation_parameters, shadow_fading)
+
+            path_loss, _ = propagation_model.evaluate(
+                interference_strt_distance, type_of_sight, receiver.indoor,
+                None if link_id is None else link_id + idx,
+                indoor_loss=indoor_loss)
+
+            path_loss = float(path_loss)
+            model = simulation_parameters.get('propagation_model',
+                'etsi_tr_138_901')
+
+            received_interference = self.estimate_received_power(
+                interfering_transmitter,
+                receiver,
+                path_loss
+            )
+
+            ave_distance += interference_strt_distance
+            ave_pl += path_loss
+
+            interference.append(received_interference)
+
+        ave_distance = (
+            ave_distance / len(self.interfering_transmitters.values())
+        )
+
+        ave_pl = (
+            ave_pl / len(self.interfering_transmitters.values())
+        )
+
+        return interference, model, ave_distance, ave_pl
+
+
+
+
+
+    def estimate_noise(self, bandwidth):
+        """
+
+        Estimate the terminal noise floor.
+
+        NoiseFloor (dBm) = 10log10(k*T*1000) + NF + 10log10(BW)
+
+        Parameters
+        ----------
+        bandwidth : int
+            The bandwidth of the carrier frequency (MHz).
+
+        Returns
+        -------
+        noise : float
+            Received noise at the UE receiver in decibels
+
+        """
+        k = 1.38e-23 #Boltzmann constant
+        t = 290 #temperature in Kelvins
+        bandwidth_hz = bandwidth * 1e6
+
+        noise = 10 * np.log10(k * t * 1000) + 1.5 + 10 * np.log10(bandwidth_hz)
+
+        return noise
+
+
+    def estimate_sinr(self, received_power, interference, noise,
+        simulation_parameters):
+        """
+
+        Calculate the Signal-to-Interference-plus-Noise-Ratio (SINR).
+
+        Only the strongest interferers are summed, three unless
+        simulation_parameters['strongest_interferers'] says otherwise.
+
+        Parameters
+        ----------
+        received_power : float
+            UE received power in decibels.
+        interference : List
+            Received interference power in decibels at the receiver.
+        noise : float
+            Received noise at the UE receiver in decibels
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+
+        Returns
+        -------
+        received_power : float
+            UE received power in decibels.
+        raw_sum_of_interference : float
+            Linear values of summed interference at the receiver in decibels.
+        noise : float
+            Received noise at the UE receiver in decibels.
+        i_plus_n : float
+            Linear sum of interference plus noise in decibels.
+        sinr : float
+            Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
+
+        """
+        raw_received_power = 10**received_power
+
+        i_summed = float(top_k_interference(
+            10**np.asarray(interference, dtype=float),
+            simulation_parameters.get('strongest_interferers',
+                STRONGEST_INTERFERERS)))
+
+        network_load = simulation_parameters['network_load']
+        raw_sum_of_interference = i_summed * (network_load/100)
+
+        raw_noise = 10**noise
+
+        i_plus_n = (raw_sum_of_interference + raw_noise)
+
+        sinr = round(np.log10(
+            raw_received_power / i_plus_n
+            ),2)
+
+        return received_power, raw_sum_of_interference, noise, i_plus_n, sinr
+
+
+    def estimate_spectral_efficiency(self, sinr, generation,
+        modulation_and_coding_lut, simulation_parameters=None):
+        """
+        Uses the SINR to determine spectral efficiency given the relevant
+        modulation and coding scheme.
+
+        Parameters
+        ----------
+        sinr : float
+            Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
+        generation : string
+            Either 4G or 5G dependent on technology.
+        modulation_and_coding_lut : list of tuples
+            A lookup table containing modulation and coding rates,
+            spectral efficiencies and SINR estimates.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary, of
+            which 'spectral_efficiency_lookup' selects the legacy
+            (default) or corrected lookup.
+
+        Returns
+        -------
+        spectral_efficiency : float
+            Efficiency of information transfer in Bps/Hz
+
+        """
+        table = get_modulation_and_coding_table(
+            modulation_and_coding_lut[generation],
+            legacy_lookup(simulation_parameters or {}))
+
+        return table.spectral_efficiency(sinr)
+
+
+    def estimate_average_capacity(self, bandwidth, spectral_efficiency):
+        """
+        Estimate link capacity based on bandwidth and received signal.
+
+        Parameters
+        ----------
+        bandwidth : int
+            Channel bandwidth in MHz
+        spectral_efficiency : float
+            Efficiency of information transfer in Bps/Hz
+
+        Returns
+        -------
+        capacity_mbps : float
+            Average link budget capacity in Mbps.
+        capacity_mbps_km2 : float
+            Average site area capacity in Mbps km^2.
+
+        """
+        bandwidth_in_hertz = bandwidth * 1e6 #MHz to Hz
+
+        capacity_mbps = (
+            (bandwidth_in_hertz * spectral_efficiency) / 1e6
+        )
+
+        capacity_mbps_km2 = (
+            capacity_mbps / (self.site_area.area / 1e6)
+        )
+
+        return capacity_mbps, capacity_mbps_km2
+
+
+    def receiver_density(self):
+        """
+
+        Calculate receiver density per square kilometer (km^2)
+
+        Returns
+        -------
+        receiver_density : float
+            Density of receivers per square kilometer (km^2).
+
+        Notes
+        -----
+        Function returns `0` when no receivers are configered to the area.
+
+        """
+        if not self.receivers:
+            return 0
+
+        postcode_sector_area = (
+            [round(a.area) for a in self.area.values()]
+            )[0]
+
+        receiver_density = (
+            len(self.receivers) / (postcode_sector_area/1000000)
             )
 
-            received_interference = self.estimate_received_power(
-                interfering_transmitter,
-                receiver,
-                path_loss
-            )
+        return receiver_density
+
+
+class NetworkSimulationManager(SimulationManager):
+    """
+
+    Meta-object for a network of transmitter sites, where each receiver
+    is served by the site giving it the strongest received power.
+
+    The candidate sites of a receiver are found with a spatial index.
+    They are every site within simulation_parameters['interference_radius_m']
+    (INTERFERENCE_RADIUS by default), plus the nearest site. Path loss is
+    only computed for these pairs. The strongest candidate serves the
+    receiver and the others interfere.
+
+    Parameters
+    ----------
+    transmitters : list of dicts
+        Contains a geojson dict for each transmitter site.
+    ant_type : str
+        Type of antenna (macro, small etc.).
+    receivers : list of dicts or ReceiverArrays
+        Contains a dict for each User Equipment (UE) receiver.
+    simulation_parameters : dict
+        A dict containing all simulation parameters necessary.
+    site_areas : list of dicts
+        Contains geojson dicts for the site area polygons, matched to
+        transmitters by site_id. capacity_mbps_km2 is NaN for receivers
+        whose serving site has no area.
+
+    Notes
+    -----
+    `estimate_link_budget_monte_carlo` is not supported, and raises a
+    ValueError, because the best server of a receiver would change from
+    one draw to the next.
+
+    """
+    def __init__(self, transmitters, ant_type, receivers, simulation_parameters,
+        site_areas=None):
+
+        transmitters = [
+            Transmitter(transmitter, ant_type, simulation_parameters)
+            for transmitter in transmitters
+        ]
+
+        site_areas = [SiteArea(site_area) for site_area in site_areas or []]
+
+        self._initialise(transmitters, receivers, site_areas,
+            simulation_parameters)
+
+
+    def _initialise(self, transmitters, receivers, site_areas,
+        simulation_parameters):
+        """
+        Set up the manager from transmitter and site area objects.
+
+        """
+        self.transmitters = OrderedDict()
+        self.propagation_models = {}
+        self.stage_cache = {}
+        self.timings = None
+
+        for site_object in transmitters:
+            self.transmitters[site_object.id] = site_object
+
+        if not self.transmitters:
+            raise ValueError('NetworkSimulationManager requires a transmitter')
+
+        #every site shares the antenna parameters of the first
+        self.transmitter = next(iter(self.transmitters.values()))
+        self.interfering_transmitters = {}
+
+        self._set_receivers(receivers, simulation_parameters)
+
+        self.site_ids = np.array(list(self.transmitters.keys()), dtype=object)
+        self.transmitter_coordinates = np.array(
+            [site.coordinates[:2] for site in self.transmitters.values()],
+            dtype=float
+        )
+        self.site_index = STRtree(shapely.points(self.transmitter_coordinates))
+
+        self.site_areas = {}
+        for site_object in site_areas:
+            self.site_areas[site_object.id] = site_object
+
+        self.site_area_m2 = np.array([
+            self.site_areas[site_id].area if site_id in self.site_areas
+            else np.nan for site_id in self.transmitters
+        ], dtype=float)
+
+
+    @classmethod
+    def from_arrays(cls, transmitter_coordinates, ant_type, receivers,
+        simulation_parameters, site_ids=None, site_areas=None):
+        """
+
+        Build a network manager from arrays, without per-feature dicts.
+
+        Parameters
+        ----------
+        transmitter_coordinates : array_like
+            Site coordinates of shape (sites, 2).
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        receivers : ReceiverArrays
+            The User Equipment (UE) receivers.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        site_ids : list
+            Site ids in the order of `transmitter_coordinates`. Defaults
+            to the row positions.
+        site_areas : list of SiteArea
+            Site area objects, matched to transmitters by id.
+
+        Returns
+        -------
+        manager : NetworkSimulationManager
+            Manager for these sites and receivers.
+
+        """
+        transmitter_coordinates = np.asarray(transmitter_coordinates,
+            dtype=float).reshape(-1, 2)
+
+        if site_ids is None:
+            site_ids = list(range(len(transmitter_coordinates)))
+
+        manager = cls.__new__(cls)
+        manager._initialise(Transmitter.from_arrays(site_ids,
+            transmitter_coordinates, ant_type, simulation_parameters),
+            receivers, site_areas or [], simulation_parameters)
+
+        return manager
+
+
+    @classmethod
+    def from_geodataframe(cls, transmitters, ant_type, receivers,
+        simulation_parameters, site_areas=None):
+        """
+
+        Build a network manager from GeoDataFrames of points and polygons.
+
+        Parameters
+        ----------
+        transmitters : geopandas.GeoDataFrame
+            The transmitter sites, with a site_id column.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        receivers : geopandas.GeoDataFrame
+            The User Equipment (UE) receivers, with the columns read by
+            `ReceiverArrays.from_geodataframe`.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        site_areas : geopandas.GeoDataFrame
+            Site area polygons, with a site_id column.
+
+        Returns
+        -------
+        manager : NetworkSimulationManager
+            Manager for these sites and receivers.
+
+        """
+        areas = []
+        if site_areas is not None:
+            areas = [
+                SiteArea.from_geometry(site_id, geometry)
+                for site_id, geometry in zip(site_areas['site_id'],
+                    site_areas.geometry)
+            ]
+
+        return cls.from_arrays(_point_coordinates(transmitters), ant_type,
+            ReceiverArrays.from_geodataframe(receivers), simulation_parameters,
+            list(transmitters['site_id']), areas)
+
+
+    def estimate_link_budget(self, frequency, bandwidth,
+        generation, ant_type, tranmission_type, environment,
+        modulation_and_coding_lut, simulation_parameters, vectorised=True,
+        output='records'):
+        """
+
+        Link budget of every receiver from its best server. Always
+        computed by `estimate_link_budget_arrays`, so `vectorised` is
+        ignored. See `SimulationManager.estimate_link_budget`.
+
+        """
+        return SimulationManager.estimate_link_budget(self, frequency,
+            bandwidth, generation, ant_type, tranmission_type, environment,
+            modulation_and_coding_lut, simulation_parameters, True, output)
+
+
+    def estimate_link_budget_monte_carlo(self, *args, **kwargs):
+        """
+        Not supported in network mode, see the class notes.
+
+        """
+        raise ValueError(
+            'Monte Carlo link budgets are not supported in network mode')
+
+
+    def cell_ids(self):
+        """
+        Site ids, in the order of `transmitter_coordinates`.
+
+        """
+        return list(self.site_ids)
+
+
+    def estimate_cell_loads(self, frequency, bandwidth, generation,
+        ant_type, tranmission_type, environment, modulation_and_coding_lut,
+        simulation_parameters, demand_mbps, tolerance=0.1,
+        max_iterations=100):
+        """
+
+        Load of every cell from the demand of the receivers it serves,
+        coupled through the interference each load causes.
+
+        The load of a cell is the share of its resources its receivers
+        need: the sum of their demand over the capacity each would get
+        from the whole bandwidth, capped at 100%. Receivers without
+        capacity are not served and add no load. Capacity depends on
+        SINR, and so on the loads of the interfering cells. Starting
+        from simulation_parameters['cell_load'], or from full load, all
+        loads are updated together (`solve_cell_loads`) until none
+        changes by more than `tolerance`.
+
+        Parameters
+        ----------
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        bandwidth : int
+            The bandwidth of the carrier frequency (MHz).
+        generation : string
+            The technology generation type.
+        ant_type : str
+            Type of antenna (macro, small etc.).
+        tranmission_type : string
+            Transmission type (SISO, MIMO etc.).
+        environment : string
+            Either urban, suburban or rural.
+        modulation_and_coding_lut : list of tuples
+            A lookup table containing modulation and coding rates,
+            spectral efficiencies and SINR estimates.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        demand_mbps : float or array_like
+            Demand of every receiver, or of each one in receiver order,
+            in Mbps.
+        tolerance : float
+            Largest change in any load (%) at convergence.
+        max_iterations : int
+            Most updates of the loads.
+
+        Returns
+        -------
+        loads : OrderedDict
+            site_id and cell_load (%) of every cell, which can be passed
+            back as simulation_parameters['cell_load'], plus the number
+            of iterations and whether the loads converged.
+
+        """
+        links = self.estimate_serving_links(frequency, generation,
+            environment, simulation_parameters)
+
+        cell_load = self.get_cell_loads(simulation_parameters)
+        if cell_load is None:
+            cell_load = np.full(len(self.site_ids), 100.0)
+
+        with self.stage('load_coupling'):
+            cell_load, iterations, converged = solve_cell_loads(
+                links['received_power'][links['first']],
+                links['raw_interference'], self._interfering_sites(links),
+                links['s_idx'][links['first']], demand_mbps,
+                self.estimate_noise(bandwidth), bandwidth,
+                get_modulation_and_coding_table(
+                    modulation_and_coding_lut[generation],
+                    legacy_lookup(simulation_parameters)),
+                cell_load,
+                simulation_parameters.get('strongest_interferers',
+                    STRONGEST_INTERFERERS),
+                tolerance, max_iterations)
+        self.count('load_iterations', iterations)
+
+        return OrderedDict([
+            ('site_id', self.site_ids),
+            ('cell_load', cell_load),
+            ('iterations', iterations),
+            ('converged', converged),
+        ])
+
+
+    def candidate_pairs(self, receivers, radius):
+        """
+
+        Receiver and site pairs considered by the link budget.
+
+        Parameters
+        ----------
+        receivers : ReceiverArrays
+            Receivers to pair with sites.
+        radius : float
+            Sites within this distance in meters (m) are candidates.
+
+        Returns
+        -------
+        receiver_idx : numpy.ndarray
+            Position of each pair's receiver within `receivers`.
+        site_idx : numpy.ndarray
+            Position of each pair's site within `transmitters`. Pairs
+            are sorted by receiver, then site, and every receiver has at
+            least its nearest site.
+
+        """
+        quantity = len(receivers)
+        sites = len(self.transmitters)
+
+        if quantity == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        geometries = shapely.points(receivers.coordinates)
+
+        within = self.site_index.query(geometries, predicate='dwithin',
+            distance=radius)
+        nearest = self.site_index.nearest(geometries)
+
+        keys = np.unique(np.concatenate((
+            within[0] * sites + within[1],
+            np.arange(quantity) * sites + nearest,
+        )))
+
+        return keys // sites, keys % sites
+
+
+    def estimate_serving_links(self, frequency, generation, environment,
+        simulation_parameters, receivers=None, start=0):
+        """
+
+        Candidate links of each receiver, ordered with its best server
+        first.
+
+        Parameters
+        ----------
+        frequency : float
+            The carrier frequency for the chosen spectrum band (GHz).
+        generation : string
+            The technology generation type.
+        environment : string
+            Either urban, suburban or rural.
+        simulation_parameters : dict
+            A dict containing all simulation parameters necessary.
+        receivers : ReceiverArrays
+            Receivers to include. Defaults to all of them.
+        start : int
+            Position of the first of `receivers` within
+            `receiver_arrays`, which fixes their link ids.
+
+        Returns
+        -------
+        links : OrderedDict
+            Arrays over candidate pairs, sorted by receiver and then by
+            received power: r_idx and s_idx (receiver and site
+            positions), rank (0 for the best server), distance, los,
+            path_loss, received_power, and with an antenna pattern
+            azimuth and antenna_gain. first holds the position of each
+            receiver's best server. raw_interference holds the
+            interferers of each receiver by rank, of shape (receivers,
+            most interferers): linear powers, or log powers in single
+            precision. ave_distance and ave_inf_pl average the
+            interferers of each receiver.
+
+        """
+        if receivers is None:
+            receivers = self.receiver_arrays
+        quantity = len(receivers)
+        receiver_ids = start + np.arange(quantity)
+        sites = len(self.transmitters)
+
+        shadow_fading = self.shadow_fading_stream(frequency, generation,
+            environment, simulation_parameters)
+
+        seed_value = (simulation_parameters['seed_value2_{}'.format(generation)] +
+                    simulation_parameters['seed_value2_{}'.format(environment)]
+        )
+
+        dtype = link_budget_dtype(simulation_parameters)
+        antenna_pattern = get_antenna_pattern(simulation_parameters)
+
+        radius = simulation_parameters.get('interference_radius_m',
+            INTERFERENCE_RADIUS)
+
+        with self.stage('candidate_pairs'):
+            r_idx, s_idx = self.candidate_pairs(receivers, radius)
+        self.count('candidate_pairs', len(r_idx))
+
+        with self.stage('distance'):
+            dx = receivers.x[r_idx] - self.transmitter_coordinates[s_idx, 0]
+            dy = receivers.y[r_idx] - self.transmitter_coordinates[s_idx, 1]
+            distance = np.maximum(np.sqrt(dx * dx + dy * dy), MIN_DISTANCE)
+            los = distance < simulation_parameters['los_breakpoint_m']
+
+            if antenna_pattern is not None:
+                azimuth = link_azimuth(dx, dy)
+
+        link_ids = receiver_ids[r_idx] * sites + s_idx
+
+        with self.stage('indoor_loss'):
+            indoor_loss = self.estimate_indoor_loss(receivers.indoor,
+                frequency, generation, environment, simulation_parameters,
+                shadow_fading, receiver_ids)
+
+        with self.stage('path_loss'):
+            path_loss = np.empty(len(r_idx), dtype=dtype)
+            ue_height = receivers.ue_height[r_idx]
+            indoor = receivers.indoor[r_idx]
+            pair_indoor_loss = indoor_loss[r_idx]
+
+            for height in np.unique(receivers.ue_height):
+
+                selected = ue_height == height
+
+                propagation_model = self.get_propagation_model(frequency,
+                    self.transmitter.ant_type, environment,
+                    self.transmitter.ant_height, height, seed_value,
+                    simulation_parameters, shadow_fading)
+
+                path_loss[selected], _ = propagation_model.evaluate(
+                    distance[selected], los[selected], indoor[selected],
+                    link_ids[selected], indoor_loss=pair_indoor_loss[selected])
+
+        eirp = (
+            float(self.transmitter.power) +
+            float(self.transmitter.gain) -
+            float(self.transmitter.losses)
+        )
+
+        distance = distance.astype(dtype, copy=False)
+
+        received_power = (dtype.type(eirp) - path_loss +
+            receivers.receiver_terms()[r_idx].astype(dtype, copy=False))
+
+        #the best server is chosen after the antenna pattern is applied
+        if antenna_pattern is not None:
+            antenna_gain = antenna_pattern.gain(azimuth).astype(dtype,
+                copy=False)
+            received_power += antenna_gain
+
+        with self.stage('best_server'):
+            #strongest candidate first within each receiver, ties by site
+            order = np.lexsort((-received_power, r_idx))
+            r_idx = r_idx[order]
+            s_idx = s_idx[order]
+            distance = distance[order]
+            los = los[order]
+            path_loss = path_loss[order]
+            received_power = received_power[order]
+            if antenna_pattern is not None:
+                azimuth = azimuth[order]
+                antenna_gain = antenna_gain[order]
+
+            first = np.flatnonzero(np.r_[True, r_idx[1:] != r_idx[:-1]])
+            rank = np.arange(len(r_idx)) - np.repeat(first,
+                np.diff(np.r_[first, len(r_idx)]))
+            interfering = rank > 0
+
+            counts = np.bincount(r_idx[interfering], minlength=quantity)
+
+            #missing interferers are zero power, or -inf in the log domain
+            shape = (quantity, counts.max() if quantity else 0)
+            if dtype == np.float64:
+                raw_interference = np.zeros(shape)
+                raw_interference[r_idx[interfering], rank[interfering] - 1] = (
+                    10**received_power[interfering])
+            else:
+                raw_interference = np.full(shape, -np.inf, dtype=dtype)
+                raw_interference[r_idx[interfering], rank[interfering] - 1] = (
+                    received_power[interfering])
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ave_distance = np.bincount(r_idx[interfering],
+                    distance[interfering], minlength=quantity) / counts
+                ave_inf_pl = np.bincount(r_idx[interfering],
+                    path_loss[interfering], minlength=quantity) / counts
+
+        links = OrderedDict([
+            ('r_idx', r_idx),
+            ('s_idx', s_idx),
+            ('first', first),
+            ('rank', rank),
+            ('distance', distance),
+            ('los', los),
+            ('path_loss', path_loss),
+            ('received_power', received_power),
+            ('raw_interference', raw_interference),
+            ('ave_distance', ave_distance),
+            ('ave_inf_pl', ave_inf_pl),
+        ])
+
+        if antenna_pattern is not None:
+            links['azimuth'] = azimuth
+            links['antenna_gain'] = antenna_gain
+
+        return links
+
+
+    def estimate_link_budget_arrays(self, frequency, bandwidth,
+        generation, ant_type, tranmission_type, environment,
+        modulation_and_coding_lut, simulation_parameters, receivers=None,
+        start=0):
+        """
+
+        Array link budget of each receiver from its best server.
+
+        Takes the same parameters as
+        `SimulationManager.estimate_link_budget_arrays`. The columns are
+        also the same, plus `serving_site`, the site id of the best
+        server. Interference is from the other candidate sites, and the
+        averages (ave_distance, ave_inf_pl) are over them. Receivers
+        without one have NaN averages and no interference.
+
+        Link ids are receiver position * sites + site position, so draws
+        from a shadow fading stream do not depend on the radius or on
+        how receivers are chunked.
+
+        simulation_parameters['precision'] applies as it does there, to
+        the arrays over candidate pairs. So does an antenna pattern, which
+        is applied before the best server is chosen.
+
+        """
+        if receivers is None:
+            receivers = self.receiver_arrays
+        quantity = len(receivers)
+
+        model = simulation_parameters.get('propagation_model', 'etsi_tr_138_901')
+
+        dtype = link_budget_dtype(simulation_parameters)
+        antenna_pattern = get_antenna_pattern(simulation_parameters)
+        cell_load = self.get_cell_loads(simulation_parameters)
+
+        links = self.estimate_serving_links(frequency, generation,
+            environment, simulation_parameters, receivers, start)
+
+        first = links['first']
+        s_idx = links['s_idx']
+        los = links['los']
+        path_loss = links['path_loss']
+        received_power = links['received_power']
+        raw_interference = links['raw_interference']
+
+        noise = self.estimate_noise(bandwidth)
+
+        network_load = simulation_parameters['network_load']
+        strongest_interferers = simulation_parameters.get(
+            'strongest_interferers', STRONGEST_INTERFERERS)
+
+        if cell_load is not None:
+
+            with self.stage('sinr'):
+                interference, i_plus_n, sinr = loaded_sinr(
+                    received_power[first], raw_interference,
+                    self._interfering_sites(links), cell_load, noise,
+                    strongest_interferers)
+
+        elif dtype == np.float64:
+
+            raw_received_power = 10**received_power[first]
+
+            with self.stage('interference'):
+                i_summed = top_k_interference(raw_interference,
+                    strongest_interferers)
+
+            with self.stage('sinr'):
+                raw_sum_of_interference = i_summed * (network_load/100)
+
+                i_plus_n = raw_sum_of_interference + 10**noise
+
+                sinr = np.round(np.log10(raw_received_power / i_plus_n), 2)
+
+            with np.errstate(divide='ignore'):
+                interference = np.log10(raw_sum_of_interference)
+            i_plus_n = np.log10(i_plus_n)
+
+        else:
+
+            with self.stage('interference'):
+                i_summed = top_k_log_interference(raw_interference,
+                    strongest_interferers)
+
+            with self.stage('sinr'):
+                interference, i_plus_n, sinr = log_domain_sinr(
+                    received_power[first], i_summed, network_load, noise)
+
+        with self.stage('spectral_efficiency'):
+            spectral_efficiency = get_modulation_and_coding_table(
+                modulation_and_coding_lut[generation],
+                legacy_lookup(simulation_parameters)).spectral_efficiency(sinr)
+
+        serving_site = s_idx[first]
+
+        with self.stage('capacity'):
+            bandwidth_in_hertz = bandwidth * 1e6 #MHz to Hz
+            capacity_mbps = (bandwidth_in_hertz * spectral_efficiency) / 1e6
+            capacity_mbps_km2 = capacity_mbps / (
+                self.site_area_m2[serving_site] / 1e6)
+
+            if antenna_pattern is not None:
+                capacity_mbps_km2 = capacity_mbps_km2 * antenna_pattern.sectors
+
+        columns = OrderedDict([
+            ('id', receivers.ids),
+            ('serving_site', self.site_ids[serving_site]),
+            ('path_loss', path_loss[first]),
+            ('r_model', np.full(quantity, model, dtype=object)),
+            ('type_of_sight', np.where(los[first], 'los', 'nlos').astype(object)),
+            ('ave_inf_pl', links['ave_inf_pl']),
+            ('received_power', received_power[first]),
+            ('distance', links['distance'][first]),
+            ('interference', interference),
+            ('i_model', np.full(quantity, model, dtype=object)),
+            ('network_load', np.full(quantity, network_load)),
+            ('ave_distance', links['ave_distance']),
+            ('noise', np.full(quantity, noise)),
+            ('i_plus_n', i_plus_n),
+            ('tranmission_type', np.full(quantity, tranmission_type,
+                dtype=object)),
+            ('sinr', sinr),
+            ('spectral_efficiency', spectral_efficiency),
+            ('capacity_mbps', capacity_mbps),
+            ('capacity_mbps_km2', capacity_mbps_km2),
+            ('receiver_x', receivers.x),
+            ('receiver_y', receivers.y),
+        ])
+
+        if antenna_pattern is not None:
+            columns['sector'] = antenna_pattern.sector(links['azimuth'][first])
+            columns['antenna_gain'] = links['antenna_gain'][first]
+
+        #the serving cell's load replaces the single network_load
+        if cell_load is not None:
+            del columns['network_load']
+            columns['cell_load'] = cell_load[serving_site]
+
+        return columns
+
+
+    def _interfering_sites(self, links):
+        """
+        Site position of each element of links['raw_interference'], and
+        -1 where a receiver has fewer interferers.
+
+        """
+        interfering = links['rank'] > 0
+
+        sites = np.full(links['raw_interference'].shape, -1, dtype=np.int64)
+        sites[links['r_idx'][interfering], links['rank'][interfering] - 1] = (
+            links['s_idx'][interfering])
+
+        return sites
+
+
+class Transmitter(object):
+    """
+
+    Radio transmitter object.
+
+    Parameters
+    ----------
+    data : dict
+        Contains all object data parameters.
+    simulation_parameters : dict
+        A dict containing all simulation parameters necessary.
+
+    """
+    __slots__ = ('id', 'coordinates', 'ant_type', 'ant_height', 'power',
+        'gain', 'losses')
+
+    def __init__(self, data, ant_type, simulation_parameters):
+
+        self._set(data['properties']['site_id'],
+            data['geometry']['coordinates'], ant_type, simulation_parameters)
+
+
+    def _set(self, site_id, coordinates, ant_type, simulation_parameters):
+
+        self.id = site_id
+        self.coordinates = coordinates
+
+        self.ant_type = ant_type
+
+        if ant_type == 'macro':
+            self.ant_height = simulation_parameters['tx_macro_baseline_height']
+            self.power = simulation_parameters['tx_macro_power']
+            self.gain = simulation_parameters['tx_macro_gain']
+            self.losses = simulation_parameters['tx_macro_losses']
+
+        if ant_type == 'micro':
+            self.ant_height = simulation_parameters['tx_micro_baseline_height']
+            self.power = simulation_parameters['tx_micro_power']
+            self.gain = simulation_parameters['tx_micro_gain']
+            self.losses = simulation_parameters['tx_micro_losses']
+
+
+    @classmethod
+    def from_arrays(cls, site_ids, coordinates, ant_type,
+        simulation_parameters):
+        """
+        One object per row of `coordinates`, of shape (sites, 2).
+
+        """
+        sites = []
+
+        for site_id, site_coordinates in zip(site_ids,
+            np.asarray(coordinates, dtype=float).reshape(-1, 2).tolist()):
+            site = cls.__new__(cls)
+            site._set(site_id, site_coordinates, ant_type,
+                simulation_parameters)
+            sites.append(site)
+
+        return sites
+
+
+class InterferingTransmitter(Transmitter):
+    """
+
+    A site object is specific site.
+
+    Parameters
+    ----------
+    data : dict
+        Contains all object data parameters.
+    simulation_parameters : dict
+        A dict containing all simulation parameters necessary.
+
+    """
+    __slots__ = ()
+
+
+class Receiver(object):
+    """
+
+    Radio receiver object (UE).
+
+    Parameters
+    ----------
+    data : dict
+        Contains all object data parameters.
+    simulation_parameters : dict
+        A dict containing all simulation parameters necessary.
+
+    """
+    __slots__ = ('id', 'coordinates', 'ue_height', 'gain', 'losses',
+        'misc_losses', 'indoor')
+
+    def __init__(self, data, simulation_parameters):
+        self.id = data['properties']['ue_id']
+        self.coordinates = data['geometry']["coordinates"]
+
+        self.ue_height = data['properties']['ue_height']
+        self.gain = data['properties']['gain']
+        self.losses = data['properties']['losses']
+        self.misc_losses = data['properties']['misc_losses']
+        self.indoor = data['properties']['indoor']
+
+
+    @classmethod
+    def from_values(cls, receiver_id, coordinates, ue_height, gain, losses,
+        misc_losses, indoor):
+        """
+        Build a receiver from its values rather than a dict.
+
+        """
+        receiver = cls.__new__(cls)
+
+        receiver.id = receiver_id
+        receiver.coordinates = coordinates
+        receiver.ue_height = ue_height
+        receiver.gain = gain
+        receiver.losses = losses
+        receiver.misc_losses = misc_losses
+        receiver.indoor = indoor
+
+        return receiver
+
+
+class ReceiverArrays(object):
+    """
+
+    Receivers held as NumPy columns, one element per receiver.
+
+    Parameters
+    ----------
+    ids : list
+        Receiver ids.
+    coordinates : array_like
+        Receiver coordinates, of shape (receivers, 2).
+    ue_height : array_like
+        Height of each User Equipment.
+    gain : array_like
+        Receiver gain.
+    losses : array_like
+        Receiver losses.
+    misc_losses : array_like
+        Receiver miscellaneous losses.
+    indoor : array_like
+        True for indoor receivers.
+
+    """
+    def __init__(self, ids, coordinates, ue_height, gain, losses, misc_losses,
+        indoor):
+
+        self.ids = list(ids)
+        self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        self.ue_height = np.asarray(ue_height, dtype=float)
+        self.gain = np.asarray(gain, dtype=float)
+        self.losses = np.asarray(losses, dtype=float)
+        self.misc_losses = np.asarray(misc_losses, dtype=float)
+        self.indoor = np.asarray(indoor, dtype=bool)
+
+
+    @classmethod
+    def from_receivers(cls, receivers):
+        """
+        Build the columns from a list of `Receiver` objects.
+
+        """
+        return cls(
+            [receiver.id for receiver in receivers],
+            [receiver.coordinates[:2] for receiver in receivers],
+            [receiver.ue_height for receiver in receivers],
+            [receiver.gain for receiver in receivers],
+            [receiver.losses for receiver in receivers],
+            [receiver.misc_losses for receiver in receivers],
+            [bool(receiver.indoor) for receiver in receivers],
+        )
+
+
+    @classmethod
+    def from_features(cls, features):
+        """
+        Build the columns from a list of geojson-like receiver dicts.
+
+        """
+        return cls(
+            [feature['properties']['ue_id'] for feature in features],
+            [feature['geometry']['coordinates'][:2] for feature in features],
+            [feature['properties']['ue_height'] for feature in features],
+            [feature['properties']['gain'] for feature in features],
+            [feature['properties']['losses'] for feature in features],
+            [feature['properties']['misc_losses'] for feature in features],
+            [bool(feature['properties']['indoor']) for feature in features],
+        )
+
+
+    @classmethod
+    def from_geodataframe(cls, receivers):
+        """
+        Build the columns from a GeoDataFrame of receiver points, with
+        ue_id, ue_height, gain, losses, misc_losses and indoor columns.
+
+        """
+        return cls(
+            receivers['ue_id'].tolist(),
+            _point_coordinates(receivers),
+            receivers['ue_height'].to_numpy(),
+            receivers['gain'].to_numpy(),
+            receivers['losses'].to_numpy(),
+            receivers['misc_losses'].to_numpy(),
+            receivers['indoor'].to_numpy(),
+        )
+
+
+    def to_receivers(self):
+        """
+        One `Receiver` per element of the columns.
+
+        """
+        return [
+            Receiver.from_values(receiver_id, coordinates, ue_height, gain,
+                losses, misc_losses, indoor)
+            for receiver_id, coordinates, ue_height, gain, losses, misc_losses,
+            indoor in zip(self.ids, self.coordinates.tolist(),
+                self.ue_height.tolist(), self.gain.tolist(),
+                self.losses.tolist(), self.misc_losses.tolist(),
+                self.indoor.tolist())
+        ]
+
+
+    def to_features(self):
+        """
+        Geojson-like receiver dicts, as taken by `Receiver`.
+
+        """
+        return [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [x, y],
+                },
+                'properties': {
+                    'ue_id': receiver_id,
+                    'ue_height': ue_height,
+                    'gain': gain,
+                    'losses': losses,
+                    'misc_losses': misc_losses,
+                    'indoor': indoor,
+                }
+            }
+            for receiver_id, (x, y), ue_height, gain, losses, misc_losses, indoor
+            in zip(self.ids, self.coordinates.tolist(), self.ue_height.tolist(),
+                self.gain.tolist(), self.losses.tolist(),
+                self.misc_losses.tolist(), self.indoor.tolist())
+        ]
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def __getitem__(self, selection):
+        """
+        Subset of the receivers, given a slice or index array.
+
+        """
+        if isinstance(selection, slice):
+            ids = self.ids[selection]
+        else:
+            ids = [self.ids[idx] for idx in np.arange(len(self))[selection]]
+
+        return ReceiverArrays(ids, self.coordinates[selection],
+            self.ue_height[selection], self.gain[selection],
+            self.losses[selection], self.misc_losses[selection],
+            self.indoor[selection])
+
+
+    @property
+    def x(self):
+        return self.coordinates[:, 0]
+
+
+    @property
+    def y(self):
+        return self.coordinates[:, 1]
+
+
+    def receiver_terms(self):
+        """
+        Receiver terms of the link budget (gain less losses) in
+        decibels, as added by `SimulationManager.estimate_received_power`.
+
+        """
+        return - self.misc_losses + self.gain - self.losses
+
+
+class SiteArea(object):
+    """
+
+    site area object.
+
+    Parameters
+    ----------
+    data : dict
+        Contains all object data parameters.
+
+    """
+    __slots__ = ('id', 'geometry', '_area')
+
+    def __init__(self, data):
+        self.id = data['properties']['site_id']
+        self.geometry = data['geometry']
+        self._area = None
+
+
+    @classmethod
+    def from_geometry(cls, site_id, geometry):
+        """
+        Build a site area from a shapely geometry or geojson mapping.
+
+        """
+        site_area = cls.__new__(cls)
+
+        site_area.id = site_id
+        site_area.geometry = geometry
+        site_area._area = None
+
+        return site_area
+
+
+    @property
+    def coordinates(self):
+        if isinstance(self.geometry, dict):
+            return self.geometry['coordinates']
+        return mapping(self.geometry)['coordinates']
+
+
+    @property
+    def area(self):
+        #the polygon is only built the first time the area is needed
+        if self._area is None:
+            self._area = self._calculate_area()
+        return self._area
+
+
+    def _calculate_area(self):
+        if isinstance(self.geometry, dict):
+            polygon = shape(self.geometry)
+        else:
+            polygon = self.geometry
+        area = polygon.area
+        return area
+
 
-            ave_distance += interference_strt_distance
-            ave_pl += path_loss
+class LinkBudgetColumns(OrderedDict):
+    """
 
-            interference.append(received_interference)
+    Columnar link budget results.
 
-        ave_distance = (
-            ave_distance / len(self.interfering_transmitters.values())
-        )
+    Holds one array per result key, with one element per receiver. The
+    values shared by every receiver (LINK_BUDGET_METADATA) are held once
+    in `metadata`.
 
-        ave_pl = (
-            ave_pl / len(self.interfering_transmitters.values())
-        )
+    Parameters
+    ----------
+    columns : dict
+        Per receiver arrays, keyed by result name.
+    metadata : dict
+        Values shared by every receiver, keyed by result name.
+    keys : list of strings
+        Order of the keys in `to_records`. Defaults to the column keys
+        followed by the metadata keys.
 
-        return interference, model, ave_distance, ave_pl
+    """
+    def __init__(self, columns=(), metadata=None, keys=None):
 
+        OrderedDict.__init__(self, columns)
 
+        self.metadata = OrderedDict(metadata or ())
+        self.keys_order = list(keys) if keys is not None else (
+            list(self.keys()) + list(self.metadata.keys()))
 
 
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Split the output of `estimate_link_budget_arrays` into per
+        receiver columns and shared metadata.
 
-    def estimate_sinr(self, received_power, interference, noise,
-        simulation_parameters):
         """
+        metadata = OrderedDict()
+        for key in LINK_BUDGET_METADATA:
+            if key not in columns:
+                continue
+            values = np.asarray(columns[key])
+            value = values[0] if len(values) else None
+            metadata[key] = value.item() if hasattr(value, 'item') else value
+
+        per_receiver = OrderedDict(
+            (key, np.asarray(value)) for key, value in columns.items()
+            if key not in metadata
+        )
 
-        Calculate the Signal-to-Interference-plus-Noise-Ratio (SINR).
+        return cls(per_receiver, metadata, columns.keys())
 
-        Parameters
-        ----------
-        received_power : float
-            UE received power in decibels.
-        interference : List
-            Received interference power in decibels at the receiver.
-        noise : float
-            Received noise at the UE receiver in decibels
-        simulation_parameters : dict
-            A dict containing all simulation parameters necessary.
 
-        Returns
-        -------
-        received_power : float
-            UE received power in decibels.
-        raw_sum_of_interference : float
-            Linear values of summed interference at the receiver in decibels.
-        noise : float
-            Received noise at the UE receiver in decibels.
-        i_plus_n : float
-            Linear sum of interference plus noise in decibels.
-        sinr : float
-            Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
+    def __reduce__(self):
+        return (self.__class__, (OrderedDict(self), self.metadata,
+            self.keys_order))
+
 
+    def copy(self):
+        return self.__class__(self, self.metadata, self.keys_order)
+
+
+    def convert(self, output):
         """
-        raw_received_power = 10**received_power
+        Return these results in one of LINK_BUDGET_OUTPUTS.
 
-        interference_list = []
-        for value in interference:
-            output_value = 10**value
-            interference_list.append(output_value)
+        """
+        if output == 'records':
+            return self.to_records()
+        elif output == 'arrays':
+            return self
+        elif output == 'dataframe':
+            return self.to_dataframe()
+        elif output == 'arrow':
+            return self.to_arrow()
+        else:
+            raise ValueError('Did not recognise output: {}'.format(output))
 
-        interference_list.sort(reverse=True)
-        interference_list = interference_list[:3]
 
-        network_load = simulation_parameters['network_load']
-        i_summed = sum(interference_list)
-        raw_sum_of_interference = i_summed * (network_load/100)
+    def to_records(self):
+        """
+        List of dicts, as returned by `estimate_link_budget`.
 
-        raw_noise = 10**noise
+        """
+        quantity = len(self['id']) if 'id' in self else 0
 
-        i_plus_n = (raw_sum_of_interference + raw_noise)
+        columns = OrderedDict()
+        for key in self.keys_order:
+            if key in self.metadata:
+                columns[key] = [self.metadata[key]] * quantity
+            else:
+                columns[key] = self[key]
 
-        sinr = round(np.log10(
-            raw_received_power / i_plus_n
-            ),2)
+        return _columns_to_records(columns)
 
-        return received_power, raw_sum_of_interference, noise, i_plus_n, sinr
 
+    def to_dataframe(self):
+        """
+        pandas DataFrame with the metadata in `DataFrame.attrs`.
 
-    def estimate_spectral_efficiency(self, sinr, generation,
-        modulation_and_coding_lut):
         """
-        Uses the SINR to determine spectral efficiency given the relevant
-        modulation and coding scheme.
+        if pd is None:
+            raise ImportError('pandas is required for dataframe output')
 
-        Parameters
-        ----------
-        sinr : float
-            Signal-to-Interference-plus-Noise-Ratio (SINR) in decibels.
-        generation : string
-            Either 4G or 5G dependent on technology.
-        modulation_and_coding_lut : list of tuples
-            A lookup table containing modulation and coding rates,
-            spectral efficiencies and SINR estimates.
+        dataframe = pd.DataFrame(OrderedDict(self))
+        dataframe.attrs.update(self.metadata)
+
+        return dataframe
 
-        Returns
-        -------
-        spectral_efficiency : float
-            Efficiency of information transfer in Bps/Hz
 
+    def to_arrow(self):
         """
-        lookup = modulation_and_coding_lut[generation]
+        pyarrow Table with the metadata, JSON encoded, in the schema
+        metadata.
 
-        spectral_efficiency = 0.1
-        for lower, upper in pairwise(lookup):
-            if lower[0] and upper[0] == generation:
+        """
+        if pa is None:
+            raise ImportError('pyarrow is required for arrow output')
 
-                lower_sinr = lower[6]
-                upper_sinr = upper[6]
+        table = pa.table(OrderedDict(
+            (key, list(value) if value.dtype == object else value)
+            for key, value in self.items()
+        ))
 
-                if sinr >= lower_sinr and sinr < upper_sinr:
-                    spectral_efficiency = lower[5]
-                    return spectral_efficiency
+        return table.replace_schema_metadata(OrderedDict(
+            (key, json.dumps(value)) for key, value in self.metadata.items()
+        ))
 
-                highest_value = lookup[-1]
 
-                if sinr >= highest_value[6]:
-                    spectral_efficiency = highest_value[5]
-                    return spectral_efficiency
+def _point_coordinates(geodataframe):
+    """
+    (x, y) coordinates of the points in a GeoDataFrame.
 
-                lowest_value = lookup[0]
+    """
+    return np.column_stack((
+        geodataframe.geometry.x.to_numpy(dtype=float),
+        geodataframe.geometry.y.to_numpy(dtype=float),
+    ))
 
-                if sinr < lowest_value[5]:
-                    spectral_efficiency = 0
-                    return spectral_efficiency
 
+def top_k_interference(raw_interference, k):
+    """
 
-    def estimate_average_capacity(self, bandwidth, spectral_efficiency):
-        """
-        Estimate link capacity based on bandwidth and received signal.
+    Sum of the k strongest interferers along the last axis.
 
-        Parameters
-        ----------
-        bandwidth : int
-            Channel bandwidth in MHz
-        spectral_efficiency : float
-            Efficiency of information transfer in Bps/Hz
+    The k strongest are found with a partial sort, then summed strongest
+    first, as the scalar loop did.
 
-        Returns
-        -------
-        capacity_mbps : float
-            Average link budget capacity in Mbps.
-        capacity_mbps_km2 : float
-            Average site area capacity in Mbps km^2.
+    Parameters
+    ----------
+    raw_interference : array_like
+        Linear interference power, with one interferer per element of
+        the last axis.
+    k : int
+        Number of interferers summed.
 
-        """
-        bandwidth_in_hertz = bandwidth * 1e6 #MHz to Hz
+    Returns
+    -------
+    i_summed : numpy.ndarray
+        Linear sum of the k strongest interferers.
 
-        capacity_mbps = (
-            (bandwidth_in_hertz * spectral_efficiency) / 1e6
-        )
+    """
+    raw_interference = np.asarray(raw_interference, dtype=float)
 
-        capacity_mbps_km2 = (
-            capacity_mbps / (self.site_area.area / 1e6)
-        )
+    interferers = raw_interference.shape[-1]
+    if interferers == 0 or k <= 0:
+        return np.zeros(raw_interference.shape[:-1])
 
-        return capacity_mbps, capacity_mbps_km2
+    k = min(k, interferers)
+    if k < interferers:
+        raw_interference = np.partition(raw_interference, interferers - k,
+            axis=-1)[..., interferers - k:]
 
+    strongest = np.sort(raw_interference, axis=-1)[..., ::-1]
 
-    def receiver_density(self):
-        """
+    return np.cumsum(strongest, axis=-1)[..., -1]
 
-        Calculate receiver density per square kilometer (km^2)
 
-        Returns
-        -------
-        receiver_density : float
-            Density of receivers per square kilometer (km^2).
+def top_k_log_interference(received_power, k):
+    """
 
-        Notes
-        -----
-        Function returns `0` when no receivers are configered to the area.
+    Log of the sum of the k strongest interferers along the last axis,
+    without leaving the log domain.
 
-        """
-        if not self.receivers:
-            return 0
+    Each sum is taken relative to its strongest term, so no power is
+    raised to a large negative exponent, and single precision input
+    neither underflows nor loses the weaker terms that matter.
 
-        postcode_sector_area = (
-            [round(a.area) for a in self.area.values()]
-            )[0]
+    Parameters
+    ----------
+    received_power : array_like
+        Received interference power in the units of `received_power`
+        (so that 10**received_power is linear), with one interferer per
+        element of the last axis. -inf marks a missing interferer.
+    k : int
+        Number of interferers summed.
 
-        receiver_density = (
-            len(self.receivers) / (postcode_sector_area/1000000)
-            )
+    Returns
+    -------
+    i_summed : numpy.ndarray
+        log10 of the linear sum of the k strongest interferers, in the
+        input precision. -inf where there are none.
 
-        return receiver_density
+    """
+    received_power = np.asarray(received_power)
+    if not np.issubdtype(received_power.dtype, np.floating):
+        received_power = received_power.astype(float)
 
+    interferers = received_power.shape[-1]
+    if interferers == 0 or k <= 0:
+        return np.full(received_power.shape[:-1], -np.inf,
+            dtype=received_power.dtype)
 
-class Transmitter(object):
+    k = min(k, interferers)
+    if k < interferers:
+        received_power = np.partition(received_power, interferers - k,
+            axis=-1)[..., interferers - k:]
+
+    peak = received_power.max(axis=-1, keepdims=True)
+    peak = np.where(np.isfinite(peak), peak, 0).astype(received_power.dtype)
+
+    with np.errstate(divide='ignore'):
+        i_summed = peak + np.log10(
+            (10**(received_power - peak)).sum(axis=-1, keepdims=True))
+
+    return i_summed[..., 0]
+
+
+def log_domain_sinr(received_power, i_summed, network_load, noise):
     """
 
-    Radio transmitter object.
+    SINR from log domain powers, in the precision of `received_power`.
 
     Parameters
     ----------
-    data : dict
-        Contains all object data parameters.
-    simulation_parameters : dict
-        A dict containing all simulation parameters necessary.
+    received_power : numpy.ndarray
+        Received power of the serving link.
+    i_summed : numpy.ndarray
+        log10 of the summed interference, from `top_k_log_interference`.
+    network_load : float
+        Network load (%) scaling the interference.
+    noise : float
+        log10 of the noise power, from `estimate_noise`.
+
+    Returns
+    -------
+    interference : numpy.ndarray
+        log10 of the load-scaled interference.
+    i_plus_n : numpy.ndarray
+        log10 of interference plus noise.
+    sinr : numpy.ndarray
+        SINR rounded to 0.01 in double precision.
 
     """
-    def __init__(self, data, ant_type, simulation_parameters):
+    dtype = received_power.dtype
 
-        self.id = data['properties']['site_id']
-        self.coordinates = data['geometry']['coordinates']
+    with np.errstate(divide='ignore'):
+        load = np.log10(dtype.type(network_load / 100))
 
-        self.ant_type = ant_type
+    interference = (i_summed + load).astype(dtype, copy=False)
+    noise = dtype.type(noise)
 
-        if ant_type == 'macro':
-            self.ant_height = simulation_parameters['tx_macro_baseline_height']
-            self.power = simulation_parameters['tx_macro_power']
-            self.gain = simulation_parameters['tx_macro_gain']
-            self.losses = simulation_parameters['tx_macro_losses']
+    #log10(10**a + 10**b) relative to the larger term
+    high = np.maximum(interference, noise)
+    low = np.minimum(interference, noise)
+    i_plus_n = high + np.log10(1 + 10**(low - high))
 
-        if ant_type == 'micro':
-            self.ant_height = simulation_parameters['tx_micro_baseline_height']
-            self.power = simulation_parameters['tx_micro_power']
-            self.gain = simulation_parameters['tx_micro_gain']
-            self.losses = simulation_parameters['tx_micro_losses']
+    sinr = np.round((received_power - i_plus_n).astype(float), 2)
 
+    return interference, i_plus_n, sinr
 
-class InterferingTransmitter(object):
+
+def loaded_sinr(received_power, raw_interference, interfering_cells,
+    cell_load, noise, k):
     """
 
-    A site object is specific site.
+    SINR with each interferer scaled by the load of its cell.
 
     Parameters
     ----------
-    data : dict
-        Contains all object data parameters.
-    simulation_parameters : dict
-        A dict containing all simulation parameters necessary.
+    received_power : numpy.ndarray
+        Received power of the serving link of each receiver.
+    raw_interference : numpy.ndarray
+        Interference of shape (receivers, interferers): linear powers
+        for double precision `received_power`, otherwise log powers, as
+        taken by `top_k_log_interference`.
+    interfering_cells : numpy.ndarray
+        Cell position of each interferer, broadcastable to
+        raw_interference. -1 marks a missing interferer.
+    cell_load : numpy.ndarray
+        Load (%) of each cell.
+    noise : float
+        log10 of the noise power, from `estimate_noise`.
+    k : int
+        Number of interferers summed, strongest after loading first.
+
+    Returns
+    -------
+    interference : numpy.ndarray
+        log10 of the loaded interference.
+    i_plus_n : numpy.ndarray
+        log10 of interference plus noise.
+    sinr : numpy.ndarray
+        SINR rounded to 0.01.
 
     """
-    def __init__(self, data, ant_type, simulation_parameters):
+    weights = np.where(interfering_cells >= 0,
+        cell_load[interfering_cells] / 100, 0)
 
-        self.id = data['properties']['site_id']
-        self.coordinates = data['geometry']['coordinates']
+    if received_power.dtype != np.float64:
+        with np.errstate(divide='ignore'):
+            log_weights = np.log10(weights).astype(received_power.dtype)
+        i_summed = top_k_log_interference(raw_interference + log_weights, k)
+        return log_domain_sinr(received_power, i_summed, 100, noise)
 
-        self.ant_type = ant_type
+    raw_sum_of_interference = top_k_interference(raw_interference * weights, k)
 
-        if ant_type == 'macro':
-            self.ant_height = simulation_parameters['tx_macro_baseline_height']
-            self.power = simulation_parameters['tx_macro_power']
-            self.gain = simulation_parameters['tx_macro_gain']
-            self.losses = simulation_parameters['tx_macro_losses']
+    i_plus_n = raw_sum_of_interference + 10**noise
 
-        if ant_type == 'micro':
-            self.ant_height = simulation_parameters['tx_micro_baseline_height']
-            self.power = simulation_parameters['tx_micro_power']
-            self.gain = simulation_parameters['tx_micro_gain']
-            self.losses = simulation_parameters['tx_micro_losses']
+    sinr = np.round(np.log10(10**received_power / i_plus_n), 2)
 
+    with np.errstate(divide='ignore'):
+        interference = np.log10(raw_sum_of_interference)
 
-class Receiver(object):
+    return interference, np.log10(i_plus_n), sinr
+
+
+def solve_cell_loads(received_power, raw_interference, interfering_cells,
+    serving_cells, demand_mbps, noise, bandwidth, modulation_and_coding_table,
+    cell_load, k=STRONGEST_INTERFERERS, tolerance=0.1, max_iterations=100):
     """
 
-    Radio receiver object (UE).
+    Fixed point of the cell loads, for all cells and receivers at once.
+
+    Each iteration finds the SINR of every receiver under the current
+    loads (`loaded_sinr`), and sets the load of each cell to the share
+    of the bandwidth its receivers need to meet their demand, capped at
+    100%. Receivers without capacity, which no share can serve, add no
+    load.
 
     Parameters
     ----------
-    data : dict
-        Contains all object data parameters.
-    simulation_parameters : dict
-        A dict containing all simulation parameters necessary.
+    received_power, raw_interference, interfering_cells, noise, k
+        As taken by `loaded_sinr`.
+    serving_cells : numpy.ndarray
+        Cell position serving each receiver.
+    demand_mbps : float or array_like
+        Demand of each receiver in Mbps.
+    bandwidth : float
+        The bandwidth of the carrier frequency (MHz).
+    modulation_and_coding_table : ModulationAndCodingTable
+        Table giving the spectral efficiency for each SINR.
+    cell_load : array_like
+        Starting load (%) of each cell.
+    tolerance : float
+        Largest change in any load (%) at convergence.
+    max_iterations : int
+        Most updates of the loads.
+
+    Returns
+    -------
+    cell_load : numpy.ndarray
+        Load (%) of each cell.
+    iterations : int
+        Number of updates made.
+    converged : bool
+        True if the last update changed no load by more than
+        `tolerance`.
 
     """
-    def __init__(self, data, simulation_parameters):
-        self.id = data['properties']['ue_id']
-        self.coordinates = data['geometry']["coordinates"]
+    cell_load = np.array(cell_load, dtype=float)
+    cells = len(cell_load)
 
-        self.ue_height = data['properties']['ue_height']
-        self.gain = data['properties']['gain']
-        self.losses = data['properties']['losses']
-        self.misc_losses = data['properties']['misc_losses']
-        self.indoor = data['properties']['indoor']
+    demand_mbps = np.broadcast_to(np.asarray(demand_mbps, dtype=float),
+        np.shape(serving_cells))
 
+    for iteration in range(1, max_iterations + 1):
 
-class SiteArea(object):
+        _, _, sinr = loaded_sinr(received_power, raw_interference,
+            interfering_cells, cell_load, noise, k)
+
+        capacity_mbps = bandwidth * (
+            modulation_and_coding_table.spectral_efficiency(sinr))
+
+        #receivers without capacity cannot be served by any share
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.where((demand_mbps > 0) & (capacity_mbps > 0),
+                demand_mbps / capacity_mbps, 0)
+
+        updated = np.minimum(100 * np.bincount(serving_cells, share,
+            minlength=cells), 100)
+
+        change = np.abs(updated - cell_load).max() if cells else 0
+        cell_load = updated
+
+        if change <= tolerance:
+            return cell_load, iteration, True
+
+    return cell_load, max_iterations, False
+
+
+def link_budget_dtype(simulation_parameters):
     """
+    Floating point type of the link budget arrays, as set by
+    simulation_parameters['precision'] (one of PRECISIONS).
+
+    """
+    precision = simulation_parameters.get('precision', 'float64')
+
+    if precision not in PRECISIONS:
+        raise ValueError('Did not recognise precision: {}'.format(precision))
+
+    return np.dtype(precision)
 
-    site area object.
+
+def sector_capacity(columns):
+    """
+
+    Receivers and mean capacity of each serving sector.
 
     Parameters
     ----------
-    data : dict
-        Contains all object data parameters.
+    columns : dict
+        Link budget columns computed with an antenna pattern, holding
+        `sector` and, from `NetworkSimulationManager`, `serving_site`.
+
+    Returns
+    -------
+    sectors : OrderedDict
+        Columns with one element per sector serving at least one
+        receiver: serving_site (if given), sector, receivers, and the
+        mean capacity_mbps and capacity_mbps_km2 of its receivers.
 
     """
-    def __init__(self, data):
-        self.id = data['properties']['site_id']
-        self.geometry = data['geometry']
-        self.coordinates = data['geometry']['coordinates']
-        self.area = self._calculate_area(data)
+    if 'sector' not in columns:
+        raise ValueError('Link budget has no sector column')
 
+    sector = np.asarray(columns['sector'], dtype=np.int64)
+    sectors = int(sector.max()) + 1 if len(sector) else 1
 
-    def _calculate_area(self, data):
-        polygon = shape(data['geometry'])
-        area = polygon.area
-        return area
+    if 'serving_site' in columns:
+        site_ids, site = np.unique(np.asarray(columns['serving_site']),
+            return_inverse=True)
+        keys = site.ravel() * sectors + sector
+    else:
+        keys = sector
+
+    unique, inverse = np.unique(keys, return_inverse=True)
+    receivers = np.bincount(inverse, minlength=len(unique))
+
+    summary = OrderedDict()
+
+    if 'serving_site' in columns:
+        summary['serving_site'] = site_ids[unique // sectors]
+    summary['sector'] = unique % sectors
+    summary['receivers'] = receivers
+
+    for metric in ('capacity_mbps', 'capacity_mbps_km2'):
+        summary[metric] = np.bincount(inverse,
+            np.asarray(columns[metric], dtype=float),
+            minlength=len(unique)) / receivers
+
+    return summary
+
+
+def _columns_to_records(columns):
+    """
+    Convert a dict of equal length columns into a list of dicts.
+
+    """
+    keys = list(columns.keys())
+    values = [
+        column.tolist() if isinstance(column, np.ndarray) else list(column)
+        for column in columns.values()
+    ]
+
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+def _summarise_draws(metric, draws, percentiles):
+    """
+    Mean, variance and percentiles over the first (draw) axis.
+
+    """
+    summary = OrderedDict()
+
+    summary['{}_mean'.format(metric)] = draws.mean(axis=0)
+    summary['{}_var'.format(metric)] = draws.var(axis=0)
+
+    if len(percentiles):
+        values = np.percentile(draws, percentiles, axis=0)
+        for percentile, value in zip(percentiles, values):
+            summary['{}_p{}'.format(metric, percentile)] = value
+
+    return summary
 
 
 def pairwise(iterable):
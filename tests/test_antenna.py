@@ -0,0 +1,79 @@
+"""
+Tests for the sectorised antenna patterns.
+
+"""
+import numpy as np
+import pytest
+
+from seismic.antenna import (get_antenna_pattern, link_azimuth,
+    SectorAntennaPattern)
+
+
+def test_boresight_gain_is_zero():
+
+    pattern = SectorAntennaPattern(3, 65, 30, azimuth=10)
+
+    np.testing.assert_array_equal(pattern.gain([10, 130, 250, -110]), 0)
+
+
+def test_half_beamwidth_gain_is_3db():
+
+    pattern = SectorAntennaPattern(3, 65, 30, azimuth=10)
+
+    np.testing.assert_allclose(pattern.gain([10 + 32.5, 10 - 32.5, 130 + 32.5]),
+        -3)
+
+
+def test_gain_is_capped_at_front_to_back():
+
+    pattern = SectorAntennaPattern(3, 30, 20)
+
+    #between two sectors, 60 degrees from both boresights
+    assert pattern.gain(60) == -20
+    assert pattern.gain(-60) == -20
+    assert (pattern.gain(np.arange(-180, 180)) >= -20).all()
+
+    #12 * (40 / 30)**2 is above the cap
+    assert pattern.gain(40) == -20
+    assert pattern.gain(20) == pytest.approx(-12 * (20 / 30)**2)
+
+
+def test_sector_and_offset_of_each_azimuth():
+
+    pattern = SectorAntennaPattern(3, 65, 30, azimuth=0)
+
+    np.testing.assert_array_equal(pattern.sector([0, 59, 61, 120, 179, 181,
+        240, 299, 301, 360, -1]), [0, 0, 1, 1, 1, 2, 2, 2, 0, 0, 0])
+    np.testing.assert_allclose(pattern.offset([0, 59, 61, 179, 181, -1]),
+        [0, 59, -59, 59, -59, -1])
+
+
+def test_single_sector_is_omnidirectional():
+
+    pattern = SectorAntennaPattern(1)
+
+    np.testing.assert_array_equal(pattern.gain(np.arange(-180, 180, 15)), 0)
+    np.testing.assert_array_equal(pattern.sector(np.arange(-180, 180, 15)),
+        0)
+
+
+def test_link_azimuth_is_clockwise_from_north():
+
+    np.testing.assert_allclose(link_azimuth([0, 1, 0, -1], [1, 0, -1, 0]),
+        [0, 90, 180, -90])
+
+
+def test_get_antenna_pattern():
+
+    pattern = SectorAntennaPattern(3, 65, 30, 0)
+
+    assert get_antenna_pattern({}) is None
+    assert get_antenna_pattern({'antenna_pattern': pattern}) is pattern
+    assert get_antenna_pattern({'antenna_pattern': 'sectorised',
+        'sectorization': 3}) == pattern
+
+    with pytest.raises(ValueError):
+        get_antenna_pattern({'antenna_pattern': 'other'})
+
+    with pytest.raises(ValueError):
+        SectorAntennaPattern(0)
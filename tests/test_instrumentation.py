@@ -0,0 +1,56 @@
+"""
+Tests for the stage timings and counters.
+
+"""
+import json
+
+from seismic.instrumentation import StageTimings
+
+
+def test_stages_add_time_and_calls():
+
+    timings = StageTimings()
+
+    for _ in range(3):
+        with timings.stage('path_loss'):
+            pass
+    timings.add('sinr', 0.5, calls=2)
+
+    assert timings.stages['path_loss']['calls'] == 3
+    assert timings.stages['path_loss']['seconds'] >= 0
+    assert timings.stages['sinr'] == {'seconds': 0.5, 'calls': 2}
+
+
+def test_stage_is_recorded_when_it_raises():
+
+    timings = StageTimings()
+
+    try:
+        with timings.stage('path_loss'):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert timings.stages['path_loss']['calls'] == 1
+
+
+def test_counters_serialise_and_reset(tmp_path):
+
+    timings = StageTimings()
+    timings.count('cache_hit.distance')
+    timings.count('cache_hit.distance')
+    timings.count('candidate_pairs', 40)
+    timings.add('distance', 0.25)
+
+    path = str(tmp_path / 'timings.json')
+    text = timings.to_json(path)
+
+    with open(path) as f:
+        assert f.read() == text
+    assert json.loads(text) == {
+        'stages': {'distance': {'seconds': 0.25, 'calls': 1}},
+        'counters': {'cache_hit.distance': 2, 'candidate_pairs': 40},
+    }
+
+    timings.reset()
+    assert timings.as_dict() == {'stages': {}, 'counters': {}}
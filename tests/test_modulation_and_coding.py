@@ -0,0 +1,133 @@
+"""
+Tests for the modulation and coding scheme lookups.
+
+The compiled table is compared with copies of the lookups it replaced:
+the if/elif chain in scripts/power.py and the pairwise loop of
+SimulationManager.estimate_spectral_efficiency.
+
+"""
+import numpy as np
+import pytest
+
+from seismic.modulation_and_coding import (get_modulation_and_coding_table,
+    legacy_lookup, ModulationAndCodingTable)
+
+
+LOOKUP = [
+    ('4G', '1x1', 1, 'QPSK', 78, 0.1523, -6.7),
+    ('4G', '1x1', 2, 'QPSK', 120, 0.2344, -4.7),
+    ('4G', '1x1', 3, 'QPSK', 193, 0.377, -2.3),
+    ('4G', '1x1', 4, 'QPSK', 308, 0.6016, 0.2),
+    ('4G', '1x1', 5, 'QPSK', 449, 0.877, 2.4),
+    ('4G', '1x1', 6, 'QPSK', 602, 1.1758, 4.3),
+    ('4G', '1x1', 7, '16QAM', 378, 1.4766, 5.9),
+    ('4G', '1x1', 8, '16QAM', 490, 1.9141, 8.1),
+    ('4G', '1x1', 9, '16QAM', 616, 2.4063, 10.3),
+    ('4G', '1x1', 10, '64QAM', 466, 2.7305, 11.7),
+    ('4G', '1x1', 11, '64QAM', 567, 3.3223, 14.1),
+    ('4G', '1x1', 12, '64QAM', 666, 3.9023, 16.3),
+    ('4G', '1x1', 13, '64QAM', 772, 4.5234, 18.7),
+    ('4G', '1x1', 14, '64QAM', 873, 5.1152, 21),
+    ('4G', '1x1', 15, '64QAM', 948, 5.5547, 22.7),
+]
+
+
+def original_required_sinr(spectral_efficiency):
+    """
+    The if/elif chain of the original power.py, except that demand above
+    the table gives the highest SINR estimate (22.7) rather than 22.3.
+
+    """
+    for row in LOOKUP[:-1]:
+        if spectral_efficiency < row[5]:
+            return row[6]
+    return LOOKUP[-1][6]
+
+
+def original_spectral_efficiency(sinr):
+    """
+    The pairwise loop of the original estimate_spectral_efficiency.
+
+    """
+    for lower, upper in zip(LOOKUP, LOOKUP[1:]):
+        if sinr >= lower[6] and sinr < upper[6]:
+            return lower[5]
+        if sinr >= LOOKUP[-1][6]:
+            return LOOKUP[-1][5]
+        if sinr < LOOKUP[0][5]:
+            return 0
+    return 0.1
+
+
+def test_required_sinr_matches_the_power_chain():
+
+    table = ModulationAndCodingTable(LOOKUP)
+
+    efficiencies = [row[5] for row in LOOKUP]
+    demand = np.concatenate([
+        [0, 0.1, 6, 10],
+        efficiencies,
+        np.nextafter(efficiencies, -np.inf),
+        np.linspace(0, 6, 601),
+    ])
+
+    np.testing.assert_array_equal(table.required_sinr(demand),
+        [original_required_sinr(value) for value in demand])
+
+
+def test_required_sinr_at_a_table_efficiency_needs_the_next_scheme():
+
+    table = ModulationAndCodingTable(LOOKUP)
+
+    assert table.required_sinr(0.1523) == -4.7
+    assert table.required_sinr(0.15) == -6.7
+    assert table.required_sinr(5.1152) == 22.7
+    assert np.isnan(table.required_sinr(np.nan))
+
+
+def test_legacy_spectral_efficiency_matches_the_original_loop():
+
+    table = ModulationAndCodingTable(LOOKUP, legacy=True)
+
+    sinr = np.concatenate([
+        [row[6] for row in LOOKUP],
+        np.round(np.arange(-10, 30, 0.01), 2),
+    ])
+
+    np.testing.assert_array_equal(table.spectral_efficiency(sinr),
+        [original_spectral_efficiency(value) for value in sinr])
+
+
+def test_corrected_spectral_efficiency_has_no_gap():
+
+    legacy = ModulationAndCodingTable(LOOKUP, legacy=True)
+    corrected = ModulationAndCodingTable(LOOKUP)
+
+    #from the second scheme's estimate up to the lowest efficiency
+    sinr = np.array([-4.7, -3, 0.1])
+
+    np.testing.assert_array_equal(legacy.spectral_efficiency(sinr), 0)
+    np.testing.assert_array_equal(corrected.spectral_efficiency(sinr),
+        [0.2344, 0.2344, 0.377])
+
+    assert corrected.spectral_efficiency(-6.8) == 0
+    assert corrected.spectral_efficiency(-6.7) == 0.1523
+    assert corrected.spectral_efficiency(30) == 5.5547
+
+
+def test_tables_are_shared_per_lookup_and_mode():
+
+    assert (get_modulation_and_coding_table(LOOKUP) is
+        get_modulation_and_coding_table(list(LOOKUP)))
+    assert (get_modulation_and_coding_table(LOOKUP) is not
+        get_modulation_and_coding_table(LOOKUP, legacy=True))
+
+
+def test_legacy_lookup_setting():
+
+    assert legacy_lookup({})
+    assert legacy_lookup({'spectral_efficiency_lookup': 'legacy'})
+    assert not legacy_lookup({'spectral_efficiency_lookup': 'corrected'})
+
+    with pytest.raises(ValueError):
+        legacy_lookup({'spectral_efficiency_lookup': 'other'})
@@ -0,0 +1,48 @@
+"""
+Tests for the propagation models.
+
+"""
+import numpy as np
+import pytest
+
+from seismic.path_loss import (BasePropagationModel, build_propagation_model,
+    maximum_distance, PropagationModel, register_propagation_model,
+    PROPAGATION_MODELS)
+
+
+def test_model_without_evaluate_fails_at_construction():
+
+    class IncompleteModel(BasePropagationModel):
+        pass
+
+    register_propagation_model('incomplete', IncompleteModel)
+    try:
+        with pytest.raises(TypeError):
+            build_propagation_model('incomplete', 0.8, 'macro', 'rural', 5,
+                20, 30, 1.5)
+    finally:
+        del PROPAGATION_MODELS['incomplete']
+
+
+@pytest.mark.parametrize('environment', ['rural', 'suburban', 'urban'])
+@pytest.mark.parametrize('type_of_sight', ['los', 'nlos'])
+def test_maximum_distance_round_trips_through_the_model(environment,
+    type_of_sight):
+
+    model = PropagationModel(0.8, 'macro', environment, 5, 20, 30, 1.5, 16, 1)
+    distances = np.array([50.0, 300, 1000, 2500, 4000])
+    los = np.full(distances.size, type_of_sight == 'los')
+    indoor = np.zeros(distances.size, dtype=bool)
+
+    max_path_loss, _ = model.evaluate(distances, los, indoor)
+
+    tolerance = 0.5
+    found = maximum_distance(max_path_loss, 0.8, 'macro', environment, 5, 20,
+        30, 1.5, type_of_sight, seed_value=16, iterations=1,
+        tolerance=tolerance)
+
+    #path loss is rounded, so the limit holds over a range of distances
+    assert (found >= distances).all()
+    assert (model.evaluate(found, los, indoor)[0] <= max_path_loss).all()
+    assert (model.evaluate(found + tolerance, los, indoor)[0] >
+        max_path_loss).all()
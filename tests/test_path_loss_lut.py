@@ -0,0 +1,89 @@
+"""
+Tests for the path loss lookup tables.
+
+"""
+import numpy as np
+import pytest
+
+from seismic.path_loss import PropagationModel
+from seismic.path_loss_lut import (build_path_loss_lut, PathLossLUT,
+    TabulatedPropagationModel, TYPES_OF_SIGHT)
+
+
+FREQUENCY = 0.8
+MODEL_ARGS = ('macro', 'rural', 5, 20, 30, 1.5, 16, 1)
+
+
+@pytest.fixture(scope='module')
+def lut_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('lut'))
+    build_path_loss_lut(path, [FREQUENCY], np.arange(20, 10001, 5.0), [30],
+        ['rural'], 'macro', 5, 20, 1.5, 0, 16, 1)
+    return path
+
+
+def analytic_model():
+    return PropagationModel(FREQUENCY, *MODEL_ARGS)
+
+
+def test_interpolation_within_reported_error(lut_path):
+
+    lut = PathLossLUT(lut_path)
+    model = lut.propagation_model(FREQUENCY, *MODEL_ARGS)
+    assert isinstance(model, TabulatedPropagationModel)
+
+    distances = np.linspace(20, 10000, 20001)
+
+    for s_idx, type_of_sight in enumerate(TYPES_OF_SIGHT):
+        tabulated, _ = model.etsi_tr_138_901(distances, type_of_sight)
+        exact, _ = analytic_model().etsi_tr_138_901(distances, type_of_sight)
+
+        #the bound is measured on a finite check grid
+        assert np.abs(tabulated - exact).max() <= (
+            lut.max_error[0, 0, 0, s_idx] + 0.5)
+
+
+def test_error_bound_covers_the_breakpoint(lut_path):
+
+    lut = PathLossLUT(lut_path)
+    model = lut.propagation_model(FREQUENCY, *MODEL_ARGS)
+    breakpoint = analytic_model().dbp
+
+    tabulated, _ = model.etsi_tr_138_901([breakpoint], 'los')
+    exact, _ = analytic_model().etsi_tr_138_901([breakpoint], 'los')
+
+    assert np.abs(tabulated - exact).max() <= lut.max_error[0, 0, 0, 0]
+
+
+def test_exact_and_uncovered_parameters_use_the_analytic_model(lut_path):
+
+    lut = PathLossLUT(lut_path)
+
+    assert isinstance(lut.propagation_model(FREQUENCY, *MODEL_ARGS,
+        exact=True), PropagationModel)
+    assert isinstance(lut.propagation_model(3.5, *MODEL_ARGS),
+        PropagationModel)
+
+
+def test_distances_off_the_grid_use_the_analytic_model(lut_path):
+
+    model = PathLossLUT(lut_path).propagation_model(FREQUENCY, *MODEL_ARGS)
+    distances = np.array([12.0, 10000.5])
+
+    np.testing.assert_array_equal(
+        model.etsi_tr_138_901(distances, 'nlos')[0],
+        analytic_model().etsi_tr_138_901(distances, 'nlos')[0])
+
+
+def test_rows_above_the_error_bound_use_the_analytic_model(lut_path):
+
+    lut = PathLossLUT(lut_path, max_error_db=0)
+    assert (lut.max_error > 0).all()
+
+    model = lut.propagation_model(FREQUENCY, *MODEL_ARGS)
+    distances = np.linspace(20, 10000, 1001)
+
+    for type_of_sight in TYPES_OF_SIGHT:
+        np.testing.assert_array_equal(
+            model.etsi_tr_138_901(distances, type_of_sight)[0],
+            analytic_model().etsi_tr_138_901(distances, type_of_sight)[0])
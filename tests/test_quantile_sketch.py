@@ -0,0 +1,127 @@
+"""
+Tests for the streaming quantile sketches.
+
+"""
+import numpy as np
+import pytest
+
+from seismic.quantile_sketch import (LinkBudgetSketches, QuantileSketch,
+    sketch_link_budget)
+
+
+PERCENTILES = np.arange(1, 100)
+
+
+def rank_error(values, sketch):
+    """
+    Largest distance between each requested percentile and the rank of
+    its estimate within the sorted values.
+
+    """
+    values = np.sort(values)
+    estimates = sketch.percentile(PERCENTILES)
+    ranks = np.searchsorted(values, estimates, side='right') / len(values)
+
+    return np.abs(ranks - PERCENTILES / 100).max()
+
+
+@pytest.fixture(scope='module')
+def values():
+    return np.random.default_rng(3).lognormal(0, 1, 200000)
+
+
+def test_rank_error_within_bound(values):
+
+    sketch = QuantileSketch(200, seed=1).update(values)
+
+    assert sketch.count == len(values)
+    assert sketch.size < 3 * sketch.k
+    assert rank_error(values, sketch) <= 0.01
+
+
+def test_merged_chunks_within_the_same_bound(values):
+
+    merged = QuantileSketch(200, seed=1)
+    for idx, chunk in enumerate(np.array_split(values, 16)):
+        merged.merge(QuantileSketch(200, seed=idx).update(chunk))
+
+    assert merged.count == len(values)
+    assert merged.size < 3 * merged.k
+    assert merged.min == values.min()
+    assert merged.max == values.max()
+    assert rank_error(values, merged) <= 0.01
+
+
+def test_small_streams_are_exact():
+
+    values = np.random.default_rng(4).normal(size=150)
+
+    sketch = QuantileSketch(200).update(values[:50]).merge(
+        QuantileSketch(200).update(values[50:]))
+
+    expected = np.sort(values)[np.ceil(PERCENTILES / 100 * 150).astype(int) - 1]
+    np.testing.assert_array_equal(sketch.percentile(PERCENTILES), expected)
+    assert sketch.quantile(0) == values.min()
+    assert sketch.quantile(1) == values.max()
+
+
+def test_seeded_sketches_repeat(values):
+
+    first = QuantileSketch(200, seed=7).update(values)
+    second = QuantileSketch(200, seed=7).update(values)
+
+    np.testing.assert_array_equal(first.percentile(PERCENTILES),
+        second.percentile(PERCENTILES))
+
+
+def test_nan_values_are_ignored():
+
+    sketch = QuantileSketch().update([np.nan, 1.0, np.nan, 3.0])
+
+    assert len(sketch) == 2
+    assert sketch.percentile(50) == 1.0
+    assert np.isnan(QuantileSketch().percentile(50))
+
+
+def test_invalid_sketches():
+
+    with pytest.raises(ValueError):
+        QuantileSketch(4)
+
+    with pytest.raises(ValueError):
+        QuantileSketch(200).merge(QuantileSketch(100).update([1.0]))
+
+    with pytest.raises(ValueError):
+        QuantileSketch(200).update([1.0]).quantile(1.5)
+
+
+def test_link_budget_sketches_merge_by_metric():
+
+    rng = np.random.default_rng(5)
+    results = [
+        {'sinr': rng.normal(5, 3, 1000), 'capacity_mbps': rng.random(1000)}
+        for _ in range(2)
+    ]
+
+    sketches = LinkBudgetSketches(('sinr', 'capacity_mbps'), seed=1).update(
+        results[0]).merge(LinkBudgetSketches(('sinr', 'capacity_mbps'),
+        seed=2).update(results[1]))
+
+    percentiles = sketches.percentiles([5, 50, 95])
+    assert list(percentiles) == ['sinr_p5', 'sinr_p50', 'sinr_p95',
+        'capacity_mbps_p5', 'capacity_mbps_p50', 'capacity_mbps_p95']
+
+    for metric, sketch in sketches.items():
+        assert sketch.count == 2000
+        assert rank_error(np.concatenate([result[metric]
+            for result in results]), sketch) <= 0.01
+
+
+def test_sketch_link_budget_is_seeded_by_task(values):
+
+    result = {metric: values for metric in ('sinr', 'spectral_efficiency',
+        'capacity_mbps', 'capacity_mbps_km2')}
+    task = ('baseline', 'macro', 'rural', 2000, 0.8, 10, '4G', '2x2')
+
+    assert (sketch_link_budget(task, result).percentiles(PERCENTILES) ==
+        sketch_link_budget(task, result).percentiles(PERCENTILES))
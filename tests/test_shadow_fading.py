@@ -0,0 +1,64 @@
+"""
+Tests for the shadow fading streams.
+
+"""
+import numpy as np
+import pytest
+
+from seismic.path_loss import generate_log_normal_dist_value
+from seismic.shadow_fading import ShadowFading
+
+
+@pytest.fixture
+def stream():
+    return ShadowFading(16, 0.8, 'baseline', '4G', 'rural', iterations=5)
+
+
+def test_subset_matches_full_draws(stream):
+
+    full = stream.sample_draws(1, 4, np.arange(1000))
+    link_ids = np.array([3, 4, 5, 500, 999])
+
+    np.testing.assert_array_equal(stream.sample_draws(1, 4, link_ids),
+        full[:, link_ids])
+
+
+def test_draws_do_not_depend_on_order_or_repeats(stream):
+
+    link_ids = np.array([999, 3, 500, 4, 3])
+    draws = stream.sample_draws(1, 4, link_ids)
+
+    for position, link_id in enumerate(link_ids):
+        np.testing.assert_array_equal(draws[:, position],
+            stream.sample_draws(1, 4, [link_id])[:, 0])
+
+
+def test_draws_repeat_across_instances(stream):
+
+    other = ShadowFading(16, 0.8, 'baseline', '4G', 'rural', iterations=5)
+
+    np.testing.assert_array_equal(stream.sample(1, 4, np.arange(50)),
+        other.sample(1, 4, np.arange(50)))
+    assert stream == other
+    assert hash(stream) == hash(other)
+
+
+def test_streams_differ_by_key(stream):
+
+    other = ShadowFading(16, 0.8, 'baseline', '4G', 'urban', iterations=5)
+
+    assert not np.array_equal(stream.sample(1, 4, np.arange(50)),
+        other.sample(1, 4, np.arange(50)))
+    assert stream != other
+
+
+@pytest.mark.parametrize('frequency', [0.8, 1.8, 3.5])
+@pytest.mark.parametrize('draws', [1, 4])
+def test_legacy_matches_generate_log_normal_dist_value(frequency, draws):
+
+    legacy = ShadowFading(16, frequency, iterations=draws, legacy=True)
+
+    expected = generate_log_normal_dist_value(frequency, 1, 4, draws, 16)
+
+    np.testing.assert_array_equal(legacy.sample(1, 4, [0, 1, 2]),
+        np.full(3, expected))
@@ -0,0 +1,582 @@
+"""
+Regression tests for the link budget.
+
+Checks that the faster paths give the same results as the original
+per-receiver loop, on a synthetic layout of one serving site surrounded
+by six interfering sites.
+
+"""
+import math
+
+import numpy as np
+import pytest
+
+from seismic.antenna import link_azimuth, SectorAntennaPattern
+from seismic.modulation_and_coding import ModulationAndCodingTable
+from seismic.path_loss import PropagationModel
+from seismic.quantile_sketch import sketch_link_budget
+from seismic.sweep import expand_sweep, run_sweep
+from seismic.system_simulator import (loaded_sinr, MIN_DISTANCE,
+    NetworkSimulationManager, ReceiverArrays, SimulationManager,
+    solve_cell_loads)
+
+
+MODULATION_AND_CODING_LUT = {
+    '4G': [
+        ('4G', '2x2', 1, 'QPSK', 78, 0.3, -6.7),
+        ('4G', '2x2', 2, 'QPSK', 120, 0.46, -4.7),
+        ('4G', '2x2', 3, 'QPSK', 193, 0.74, -2.3),
+        ('4G', '2x2', 4, 'QPSK', 308, 1.2, 0.2),
+        ('4G', '2x2', 5, 'QPSK', 449, 1.6, 2.4),
+        ('4G', '2x2', 6, 'QPSK', 602, 2.2, 4.3),
+        ('4G', '2x2', 7, '16QAM', 378, 2.8, 5.9),
+        ('4G', '2x2', 8, '16QAM', 490, 3.8, 8.1),
+        ('4G', '2x2', 9, '16QAM', 616, 4.8, 10.3),
+        ('4G', '2x2', 10, '64QAM', 466, 5.4, 11.7),
+        ('4G', '2x2', 11, '64QAM', 567, 6.6, 14.1),
+        ('4G', '2x2', 12, '64QAM', 666, 7.8, 16.3),
+        ('4G', '2x2', 13, '64QAM', 772, 9, 18.7),
+        ('4G', '2x2', 14, '64QAM', 973, 10.2, 21),
+        ('4G', '2x2', 15, '64QAM', 948, 11.4, 22.7),
+    ]
+}
+
+PARAMETERS = {
+    'iterations': 1,
+    'seed_value1_4G': 3,
+    'seed_value2_4G': 4,
+    'seed_value1_rural': 11,
+    'seed_value2_rural': 12,
+    'indoor_users_percentage': 50,
+    'los_breakpoint_m': 500,
+    'tx_macro_baseline_height': 30,
+    'tx_macro_power': 20,
+    'tx_macro_gain': 16,
+    'tx_macro_losses': 1,
+    'rx_gain': 0,
+    'rx_losses': 4,
+    'rx_misc_losses': 4,
+    'rx_height': 1.5,
+    'building_height': 5,
+    'street_width': 20,
+    'above_roof': 0,
+    'network_load': 100,
+    'percentile': 50,
+    'sectorization': 3,
+}
+
+STREAM = {'shadow_fading': 'stream', 'scenario': 'baseline'}
+
+
+def setup_geometry(quantity=300, radius=5000, seed=1):
+    """
+    Serving site at the origin, six interfering sites on a ring of
+    2 * radius, and receivers spread over 90% of the serving hexagon.
+
+    """
+    rng = np.random.default_rng(seed)
+
+    def point(site_id, x, y):
+        return {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': (x, y)},
+            'properties': {'site_id': site_id},
+        }
+
+    transmitter = [point('tx', 0.0, 0.0)]
+
+    interfering_transmitters = [
+        point('i{}'.format(k), 2 * radius * math.cos(k * math.pi / 3),
+            2 * radius * math.sin(k * math.pi / 3))
+        for k in range(6)
+    ]
+
+    hexagon = [
+        (radius * math.cos(k * math.pi / 3 + math.pi / 6),
+        radius * math.sin(k * math.pi / 3 + math.pi / 6))
+        for k in range(7)
+    ]
+    site_area = [{
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': [hexagon]},
+        'properties': {'site_id': 'tx'},
+    }]
+
+    receivers = []
+    for idx in range(quantity):
+        distance = radius * 0.9 * math.sqrt(rng.random())
+        angle = rng.random() * 2 * math.pi
+        receivers.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [distance * math.cos(angle),
+                    distance * math.sin(angle)],
+            },
+            'properties': {
+                'ue_id': 'id_{}'.format(idx),
+                'misc_losses': PARAMETERS['rx_misc_losses'],
+                'gain': PARAMETERS['rx_gain'],
+                'losses': PARAMETERS['rx_losses'],
+                'ue_height': PARAMETERS['rx_height'],
+                'indoor': bool(rng.random() < 0.5),
+            },
+        })
+
+    return transmitter, interfering_transmitters, site_area, receivers
+
+
+@pytest.fixture(scope='module')
+def geometry():
+    return setup_geometry()
+
+
+def build_manager(geometry, simulation_parameters):
+    transmitter, interfering_transmitters, site_area, receivers = geometry
+    return SimulationManager(transmitter, interfering_transmitters, 'macro',
+        receivers, site_area, simulation_parameters)
+
+
+def link_budget_args(simulation_parameters):
+    return (0.8, 10, '4G', 'macro', '2x2', 'rural', MODULATION_AND_CODING_LUT,
+        simulation_parameters)
+
+
+def assert_records_equal(expected, actual):
+    assert len(expected) == len(actual)
+    for expected_record, actual_record in zip(expected, actual):
+        assert expected_record.keys() == actual_record.keys()
+        for key, value in expected_record.items():
+            if isinstance(value, str):
+                assert actual_record[key] == value
+            else:
+                assert actual_record[key] == pytest.approx(value, rel=1e-12,
+                    abs=1e-12, nan_ok=True), key
+
+
+@pytest.mark.parametrize('extra', [{}, STREAM])
+def test_vectorised_matches_loop(geometry, extra):
+
+    simulation_parameters = dict(PARAMETERS, **extra)
+    args = link_budget_args(simulation_parameters)
+
+    loop = build_manager(geometry, simulation_parameters).estimate_link_budget(
+        *args, vectorised=False)
+    vectorised = build_manager(geometry,
+        simulation_parameters).estimate_link_budget(*args, vectorised=True)
+
+    assert_records_equal(loop, vectorised)
+
+
+@pytest.mark.parametrize('extra', [{}, STREAM])
+def test_chunks_match_full_run(geometry, extra):
+
+    simulation_parameters = dict(PARAMETERS, **extra)
+    args = link_budget_args(simulation_parameters)
+
+    manager = build_manager(geometry, simulation_parameters)
+    full = manager.estimate_link_budget(*args, vectorised=True)
+
+    chunks = []
+    for chunk in build_manager(geometry, simulation_parameters).iter_link_budget(
+        *args, chunk_size=70, output='records'):
+        chunks.extend(chunk)
+
+    assert_records_equal(full, chunks)
+
+
+@pytest.mark.parametrize('environment', ['rural', 'suburban', 'urban'])
+@pytest.mark.parametrize('iterations', [1, 3])
+def test_jit_kernel_matches_numpy(environment, iterations):
+
+    pytest.importorskip('numba')
+
+    rng = np.random.default_rng(5)
+    distances = rng.uniform(20, 4999, 5000)
+    type_of_sight = rng.random(distances.size) < 0.5
+    indoor = rng.random(distances.size) < 0.5
+
+    results = [
+        PropagationModel(3.5, 'macro', environment, 20, 20, 30, 1.5, 16,
+            iterations, jit=jit).evaluate(distances, type_of_sight, indoor)
+        for jit in (False, True)
+    ]
+
+    np.testing.assert_array_equal(results[0][0], results[1][0])
+    np.testing.assert_array_equal(results[0][1], results[1][1])
+
+
+@pytest.mark.parametrize('extra', [{}, STREAM])
+def test_float32_within_documented_tolerance(geometry, extra):
+
+    simulation_parameters = dict(PARAMETERS, **extra)
+    single_parameters = dict(simulation_parameters, precision='float32')
+
+    double = build_manager(geometry,
+        simulation_parameters).estimate_link_budget_arrays(
+        *link_budget_args(simulation_parameters))
+    single = build_manager(geometry,
+        single_parameters).estimate_link_budget_arrays(
+        *link_budget_args(single_parameters))
+
+    np.testing.assert_allclose(single['distance'], double['distance'],
+        rtol=1e-7)
+    np.testing.assert_array_equal(single['path_loss'], double['path_loss'])
+
+    for key in ('received_power', 'interference', 'i_plus_n'):
+        expected = np.asarray(double[key], dtype=float)
+        actual = np.asarray(single[key], dtype=float)
+        finite = np.isfinite(expected) & np.isfinite(actual)
+        assert finite.mean() > 0.99, key
+        np.testing.assert_allclose(actual[finite], expected[finite],
+            rtol=0, atol=1e-4)
+
+    #rounding may only move SINR by one step of 0.01
+    sinr_difference = np.abs(np.asarray(single['sinr'], dtype=float) -
+        np.asarray(double['sinr'], dtype=float))
+    assert (sinr_difference <= 0.01 + 1e-9).all()
+    assert (sinr_difference == 0).mean() > 0.99
+
+    same_sinr = sinr_difference == 0
+    np.testing.assert_array_equal(
+        np.asarray(single['capacity_mbps'])[same_sinr],
+        np.asarray(double['capacity_mbps'])[same_sinr])
+
+
+def setup_sweep(quantity=200):
+    """
+    Two scenarios, two bands and two site radii.
+
+    """
+    geometries = {}
+    for radius in (2000, 5000):
+        transmitter, interfering_transmitters, site_area, receivers = \
+            setup_geometry(quantity=quantity, radius=radius)
+        geometries[radius] = (transmitter, interfering_transmitters,
+            site_area, receivers)
+
+    parameters = {
+        'baseline': dict(PARAMETERS),
+        'stream': dict(PARAMETERS, **STREAM),
+    }
+
+    tasks = expand_sweep(parameters, [(0.8, 10, '4G', '2x2'),
+        (1.8, 20, '4G', '2x2')], ['macro'], ['rural'],
+        {'macro': {'rural': [2000, 5000]}})
+
+    return tasks, geometries, parameters
+
+
+def test_sweep_serial_matches_pool():
+
+    tasks, geometries, parameters = setup_sweep()
+
+    serial = run_sweep(tasks, geometries, parameters,
+        MODULATION_AND_CODING_LUT, processes=1)
+    pool = run_sweep(tasks, geometries, parameters,
+        MODULATION_AND_CODING_LUT, processes=2)
+
+    assert [task for task, _ in serial] == tasks
+    assert [task for task, _ in pool] == tasks
+
+    for (_, expected), (_, actual) in zip(serial, pool):
+        assert_records_equal(expected.to_records(), actual.to_records())
+
+
+def test_sweep_sketches_serial_match_pool():
+
+    #enough receivers for the sketches to compact
+    tasks, geometries, parameters = setup_sweep(quantity=1000)
+
+    serial = run_sweep(tasks, geometries, parameters,
+        MODULATION_AND_CODING_LUT, processes=1, summarise=sketch_link_budget)
+    pool = run_sweep(tasks, geometries, parameters,
+        MODULATION_AND_CODING_LUT, processes=2, summarise=sketch_link_budget)
+
+    percentiles = [5, 50, 95]
+    for (_, expected), (_, actual) in zip(serial, pool):
+        assert (expected.percentiles(percentiles) ==
+            actual.percentiles(percentiles))
+        for metric, sketch in expected.items():
+            assert sketch.size < len(sketch)
+            np.testing.assert_array_equal(np.concatenate(sketch.levels),
+                np.concatenate(actual[metric].levels))
+
+
+@pytest.mark.parametrize('extra', [{}, STREAM])
+def test_monte_carlo_does_not_depend_on_chunk_size(geometry, extra):
+
+    simulation_parameters = dict(PARAMETERS, iterations=20, **extra)
+    args = link_budget_args(simulation_parameters)
+
+    default = build_manager(geometry,
+        simulation_parameters).estimate_link_budget_monte_carlo(*args)
+    chunked = build_manager(geometry,
+        simulation_parameters).estimate_link_budget_monte_carlo(*args,
+        chunk_size=7)
+
+    assert_records_equal(default, chunked)
+
+
+def setup_network(quantity=400, spacing=2000, seed=2):
+    """
+    Three by three grid of sites, with receivers spread over the square
+    containing it.
+
+    """
+    rng = np.random.default_rng(seed)
+
+    offsets = np.arange(3) * spacing
+    transmitter_coordinates = np.array([(x, y) for x in offsets
+        for y in offsets], dtype=float)
+
+    receivers = ReceiverArrays(
+        ['id_{}'.format(idx) for idx in range(quantity)],
+        rng.uniform(-spacing / 2, 2.5 * spacing, (quantity, 2)),
+        np.full(quantity, PARAMETERS['rx_height']),
+        np.full(quantity, PARAMETERS['rx_gain']),
+        np.full(quantity, PARAMETERS['rx_losses']),
+        np.full(quantity, PARAMETERS['rx_misc_losses']),
+        rng.random(quantity) < 0.5,
+    )
+
+    return transmitter_coordinates, receivers
+
+
+def brute_force_best_server(manager, simulation_parameters):
+    """
+    Site giving each receiver the highest received power, from the path
+    loss of every receiver to every site.
+
+    """
+    receivers = manager.receiver_arrays
+    quantity = len(receivers)
+    sites = len(manager.transmitters)
+
+    shadow_fading = manager.shadow_fading_stream(0.8, '4G', 'rural',
+        simulation_parameters)
+    seed_value = (simulation_parameters['seed_value2_4G'] +
+        simulation_parameters['seed_value2_rural'])
+    indoor_loss = manager.estimate_indoor_loss(receivers.indoor, 0.8, '4G',
+        'rural', simulation_parameters, shadow_fading, np.arange(quantity))
+    propagation_model = manager.get_propagation_model(0.8, 'macro', 'rural',
+        manager.transmitter.ant_height, PARAMETERS['rx_height'], seed_value,
+        simulation_parameters, shadow_fading)
+    antenna_pattern = simulation_parameters.get('antenna_pattern')
+
+    #EIRP and receiver terms are the same for every site of a receiver
+    received_power = np.empty((quantity, sites))
+    for site, (x, y) in enumerate(manager.transmitter_coordinates):
+        dx = receivers.x - x
+        dy = receivers.y - y
+        distance = np.maximum(np.hypot(dx, dy), MIN_DISTANCE)
+        los = distance < simulation_parameters['los_breakpoint_m']
+
+        path_loss, _ = propagation_model.evaluate(distance, los,
+            receivers.indoor, np.arange(quantity) * sites + site,
+            indoor_loss=indoor_loss)
+        received_power[:, site] = -path_loss
+
+        if antenna_pattern is not None:
+            received_power[:, site] += antenna_pattern.gain(
+                link_azimuth(dx, dy))
+
+    return manager.site_ids[received_power.argmax(axis=1)]
+
+
+@pytest.mark.parametrize('extra', [
+    {},
+    STREAM,
+    dict(STREAM, antenna_pattern=SectorAntennaPattern(3, 65, 30, 20)),
+])
+def test_best_server_matches_brute_force(extra):
+
+    #every site is a candidate of every receiver
+    simulation_parameters = dict(PARAMETERS, interference_radius_m=10**6,
+        **extra)
+    transmitter_coordinates, receivers = setup_network()
+
+    manager = NetworkSimulationManager.from_arrays(transmitter_coordinates,
+        'macro', receivers, simulation_parameters)
+    expected = brute_force_best_server(manager, simulation_parameters)
+
+    columns = manager.estimate_link_budget_arrays(
+        *link_budget_args(simulation_parameters))
+
+    assert len(set(expected)) == len(manager.transmitters)
+    np.testing.assert_array_equal(np.asarray(columns['serving_site']),
+        expected)
+
+
+def test_instrumentation_records_stages_and_cache_use(geometry):
+
+    args = link_budget_args(PARAMETERS)
+    manager = build_manager(geometry, PARAMETERS)
+    expected = manager.estimate_link_budget_arrays(*args)
+    manager.clear_cache()
+
+    timings = manager.enable_instrumentation()
+    manager.estimate_link_budget_arrays(*args)
+
+    cached = ('distance', 'indoor_loss', 'path_loss', 'received_power',
+        'interference')
+    for stage in cached:
+        assert timings.counters['cache_miss.{}'.format(stage)] == 1
+        assert timings.stages[stage]['calls'] == 1
+
+    #only the stages after the cache run again for another bandwidth
+    args_20mhz = (args[0], 20) + args[2:]
+    manager.estimate_link_budget_arrays(*args_20mhz)
+
+    for stage in cached:
+        assert timings.counters['cache_hit.{}'.format(stage)] == 1
+        assert timings.stages[stage]['calls'] == 1
+    for stage in ('sinr', 'spectral_efficiency', 'capacity'):
+        assert timings.stages[stage]['calls'] == 2
+
+    assert manager.disable_instrumentation() is timings
+    actual = manager.estimate_link_budget_arrays(*args)
+
+    #nothing more is recorded, and the results do not change
+    assert timings.counters['cache_hit.distance'] == 1
+    for key, value in expected.items():
+        np.testing.assert_array_equal(actual[key], value)
+
+
+def test_cell_loads_fixed_point_by_hand():
+
+    #two cells whose receivers are interfered by the other cell with
+    #their own signal power, so SINR is -log10(load / 100)
+    table = ModulationAndCodingTable(MODULATION_AND_CODING_LUT['4G'])
+    received_power = np.array([21.0, 21.0])
+    raw_interference = 10**received_power[:, None]
+
+    arguments = (received_power, raw_interference, np.array([[1], [0]]),
+        np.array([0, 1]), 1.2, 0, 10, table)
+
+    #full load gives SINR 0, 0.74 bps/Hz and 7.4 Mbps, so a 1.2 Mbps
+    #demand needs 16%, then SINR 0.79 gives 12 Mbps and 10%, which holds
+    cell_load, iterations, converged = solve_cell_loads(*arguments,
+        cell_load=[100, 100])
+
+    np.testing.assert_allclose(cell_load, [10, 10])
+    assert iterations == 3
+    assert converged
+
+    cell_load, iterations, converged = solve_cell_loads(*arguments,
+        cell_load=[100, 100], max_iterations=1)
+
+    np.testing.assert_allclose(cell_load, 100 * 1.2 / 7.4)
+    assert iterations == 1
+    assert not converged
+
+
+def test_cell_loads_converge_within_tolerance():
+
+    rng = np.random.default_rng(0)
+    quantity, cells, k = 2000, 10, 4
+    table = ModulationAndCodingTable(MODULATION_AND_CODING_LUT['4G'])
+
+    serving_cells = rng.integers(0, cells, quantity)
+    interfering_cells = np.stack([(serving_cells + 1 + idx) % cells
+        for idx in range(k)], axis=1)
+    received_power = rng.uniform(-9, -8, quantity)
+    raw_interference = 10**(received_power[:, None] -
+        rng.uniform(0.2, 1.5, (quantity, k)))
+    noise = -10.5
+    demand_mbps = 0.05
+
+    arguments = (received_power, raw_interference, interfering_cells,
+        serving_cells, demand_mbps, noise, 20, table)
+
+    solutions = []
+    for start in (0, 100):
+        cell_load, iterations, converged = solve_cell_loads(*arguments,
+            cell_load=np.full(cells, start), k=k, tolerance=0.01)
+        assert converged
+        assert iterations > 1
+        solutions.append(cell_load)
+
+        #another update stays within the tolerance
+        _, _, sinr = loaded_sinr(received_power, raw_interference,
+            interfering_cells, cell_load, noise, k)
+        capacity_mbps = 20 * table.spectral_efficiency(sinr)
+        with np.errstate(divide='ignore'):
+            share = np.where(capacity_mbps > 0, demand_mbps / capacity_mbps,
+                0)
+        updated = np.minimum(100 * np.bincount(serving_cells, share,
+            minlength=cells), 100)
+        assert np.abs(updated - cell_load).max() <= 0.01
+
+    assert 0 < solutions[0].min() and solutions[0].max() < 100
+    np.testing.assert_allclose(solutions[0], solutions[1], atol=0.05)
+
+
+def test_estimate_cell_loads_matches_the_link_budget():
+
+    simulation_parameters = dict(PARAMETERS)
+    transmitter_coordinates, receivers = setup_network()
+    manager = NetworkSimulationManager.from_arrays(transmitter_coordinates,
+        'macro', receivers, simulation_parameters, site_ids=list('abcdefghi'))
+
+    args = link_budget_args(simulation_parameters)
+    loads = manager.estimate_cell_loads(*args, demand_mbps=0.5)
+
+    assert list(loads['site_id']) == list('abcdefghi')
+    assert loads['converged']
+
+    loaded_parameters = dict(simulation_parameters,
+        cell_load=dict(zip(loads['site_id'], loads['cell_load'])))
+    columns = manager.estimate_link_budget_arrays(
+        *link_budget_args(loaded_parameters))
+
+    #each load is the demand of its receivers over their capacity
+    capacity_mbps = np.asarray(columns['capacity_mbps'])
+    with np.errstate(divide='ignore'):
+        share = np.where(capacity_mbps > 0, 0.5 / capacity_mbps, 0)
+    position = {site_id: idx for idx, site_id in enumerate(manager.site_ids)}
+    serving = np.array([position[site_id]
+        for site_id in columns['serving_site']])
+    expected = np.minimum(100 * np.bincount(serving, share, minlength=9), 100)
+
+    np.testing.assert_allclose(loads['cell_load'], expected, atol=0.1)
+    np.testing.assert_array_equal(columns['cell_load'],
+        loads['cell_load'][serving])
+    assert 'network_load' not in columns
+
+    capped = manager.estimate_cell_loads(*args, demand_mbps=0.5,
+        max_iterations=1)
+    assert capped['iterations'] == 1
+    assert not capped['converged']
+
+
+@pytest.mark.parametrize('extra', [{}, STREAM])
+def test_monte_carlo_applies_cell_loads(geometry, extra):
+
+    simulation_parameters = dict(PARAMETERS, iterations=5, **extra)
+    cells = len(geometry[1]) + 1
+
+    #every cell at the network load gives the same link budget
+    expected = build_manager(geometry, simulation_parameters
+        ).estimate_link_budget_monte_carlo(
+        *link_budget_args(simulation_parameters))
+    full_parameters = dict(simulation_parameters,
+        cell_load=[PARAMETERS['network_load']] * cells)
+    full = build_manager(geometry, full_parameters
+        ).estimate_link_budget_monte_carlo(*link_budget_args(full_parameters))
+
+    for record in expected:
+        record['cell_load'] = record.pop('network_load')
+    assert_records_equal(expected, full)
+
+    #idle interferers leave only noise
+    idle_parameters = dict(simulation_parameters,
+        cell_load=[PARAMETERS['network_load']] + [0] * (cells - 1))
+    with np.errstate(invalid='ignore'):
+        idle = build_manager(geometry, idle_parameters
+            ).estimate_link_budget_monte_carlo(
+            *link_budget_args(idle_parameters))
+
+    for record in idle:
+        assert record['interference_mean'] == -np.inf
+        assert 'network_load' not in record